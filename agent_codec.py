@@ -0,0 +1,273 @@
+"""
+Compact wire format for agent metric samples, shared by the agents and the
+dashboard.
+
+A body is a header (format version, flags, sample count) followed by one
+fixed-size little-endian record per sample: device id, epoch timestamp,
+status code, a bitmask of the fields present, then every field of FIELDS
+at a fixed width. Percentages are float32 and byte and packet counters
+uint64. Fields an agent did not send are zero with their bit cleared, and
+are left out again when decoded. Error texts, the only variable-length
+part, follow the records as (index, length, utf-8) entries. Hostname,
+platform and the uptime string are not sent: the first two never change
+and the dashboard does not store them, and the uptime string is rebuilt
+from uptime_seconds. Version 2 appended the sequence number spooling agents
+give each sample (see agent_spool.py), and version 3 the flag marking a
+delta sample (see agent_delta.py), whose status is left out unless it
+changed. Version 4 widened the field mask to 64 bits for the window
+aggregates agents report (see agent_sampler.py). Older versions are still
+read.
+
+Any body, JSON or compact, may be gzip compressed, and zstd compressed when
+the zstandard package is installed on both ends. Agents ask
+/api/metrics/formats what the dashboard accepts and fall back to plain
+JSON against a dashboard that predates it.
+"""
+
+import gzip
+import json
+import operator
+import struct
+import zlib
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMAT_VERSION = 4
+CONTENT_TYPE = 'application/vnd.netmon.samples'
+JSON_CONTENT_TYPE = 'application/json'
+COMPRESS_MIN_BYTES = 512            # smaller bodies are sent uncompressed
+MAX_DECODED_BYTES = 16 * 1024 * 1024
+MAX_ERROR_BYTES = 1024
+
+STATUSES = ('healthy', 'warning', 'critical', 'error', 'unknown')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+NO_STATUS = 255                     # a delta sample that left status out
+
+# (sample key, struct code); append only, and bump FORMAT_VERSION with an entry in VERSION_FIELDS
+FIELDS = (
+    ('cpu_usage', 'f'),
+    ('memory_usage', 'f'),
+    ('swap_usage', 'f'),
+    ('disk_usage', 'f'),
+    ('load_average', 'f'),
+    ('cpu_temperature', 'f'),
+    ('response_time', 'f'),
+    ('cpu_count', 'H'),
+    ('uptime_seconds', 'I'),
+    ('memory_total', 'Q'),
+    ('memory_available', 'Q'),
+    ('disk_total', 'Q'),
+    ('disk_free', 'Q'),
+    ('disk_read_bytes', 'Q'),
+    ('disk_write_bytes', 'Q'),
+    ('network_bytes_sent', 'Q'),
+    ('network_bytes_recv', 'Q'),
+    ('network_packets_sent', 'Q'),
+    ('network_packets_recv', 'Q'),
+    ('seq', 'Q'),
+    ('delta', 'B'),
+    ('cpu_usage_min', 'f'),
+    ('cpu_usage_max', 'f'),
+    ('cpu_usage_p95', 'f'),
+    ('memory_usage_min', 'f'),
+    ('memory_usage_max', 'f'),
+    ('memory_usage_p95', 'f'),
+    ('network_sent_rate', 'f'),
+    ('network_sent_rate_min', 'f'),
+    ('network_sent_rate_max', 'f'),
+    ('network_sent_rate_p95', 'f'),
+    ('network_recv_rate', 'f'),
+    ('network_recv_rate_min', 'f'),
+    ('network_recv_rate_max', 'f'),
+    ('network_recv_rate_p95', 'f'),
+    ('disk_read_rate', 'f'),
+    ('disk_read_rate_min', 'f'),
+    ('disk_read_rate_max', 'f'),
+    ('disk_read_rate_p95', 'f'),
+    ('disk_write_rate', 'f'),
+    ('disk_write_rate_min', 'f'),
+    ('disk_write_rate_max', 'f'),
+    ('disk_write_rate_p95', 'f'),
+    ('window_samples', 'H'),
+)
+FIELD_NAMES = tuple(name for name, _ in FIELDS)
+FLOAT_FIELDS = frozenset(name for name, code in FIELDS if code == 'f')
+
+HEADER = struct.Struct('<BBI')      # version, flags (unused), sample count
+# How many of FIELDS each format version carries; older versions are still decoded
+VERSION_FIELDS = {1: 19, 2: 20, 3: 21, 4: 44}
+# Width of the present-field mask; 32 bits ran out at version 4
+MASK_CODES = {1: 'I', 2: 'I', 3: 'I', 4: 'Q'}
+RECORDS = {version: struct.Struct('<IdB' + MASK_CODES[version] + ''.join(code for _, code in FIELDS[:count]))
+           for version, count in VERSION_FIELDS.items()}
+RECORD = RECORDS[FORMAT_VERSION]
+ERROR = struct.Struct('<IH')        # sample index, text length
+
+
+class UnsupportedPayload(ValueError):
+    pass
+
+
+def compressions():
+    """Content-Encodings this side can read and write, preferred first"""
+    return ['zstd', 'gzip'] if zstandard else ['gzip']
+
+
+def encode_samples(samples):
+    """Compact body for a list of sample dicts; raises ValueError for values the schema cannot hold"""
+    records = [HEADER.pack(FORMAT_VERSION, 0, len(samples))]
+    errors = []
+    for index, sample in enumerate(samples):
+        mask = 0
+        values = []
+        for bit, (name, code) in enumerate(FIELDS):
+            value = sample.get(name)
+            if value is None:
+                values.append(0)
+                continue
+            mask |= 1 << bit
+            values.append(float(value) if code == 'f' else int(value))
+        timestamp = sample.get('timestamp') or 0.0
+        if 'status' in sample:
+            status = STATUS_CODES.get(sample['status'], STATUS_CODES['unknown'])
+        else:
+            status = NO_STATUS
+        try:
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp).timestamp()
+            records.append(RECORD.pack(int(sample['device_id']), float(timestamp),
+                                       status, mask, *values))
+        except struct.error as e:
+            raise ValueError(f'Sample {index} does not fit the compact format: {e}') from e
+        if sample.get('error'):
+            text = str(sample['error']).encode('utf-8')[:MAX_ERROR_BYTES]
+            errors.append(ERROR.pack(index, len(text)) + text)
+    return b''.join(records + errors)
+
+
+def _decode_plan(mask):
+    """(names, record picker, positions of float values) for the fields present in `mask`"""
+    present = [bit for bit in range(len(FIELDS)) if mask >> bit & 1]
+    # Fields follow device id, timestamp, status and mask in a record
+    indices = [4 + bit for bit in present]
+    if len(indices) > 1:
+        pick = operator.itemgetter(*indices)
+    else:
+        pick = lambda record: tuple(record[index] for index in indices)
+    names = tuple(FIELD_NAMES[bit] for bit in present)
+    float_positions = tuple(position for position, bit in enumerate(present) if FIELDS[bit][1] == 'f')
+    return names, pick, float_positions
+
+
+def decode_samples(body):
+    """List of sample dicts from a compact body"""
+    if len(body) < HEADER.size:
+        raise ValueError('Truncated header')
+    version, _, count = HEADER.unpack_from(body)
+    record_format = RECORDS.get(version)
+    if record_format is None:
+        raise UnsupportedPayload(f'Unsupported format version {version}')
+    end = HEADER.size + count * record_format.size
+    if len(body) < end:
+        raise ValueError('Truncated records')
+
+    samples = []
+    plans = {}
+    for record in record_format.iter_unpack(memoryview(body)[HEADER.size:end]):
+        mask = record[3]
+        plan = plans.get(mask)
+        if plan is None:
+            plan = plans[mask] = _decode_plan(mask)
+        names, pick, float_positions = plan
+        values = list(pick(record))
+        for position in float_positions:
+            values[position] = round(values[position], 3)
+        sample = dict(zip(names, values))
+        sample['device_id'] = record[0]
+        if record[2] != NO_STATUS:
+            sample['status'] = STATUSES[record[2]] if record[2] < len(STATUSES) else 'unknown'
+        if record[1]:
+            sample['timestamp'] = record[1]
+        seconds = sample.get('uptime_seconds')
+        if seconds is not None:
+            sample['uptime'] = f"{seconds // 86400}d {seconds % 86400 // 3600}h {seconds % 3600 // 60}m"
+        samples.append(sample)
+
+    offset = end
+    while offset < len(body):
+        if offset + ERROR.size > len(body):
+            raise ValueError('Truncated error entry')
+        index, length = ERROR.unpack_from(body, offset)
+        offset += ERROR.size
+        if index >= count:
+            raise ValueError('Error entry for a missing sample')
+        samples[index]['error'] = bytes(body[offset:offset + length]).decode('utf-8', 'replace')
+        offset += length
+    return samples
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    if encoding == 'zstd' and zstandard:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    raise UnsupportedPayload(f'Unsupported Content-Encoding {encoding}')
+
+
+def decompress(body, encoding, limit=MAX_DECODED_BYTES):
+    """Undo a Content-Encoding; ValueError for a corrupt body or one that expands beyond `limit` bytes"""
+    if not encoding or encoding == 'identity':
+        return body
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            data = decompressor.decompress(body, limit)
+        except zlib.error as e:
+            raise ValueError(f'Malformed gzip body: {e}') from e
+        if decompressor.unconsumed_tail:
+            raise ValueError(f'Body expands beyond {limit} bytes')
+        return data
+    if encoding == 'zstd' and zstandard:
+        reader = zstandard.ZstdDecompressor().stream_reader(body)
+        chunks = []
+        total = 0
+        while True:
+            try:
+                chunk = reader.read(65536)
+            except zstandard.ZstdError as e:
+                raise ValueError(f'Malformed zstd body: {e}') from e
+            if not chunk:
+                return b''.join(chunks)
+            total += len(chunk)
+            if total > limit:
+                raise ValueError(f'Body expands beyond {limit} bytes')
+            chunks.append(chunk)
+    raise UnsupportedPayload(f'Unsupported Content-Encoding {encoding}')
+
+
+def encode_request(payload, content_type=JSON_CONTENT_TYPE, compression=None):
+    """(body, headers) for a sample dict or {'samples': [...]} in the given format"""
+    if content_type == CONTENT_TYPE:
+        body = encode_samples(payload['samples'] if 'samples' in payload else [payload])
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    headers = {'Content-Type': content_type}
+    if compression and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, compression)
+        headers['Content-Encoding'] = compression
+    return body, headers
+
+
+def decode_request(body, content_type, content_encoding=None):
+    """Decoded request body: whatever the JSON holds, or a list of samples; raises UnsupportedPayload or ValueError"""
+    body = decompress(body, (content_encoding or '').strip().lower())
+    media_type = (content_type or '').split(';', 1)[0].strip().lower()
+    if media_type == CONTENT_TYPE:
+        return decode_samples(body)
+    if media_type == JSON_CONTENT_TYPE or media_type.endswith('+json'):
+        return json.loads(body)
+    raise UnsupportedPayload(f'Unsupported Content-Type {content_type}')
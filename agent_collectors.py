@@ -0,0 +1,194 @@
+"""
+Scheduled metric collection for the monitoring agents.
+
+A sample is assembled from collectors: small functions that each read one
+group of metrics (memory, network counters, disk usage, ...) and return
+sample fields. Every collector has its own interval. Cheap counters run
+for every report, while static facts (CPU count, platform, boot time) and
+slow-changing ones (disk totals) run rarely and their last values are
+reused in between. A collector that fails keeps its previous values,
+marks the sample 'error' and is retried on the next report.
+
+standard_collectors() returns the psutil collectors both agents share;
+each agent adds its own platform collectors (load average on Linux, WMI
+queries on Windows) and hands them all to a CollectorSet. Runs, failures
+and runtime per collector are logged every `stats_interval` seconds
+through the 'netmon.agent' logger, for tuning intervals against agent
+overhead.
+"""
+
+import logging
+import platform
+import time
+from functools import partial
+
+import psutil
+
+STATS_INTERVAL = 600        # seconds between collector runtime lines in the log
+
+logger = logging.getLogger('netmon.agent')
+
+
+class Collector:
+    """One group of metrics with its own interval; its latest values are reused until it is due again"""
+
+    def __init__(self, name, collect, interval):
+        self.name = name
+        self.collect = collect      # () -> dict of sample fields
+        self.interval = interval    # seconds between runs, 0 for every report
+        self.due_at = 0.0
+        self.values = {}
+        self.error = None
+        self.runs = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def run_if_due(self, now):
+        """Collect if the interval has passed; a failure keeps the previous values and retries next report"""
+        if now < self.due_at:
+            return
+        started = time.perf_counter()
+        try:
+            self.values = self.collect()
+            self.error = None
+            self.due_at = now + self.interval
+        except Exception as e:
+            self.failures += 1
+            self.error = str(e)
+            logger.warning("Error collecting %s metrics: %s", self.name, e)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.runs += 1
+        self.total_ms += elapsed
+        self.max_ms = max(self.max_ms, elapsed)
+
+    def get_stats(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'avg_ms': round(self.total_ms / self.runs, 2) if self.runs else 0.0,
+            'max_ms': round(self.max_ms, 2),
+            'total_ms': round(self.total_ms, 1)
+        }
+
+
+def collect_cpu(sampler):
+    """Window aggregates from the background sampler; CPU usage since the last report without one"""
+    window = sampler.report() if sampler is not None else {}
+    if 'cpu_usage' not in window:
+        window['cpu_usage'] = round(psutil.cpu_percent(interval=None), 1)
+    return window
+
+
+def collect_memory():
+    memory = psutil.virtual_memory()
+    swap = psutil.swap_memory()
+    return {
+        'memory_usage': round(memory.percent, 1),
+        'memory_total': memory.total,
+        'memory_available': memory.available,
+        'swap_usage': round(swap.percent, 1) if swap.total > 0 else 0
+    }
+
+
+def collect_network():
+    network = psutil.net_io_counters()
+    return {
+        'network_bytes_sent': network.bytes_sent,
+        'network_bytes_recv': network.bytes_recv,
+        'network_packets_sent': network.packets_sent,
+        'network_packets_recv': network.packets_recv
+    }
+
+
+def collect_disk_io():
+    disk_io = psutil.disk_io_counters()
+    return {
+        'disk_read_bytes': disk_io.read_bytes if disk_io else 0,
+        'disk_write_bytes': disk_io.write_bytes if disk_io else 0
+    }
+
+
+def collect_disk_usage(path):
+    disk = psutil.disk_usage(path)
+    return {
+        'disk_usage': round((disk.used / disk.total) * 100, 1),
+        'disk_total': disk.total,
+        'disk_free': disk.free
+    }
+
+
+def collect_system():
+    """Static facts: CPU count, platform and boot time"""
+    return {'cpu_count': psutil.cpu_count(), 'platform': platform.platform(), 'boot_time': psutil.boot_time()}
+
+
+def standard_collectors(sampler, disk_path):
+    """{name: (collect, interval)} for the collectors every agent runs, in the order their values are merged"""
+    psutil.cpu_percent(interval=None)  # first call only sets the baseline for reports without a window
+    # cpu goes last so the sampler's window average replaces the instantaneous memory_usage
+    return {
+        'system': (collect_system, 3600),
+        'disk_usage': (partial(collect_disk_usage, disk_path), 300),
+        'memory': (collect_memory, 0),
+        'network': (collect_network, 0),
+        'disk_io': (collect_disk_io, 0),
+        'cpu': (partial(collect_cpu, sampler), 0),
+    }
+
+
+class CollectorSet:
+    def __init__(self, collectors, intervals=None, sampler=None, stats_interval=STATS_INTERVAL):
+        intervals = intervals or {}     # name -> seconds, overriding a collector's default
+        self.collectors = [Collector(name, collect, intervals.get(name, interval))
+                           for name, (collect, interval) in collectors.items()]
+        self.sampler = sampler          # its tick cost is logged with the collectors'
+        self.stats_interval = stats_interval
+        self.stats_at = time.monotonic() + stats_interval
+
+    def collect(self):
+        """Sample fields from every collector's latest values, after running the ones that are due"""
+        now = time.monotonic()
+        metrics = {}
+        errors = []
+        for collector in self.collectors:
+            collector.run_if_due(now)
+            metrics.update(collector.values)
+            if collector.error:
+                errors.append(f"{collector.name}: {collector.error}")
+
+        boot_time = metrics.pop('boot_time', None)
+        if boot_time:
+            uptime_seconds = time.time() - boot_time
+            uptime_days = int(uptime_seconds // 86400)
+            uptime_hours = int((uptime_seconds % 86400) // 3600)
+            uptime_minutes = int((uptime_seconds % 3600) // 60)
+            metrics['uptime'] = f"{uptime_days}d {uptime_hours}h {uptime_minutes}m"
+            metrics['uptime_seconds'] = int(uptime_seconds)
+
+        metrics['status'] = 'healthy'
+        if errors:
+            metrics['status'] = 'error'
+            metrics['error'] = '; '.join(errors)
+
+        if now >= self.stats_at:
+            self.log_stats()
+        return metrics
+
+    def get_stats(self):
+        """Runtime of every collector, and of the background sampler"""
+        stats = {collector.name: collector.get_stats() for collector in self.collectors}
+        if self.sampler is not None:
+            stats['sampler'] = self.sampler.get_stats()
+        return stats
+
+    def log_stats(self):
+        self.stats_at = time.monotonic() + self.stats_interval
+        parts = []
+        for name, stats in self.get_stats().items():
+            if name == 'sampler':
+                parts.append(f"sampler {stats['avg_tick_ms']} ms x{stats['ticks']}")
+            else:
+                parts.append(f"{name} {stats['avg_ms']}/{stats['max_ms']} ms x{stats['runs']}")
+        logger.info("Collector runtime (avg/max): %s", ", ".join(parts))
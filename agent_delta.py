@@ -0,0 +1,214 @@
+"""
+Delta and heartbeat reporting for agent samples, shared by the agents and
+the dashboard.
+
+An agent in delta mode sends a full sample when it starts, every
+`full_interval` seconds (which also repairs the dashboard's state if
+samples were lost), when the dashboard asks for one, and whenever a field
+it sent before goes missing. In between it sends deltas: the device
+id, timestamp and sequence number, plus only the fields that moved.
+Fields listed in DEADBANDS are sent once they move at least that far from
+the value last sent, counters included. Every other field is sent when it
+changes, which for hostname, platform, cpu_count, memory_total and
+disk_total is almost never. uptime_seconds is not sent while it keeps
+pace with the clock, because both ends extrapolate it. A delta with
+nothing else in it is a heartbeat.
+
+The dashboard keeps the latest full sample per device and merges each
+delta into it, so everything downstream still sees full samples. When it
+has no state for a device (after a restart, say), it starts from
+whatever `load_base` can give it and asks the agent to send a full sample
+next.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+FULL_INTERVAL = 600         # seconds between unconditional full samples
+UPTIME_SLACK = 60           # seconds uptime may drift from the extrapolation before it is resent
+
+# How far a value must move from the one last sent before it is sent again; a window
+# aggregate such as cpu_usage_p95 uses the band of its series
+DEADBANDS = {
+    'cpu_usage': 2.0,
+    'memory_usage': 1.0,
+    'swap_usage': 1.0,
+    'disk_usage': 0.5,
+    'load_average': 0.2,
+    'cpu_temperature': 1.0,
+    'response_time': 5,
+    'memory_available': 64 * 1024 * 1024,
+    'disk_free': 64 * 1024 * 1024,
+    'disk_read_bytes': 1024 * 1024,
+    'disk_write_bytes': 1024 * 1024,
+    'network_bytes_sent': 1024 * 1024,
+    'network_bytes_recv': 1024 * 1024,
+    'network_packets_sent': 1000,
+    'network_packets_recv': 1000,
+    'network_sent_rate': 64 * 1024,
+    'network_recv_rate': 64 * 1024,
+    'disk_read_rate': 256 * 1024,
+    'disk_write_rate': 256 * 1024,
+}
+AGGREGATE_SUFFIXES = ('_min', '_max', '_p95')
+
+# Sent with every sample, never part of the reported state
+ALWAYS = frozenset(('device_id', 'timestamp', 'seq', 'delta'))
+# Rebuilt by the dashboard from uptime_seconds
+DERIVED = frozenset(('uptime',))
+
+
+def epoch(timestamp):
+    """Epoch seconds for an ISO 8601 or epoch timestamp; now if there is none"""
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool) and timestamp > 0:
+        return float(timestamp)
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def format_uptime(seconds):
+    return f"{seconds // 86400}d {seconds % 86400 // 3600}h {seconds % 3600 // 60}m"
+
+
+class DeltaEncoder:
+    """Agent side: turns full samples into deltas against what the dashboard already has"""
+
+    def __init__(self, deadbands=None, full_interval=FULL_INTERVAL):
+        self.deadbands = dict(DEADBANDS if deadbands is None else deadbands)
+        for name in list(self.deadbands):
+            for suffix in AGGREGATE_SUFFIXES:
+                self.deadbands.setdefault(name + suffix, self.deadbands[name])
+        self.full_interval = full_interval
+        self._sent = None           # state the dashboard holds, as of the last sample sent
+        self._uptime = None         # (uptime_seconds, epoch) last sent
+        self._full_at = 0.0
+        self.stats = {'full': 0, 'deltas': 0, 'heartbeats': 0}
+
+    def reset(self):
+        """Send a full sample next"""
+        self._sent = None
+
+    def encode(self, sample):
+        """What to send for a full sample: the sample itself, or a delta marked with 'delta': 1"""
+        now = epoch(sample.get('timestamp'))
+        state = {key: value for key, value in sample.items() if key not in ALWAYS and key not in DERIVED}
+        if (self._sent is None or now - self._full_at >= self.full_interval
+                or any(key not in state for key in self._sent)):
+            self._sent = state
+            self._uptime = (state['uptime_seconds'], now) if 'uptime_seconds' in state else None
+            self._full_at = now
+            self.stats['full'] += 1
+            return sample
+
+        delta = {key: sample[key] for key in ALWAYS if key in sample}
+        delta['delta'] = 1
+        for key, value in state.items():
+            if key == 'uptime_seconds' and self._uptime is not None:
+                expected = self._uptime[0] + (now - self._uptime[1])
+                if abs(value - expected) > UPTIME_SLACK:
+                    delta[key] = value
+                    self._uptime = (value, now)
+                continue
+            previous = self._sent.get(key)
+            band = self.deadbands.get(key)
+            if band is not None and previous is not None and value is not None:
+                moved = abs(value - previous) >= band
+            else:
+                moved = value != previous
+            if moved:
+                delta[key] = value
+                self._sent[key] = value
+        self.stats['heartbeats' if len(delta) == len(sample.keys() & ALWAYS) + 1 else 'deltas'] += 1
+        return delta
+
+
+class DeltaState:
+    """Dashboard side: the latest full sample per device, rebuilt from deltas"""
+
+    def __init__(self, load_base):
+        self.load_base = load_base      # (device_id) -> full sample dict, or None if nothing is known
+        self._states = {}               # device_id -> [sample, (uptime_seconds, epoch) or None, last seq]
+        self._lock = threading.Lock()
+        self.stats = {'full': 0, 'deltas': 0, 'resyncs': 0}
+
+    def apply(self, device_id, sample, pending=None):
+        """
+        (full sample, keys whose value changed, resync) for a received sample, full or delta.
+
+        Given a `pending` dict, the new state is kept there, on top of what is already in it,
+        until commit(pending); a sample the caller then fails to queue leaves no trace.
+        """
+        base, loaded = None, False
+        while True:
+            result = self._apply(device_id, sample, pending, base, loaded)
+            if result is not None:
+                return result
+            # First delta from a device with no state: read its base from storage without holding
+            # the lock, so other devices' samples are not queued behind the query
+            base, loaded = self.load_base(device_id), True
+
+    def _apply(self, device_id, sample, pending, base, loaded):
+        """apply() under the lock; None if the device needs a base from load_base first"""
+        now = epoch(sample.get('timestamp'))
+        seq = sample.get('seq')
+        with self._lock:
+            target = self._states if pending is None else pending
+            entry = target.get(device_id) if device_id in target else self._states.get(device_id)
+            if entry is not None and seq is not None and entry[2] is not None and seq <= entry[2]:
+                # Resent; merging it again would roll newer values back
+                return dict(entry[0], **{key: sample[key] for key in ALWAYS if key in sample}), set(), False
+            if not sample.get('delta'):
+                state = {key: value for key, value in sample.items() if key not in ALWAYS}
+                uptime = (state['uptime_seconds'], now) if 'uptime_seconds' in state else None
+                changed = state.keys() if entry is None else {
+                    key for key, value in state.items() if entry[0].get(key) != value}
+                target[device_id] = [state, uptime, seq]
+                self.stats['full'] += 1
+                return sample, changed, False
+
+            resync = False
+            if entry is None:
+                if not loaded:
+                    return None
+                # Another request may have installed a state meanwhile; then that one was used above
+                entry = target[device_id] = [base or {}, None, None]
+                resync = True
+                self.stats['resyncs'] += 1
+            elif pending is not None and device_id not in pending:
+                # Copy on first write so the current state stays untouched until commit()
+                entry = target[device_id] = [dict(entry[0]), entry[1], entry[2]]
+            state, uptime, last_seq = entry
+
+            changed = set()
+            for key, value in sample.items():
+                if key not in ALWAYS and state.get(key) != value:
+                    state[key] = value
+                    changed.add(key)
+            if 'uptime_seconds' in sample:
+                uptime = (sample['uptime_seconds'], now)
+            elif uptime is not None:
+                state['uptime_seconds'] = int(uptime[0] + (now - uptime[1]))
+            if 'uptime_seconds' in state:
+                state['uptime'] = format_uptime(state['uptime_seconds'])
+            entry[1] = uptime
+            entry[2] = seq if seq is not None else last_seq
+            self.stats['deltas'] += 1
+            return dict(state, **{key: sample[key] for key in ALWAYS if key in sample}), changed, resync
+
+    def commit(self, pending):
+        """Make the states apply() kept in `pending` current"""
+        with self._lock:
+            self._states.update(pending)
+
+    def forget(self, device_id):
+        with self._lock:
+            self._states.pop(device_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['devices'] = len(self._states)
+        return stats
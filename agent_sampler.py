@@ -0,0 +1,184 @@
+"""
+Background sampling for the monitoring agents.
+
+A daemon thread samples CPU, memory, network and disk I/O every
+`interval` seconds (1 s by default) between reports. Nothing blocks: CPU
+usage is computed from the change in psutil.cpu_times() since the
+previous tick, and network and disk rates from the change in their byte
+counters, so a tick costs a few counter reads.
+
+Each series is folded into a window that keeps min, max, sum, count and a
+histogram with fixed buckets. Percentages use half-point buckets and byte
+rates eight buckets per doubling, so p95 is accurate to the width of one
+bucket and memory does not grow with the report interval or the sampling
+rate. report() returns the aggregates since the previous report and opens
+a new window:
+
+    cpu_usage, cpu_usage_min, cpu_usage_max, cpu_usage_p95
+    memory_usage, memory_usage_min, memory_usage_max, memory_usage_p95
+    network_sent_rate, network_recv_rate, disk_read_rate, disk_write_rate
+        (bytes per second), each with _min, _max and _p95
+    window_samples
+
+The plain names are window averages.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+import psutil
+
+PERCENT_EDGES = tuple(0.5 * i for i in range(1, 201))
+RATE_EDGES = tuple(2 ** (i / 8) for i in range(8 * 44))     # 1 B/s up to 16 TiB/s
+
+# (series, bucket upper bounds)
+SERIES = (
+    ('cpu_usage', PERCENT_EDGES),
+    ('memory_usage', PERCENT_EDGES),
+    ('network_sent_rate', RATE_EDGES),
+    ('network_recv_rate', RATE_EDGES),
+    ('disk_read_rate', RATE_EDGES),
+    ('disk_write_rate', RATE_EDGES),
+)
+
+
+class _Window:
+    __slots__ = ('edges', 'counts', 'count', 'total', 'low', 'high')
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.counts = array('I', bytes(4 * (len(edges) + 1)))
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.low = float('inf')
+        self.high = float('-inf')
+
+    def add(self, value):
+        self.counts[bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.low:
+            self.low = value
+        if value > self.high:
+            self.high = value
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile, kept within min and max"""
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = self.edges[index] if index < len(self.edges) else self.high
+                return min(max(bound, self.low), self.high)
+        return self.high
+
+
+def _cpu_busy(times):
+    """(busy, total) CPU seconds from a psutil.cpu_times() result"""
+    total = sum(times)
+    # Linux also counts guest time inside user and nice
+    total -= getattr(times, 'guest', 0) + getattr(times, 'guest_nice', 0)
+    idle = times.idle + getattr(times, 'iowait', 0)
+    return total - idle, total
+
+
+class MetricSampler:
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._windows = {name: _Window(edges) for name, edges in SERIES}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._previous = None       # (monotonic, cpu busy, cpu total, net counters, disk counters)
+        self.stats = {'ticks': 0, 'missed_ticks': 0, 'total_tick_ms': 0.0}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._previous = self._read()
+        self._thread = threading.Thread(target=self._run, name='metric-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval * 2)
+
+    def _read(self):
+        busy, total = _cpu_busy(psutil.cpu_times())
+        return time.monotonic(), busy, total, psutil.net_io_counters(), psutil.disk_io_counters()
+
+    def _run(self):
+        next_tick = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_tick - time.monotonic())):
+            started = time.perf_counter()
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Sampler error: {e}")
+            self.stats['total_tick_ms'] += (time.perf_counter() - started) * 1000
+            next_tick += self.interval
+            now = time.monotonic()
+            if next_tick < now:
+                # Overran (or the host was suspended): skip the ticks already missed
+                missed = int((now - next_tick) / self.interval) + 1
+                self.stats['missed_ticks'] += missed
+                next_tick += missed * self.interval
+
+    def sample(self):
+        """Take one tick: usage and rates since the previous one"""
+        current = self._read()
+        memory = psutil.virtual_memory().percent
+        previous, self._previous = self._previous, current
+        now, busy, total, net, disk = current
+        then, busy_before, total_before, net_before, disk_before = previous
+        elapsed = now - then
+        values = [('memory_usage', memory)]
+        if total > total_before:
+            values.append(('cpu_usage', min(100.0, max(0.0, (busy - busy_before) / (total - total_before) * 100))))
+        if elapsed > 0:
+            # A counter that went backwards was reset (interface or disk re-added); skip that tick
+            for name, counters, before, field in (('network_sent_rate', net, net_before, 'bytes_sent'),
+                                                  ('network_recv_rate', net, net_before, 'bytes_recv'),
+                                                  ('disk_read_rate', disk, disk_before, 'read_bytes'),
+                                                  ('disk_write_rate', disk, disk_before, 'write_bytes')):
+                if counters is not None and before is not None:
+                    moved = getattr(counters, field) - getattr(before, field)
+                    if moved >= 0:
+                        values.append((name, moved / elapsed))
+        with self._lock:
+            for name, value in values:
+                self._windows[name].add(value)
+            self.stats['ticks'] += 1
+
+    def report(self):
+        """Aggregates for every series sampled since the last report, then start a new window"""
+        result = {}
+        with self._lock:
+            samples = 0
+            for name, window in self._windows.items():
+                if window.count:
+                    result[name] = round(window.total / window.count, 2)
+                    result[f'{name}_min'] = round(window.low, 2)
+                    result[f'{name}_max'] = round(window.high, 2)
+                    result[f'{name}_p95'] = round(window.percentile(95), 2)
+                    samples = max(samples, window.count)
+                window.reset()
+        if samples:
+            result['window_samples'] = samples
+        return result
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['avg_tick_ms'] = round(stats['total_tick_ms'] / stats['ticks'], 3) if stats['ticks'] else 0.0
+        stats['total_tick_ms'] = round(stats['total_tick_ms'], 1)
+        return stats
@@ -0,0 +1,226 @@
+"""
+Durable on-disk spool for agent metric samples.
+
+Every sample is appended to the spool before it is sent, so a dashboard
+outage leaves a backlog to replay instead of a gap. Samples are stored as
+JSON lines in segment files of about `segment_bytes` each, named after the
+sequence number of their first sample. Appends only ever go to the newest
+segment and are fsynced, and a line torn by a crash is cut off when the
+spool is opened again.
+
+Each sample gets a sequence number on append that keeps increasing for the
+life of the spool directory; a fresh spool starts from the clock in
+milliseconds, so a reinstalled agent still counts upwards. The dashboard
+keeps the highest number it has stored per device and drops anything at or
+below it, which makes resending after a lost response harmless.
+
+The read position (segment, byte offset, last acknowledged sequence) lives
+in a small state file replaced atomically on every acknowledgement.
+Segments behind it are deleted. When the spool grows past `max_bytes` the
+oldest segments are dropped whether sent or not, and the samples lost that
+way are counted as evicted.
+"""
+
+import json
+import os
+import threading
+import time
+
+STATE_FILE = 'position.json'
+SEGMENT_SUFFIX = '.log'
+
+
+class Spool:
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024, fsync=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._segments = []         # [(first seq, path, size)], oldest first
+        self._tail = None           # open file of the newest segment, None until the next append
+        self._read_segment = 0      # first seq of the segment holding the read position
+        self._read_offset = 0
+        self._acked_seq = 0
+        self._next_seq = 0
+        self._pending = 0
+        self._peeked = []           # (segment first seq, offset after the line) for each peeked sample
+        self.stats = {'appended': 0, 'acked': 0, 'evicted': 0, 'corrupt': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                path = os.path.join(self.directory, name)
+                self._segments.append([int(name[:-len(SEGMENT_SUFFIX)]), path, os.path.getsize(path)])
+        self._segments.sort()
+
+        try:
+            with open(os.path.join(self.directory, STATE_FILE)) as f:
+                state = json.load(f)
+            self._read_segment, self._read_offset, self._acked_seq = state['segment'], state['offset'], state['seq']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        last_seq = self._acked_seq
+        if self._segments:
+            last_seq = max(last_seq, self._repair_tail())
+            if not any(first == self._read_segment for first, _, _ in self._segments):
+                # The read segment was evicted or never recorded: resume at the oldest one left
+                self._read_segment, self._read_offset = self._segments[0][0], 0
+        self._next_seq = last_seq + 1 if last_seq else int(time.time() * 1000)
+        self._pending = self._count_from(self._read_segment, self._read_offset)
+
+    def _repair_tail(self):
+        """Cut a torn last line off the newest segment; returns the seq of its last whole sample"""
+        segment = self._segments[-1]
+        with open(segment[1], 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                print(f"Spool: dropping a torn sample at the end of {segment[1]}")
+                f.truncate(end)
+                segment[2] = end
+        for line in reversed(data[:end].splitlines()):
+            try:
+                return int(json.loads(line)['seq'])
+            except (ValueError, KeyError, TypeError):
+                continue
+        return segment[0] - 1
+
+    def _count_from(self, first_seq, offset):
+        """Samples stored from a position to the end of the spool"""
+        count = 0
+        for first, path, _ in self._segments:
+            if first < first_seq:
+                continue
+            with open(path, 'rb') as f:
+                if first == first_seq:
+                    f.seek(offset)
+                count += f.read().count(b'\n')
+        return count
+
+    def append(self, sample):
+        """Assign the next sequence number to a sample and store it durably; returns the number"""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            sample['seq'] = seq
+            line = (json.dumps(sample, separators=(',', ':')) + '\n').encode('utf-8')
+
+            if self._tail is None:
+                path = os.path.join(self.directory, f'{seq:020d}{SEGMENT_SUFFIX}')
+                self._tail = open(path, 'ab')
+                self._segments.append([seq, path, 0])
+                if self._pending == 0:
+                    self._read_segment, self._read_offset = seq, 0
+            self._tail.write(line)
+            self._tail.flush()
+            if self.fsync:
+                os.fsync(self._tail.fileno())
+            self._segments[-1][2] += len(line)
+            self._pending += 1
+            self.stats['appended'] += 1
+
+            if self._segments[-1][2] >= self.segment_bytes:
+                self._tail.close()
+                self._tail = None
+            self._evict()
+            return seq
+
+    def _evict(self):
+        """Drop the oldest segments until the spool fits in max_bytes"""
+        while len(self._segments) > 1 and sum(size for _, _, size in self._segments) > self.max_bytes:
+            first, path, _ = self._segments[0]
+            if first >= self._read_segment:
+                with open(path, 'rb') as f:
+                    f.seek(self._read_offset if first == self._read_segment else 0)
+                    lost = f.read().count(b'\n')
+                self._pending -= lost
+                self.stats['evicted'] += lost
+                if first == self._read_segment:
+                    self._read_segment, self._read_offset = self._segments[1][0], 0
+                    self._save_position()
+            self._segments.pop(0)
+            self._peeked = []
+            os.remove(path)
+
+    def peek(self, limit):
+        """(samples, entries) for up to `limit` of the oldest unacknowledged entries; ack `entries` once sent"""
+        with self._lock:
+            samples = []
+            self._peeked = []
+            for first, path, _ in self._segments:
+                if first < self._read_segment or len(samples) >= limit:
+                    continue
+                offset = self._read_offset if first == self._read_segment else 0
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break
+                        offset += len(line)
+                        try:
+                            sample = json.loads(line)
+                        except ValueError:
+                            # Still consumed by the next ack, so one bad line cannot wedge the spool
+                            self.stats['corrupt'] += 1
+                            sample = None
+                        samples.append(sample)
+                        self._peeked.append((first, offset))
+                        if len(samples) >= limit:
+                            break
+            return [sample for sample in samples if sample is not None], len(samples)
+
+    def ack(self, count):
+        """Mark the first `count` entries returned by the last peek as delivered"""
+        with self._lock:
+            if count <= 0 or not self._peeked:
+                return
+            count = min(count, len(self._peeked))
+            self._read_segment, self._read_offset = self._peeked[count - 1]
+            del self._peeked[:count]
+            self._pending -= count
+            self.stats['acked'] += count
+            self._save_position()
+
+            # Fully read segments are no longer needed; the newest one stays to carry the sequence
+            while len(self._segments) > 1 and self._segments[0][0] < self._read_segment:
+                os.remove(self._segments.pop(0)[1])
+            if self._read_offset >= self._segments[0][2] and len(self._segments) > 1:
+                os.remove(self._segments.pop(0)[1])
+                self._read_segment, self._read_offset = self._segments[0][0], 0
+                self._save_position()
+
+    def _save_position(self):
+        self._acked_seq = max(self._acked_seq, self._next_seq - 1 - self._pending)
+        state = {'segment': self._read_segment, 'offset': self._read_offset, 'seq': self._acked_seq}
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def pending(self):
+        """Samples stored but not yet acknowledged"""
+        return self._pending
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['pending'] = self._pending
+            stats['segments'] = len(self._segments)
+            stats['bytes'] = sum(size for _, _, size in self._segments)
+            stats['next_seq'] = self._next_seq
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._tail is not None:
+                self._tail.close()
+                self._tail = None
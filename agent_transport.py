@@ -0,0 +1,250 @@
+"""
+Delivery of agent samples to the dashboard, shared by the agents.
+
+DashboardClient is the agents' base class. It asks the dashboard which
+body encodings and sample modes it accepts, encodes samples with
+agent_codec, turns them into deltas with agent_delta, and writes each one
+to the agent_spool spool before sending it. The spool is replayed oldest
+first in batches of `replay_batch`, paced to `replay_rate` samples per
+second after an outage and started at a random point so a recovering
+fleet spreads out. Failed sends back off for the dashboard's Retry-After,
+or exponentially from the report interval. Each of those modules is
+optional: without agent_codec samples go as plain JSON, without
+agent_delta every sample is sent in full, and without agent_spool each
+sample is sent once, or buffered in memory (up to `max_pending`) when
+`batch_size` is above 1.
+"""
+
+import json
+import os
+import random
+import time
+
+import requests
+
+try:
+    import agent_codec
+except ImportError:
+    agent_codec = None  # installed without agent_codec.py: send plain JSON
+
+try:
+    import agent_spool
+except ImportError:
+    agent_spool = None  # installed without agent_spool.py: samples are lost while the dashboard is down
+
+try:
+    import agent_delta
+except ImportError:
+    agent_delta = None  # installed without agent_delta.py: every sample is sent in full
+
+
+class DashboardClient:
+    def __init__(self, dashboard_url, device_id, api_key=None, batch_size=1, spool_dir=None, report_mode='delta'):
+        self.dashboard_url = dashboard_url.rstrip('/')
+        self.device_id = device_id
+        self.api_key = api_key
+        self.interval = 30  # seconds between reports; also the backoff base
+        self.batch_size = max(1, int(batch_size))  # samples per flush, 1 = send immediately
+        self.max_pending = self.batch_size * 10  # cap on samples held while the dashboard is down
+        self.pending = []
+        self.content_type = None  # body format agreed with the dashboard, None until asked
+        self.compression = None
+        self.delta = None  # sends only what moved, once the dashboard says it can rebuild the rest
+        if agent_delta is not None and report_mode == 'delta':
+            self.delta = agent_delta.DeltaEncoder()
+        self.delta_supported = False
+        self.spool = None  # every sample is written here first and replayed until acknowledged
+        if agent_spool is not None:
+            self.spool = agent_spool.Spool(spool_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool'))
+        self.replay_batch = 500  # samples per request while working off a backlog
+        self.replay_rate = 50  # samples per second while replaying, so a recovering fleet does not swamp the dashboard
+        self.send_at = 0.0  # monotonic time before which nothing is sent
+        self.failures = 0  # consecutive failed sends, for backoff
+        self.replaying = False
+
+    def _headers(self):
+        headers = {}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    def negotiate_format(self):
+        """Ask the dashboard which body encodings it accepts; plain JSON if it cannot say"""
+        if agent_codec is None:
+            self.content_type, self.compression = 'application/json', None
+            return
+        try:
+            response = requests.get(f"{self.dashboard_url}/api/metrics/formats", headers=self._headers(), timeout=10)
+        except requests.exceptions.RequestException:
+            return  # ask again on the next send
+        self.content_type, self.compression = agent_codec.JSON_CONTENT_TYPE, None
+        self.delta_supported = False
+        if response.status_code != 200:
+            return
+        try:
+            formats = response.json()
+        except ValueError:
+            return
+        versions = formats.get('compact_versions', [formats.get('compact_version')])
+        if agent_codec.CONTENT_TYPE in formats.get('content_types', []) and agent_codec.FORMAT_VERSION in versions:
+            self.content_type = agent_codec.CONTENT_TYPE
+        accepted = formats.get('content_encodings', [])
+        self.compression = next((e for e in agent_codec.compressions() if e in accepted), None)
+        self.delta_supported = 'delta' in formats.get('sample_modes', [])
+
+    def _post(self, path, payload, timeout):
+        """POST a sample or {'samples': [...]} in the negotiated encoding"""
+        if self.content_type is None:
+            self.negotiate_format()
+        content_type = self.content_type or 'application/json'
+        if agent_codec is None:
+            body, headers = json.dumps(payload).encode('utf-8'), {'Content-Type': 'application/json'}
+        else:
+            try:
+                body, headers = agent_codec.encode_request(payload, content_type, self.compression)
+            except ValueError:
+                # A value the compact schema cannot hold; this one goes as JSON
+                content_type = agent_codec.JSON_CONTENT_TYPE
+                body, headers = agent_codec.encode_request(payload, content_type, self.compression)
+        headers.update(self._headers())
+        response = requests.post(f"{self.dashboard_url}{path}", data=body, headers=headers, timeout=timeout)
+        if response.status_code == 415 and content_type != 'application/json':
+            # The dashboard changed under us; renegotiate next time and resend as plain JSON
+            self.content_type = None
+            headers = dict(self._headers(), **{'Content-Type': 'application/json'})
+            response = requests.post(f"{self.dashboard_url}{path}", data=json.dumps(payload).encode('utf-8'),
+                                     headers=headers, timeout=timeout)
+        return response
+
+    def send_metrics(self, metrics):
+        """Send metrics to dashboard, buffering them when batching is enabled"""
+        if self.delta is not None:
+            if self.content_type is None and time.monotonic() >= self.send_at:
+                self.negotiate_format()
+            if self.delta_supported:
+                metrics = self.delta.encode(metrics)
+
+        if self.spool is not None:
+            self.spool.append(metrics)
+            return self.drain_spool()
+
+        if self.batch_size > 1:
+            self.pending.append(metrics)
+            if len(self.pending) > self.max_pending:
+                del self.pending[:len(self.pending) - self.max_pending]
+            if len(self.pending) >= self.batch_size:
+                return self.flush_metrics()
+            return True
+
+        try:
+            response = self._post("/api/metrics/submit", metrics, timeout=10)
+
+            if response.status_code in (200, 202):
+                self._check_resync(response)
+                print(f"✓ Metrics sent successfully at {metrics['timestamp']}")
+                return True
+            else:
+                print(f"✗ Failed to send metrics: {response.status_code} - {response.text}")
+                return False
+
+        except requests.exceptions.RequestException as e:
+            print(f"✗ Network error sending metrics: {e}")
+            return False
+        except Exception as e:
+            print(f"✗ Error sending metrics: {e}")
+            return False
+
+    def flush_metrics(self):
+        """Send all buffered samples in a single batch request"""
+        if not self.pending:
+            return True
+
+        try:
+            response = self._post("/api/metrics/submit/batch", {'samples': self.pending}, timeout=30)
+
+            if response.status_code in (200, 202):
+                result = response.json()
+                self._check_resync(response)
+                print(f"✓ Flushed {result.get('accepted', 0)}/{len(self.pending)} samples")
+                self.pending = []
+                return True
+            else:
+                print(f"✗ Failed to flush metrics: {response.status_code} - {response.text}")
+                return False
+
+        except requests.exceptions.RequestException as e:
+            print(f"✗ Network error flushing metrics: {e}")
+            return False
+        except Exception as e:
+            print(f"✗ Error flushing metrics: {e}")
+            return False
+
+    def drain_spool(self):
+        """Send spooled samples oldest first; False while sends are held off after a failure"""
+        while self.spool.pending() >= self.batch_size:
+            if time.monotonic() < self.send_at:
+                return False
+            # More than one batch waiting means we are catching up after an outage
+            backlog = self.spool.pending() > self.batch_size
+            if backlog and not self.replaying:
+                # Start at a random point of the first batch's slot so a recovering fleet spreads out
+                self.replaying = True
+                self.send_at = time.monotonic() + random.uniform(0, self.replay_batch / self.replay_rate)
+                continue
+            self.replaying = backlog
+            samples, entries = self.spool.peek(self.replay_batch if backlog else self.batch_size)
+            if not samples:
+                self.spool.ack(entries)  # only unreadable lines
+                continue
+
+            try:
+                response = self._post("/api/metrics/submit/batch", {'samples': samples}, timeout=30)
+            except requests.exceptions.RequestException as e:
+                print(f"✗ Network error sending metrics, {self.spool.pending()} spooled: {e}")
+                self._back_off()
+                return False
+
+            if response.status_code in (200, 202):
+                # Samples the dashboard refused or already had are acknowledged too
+                self.spool.ack(entries)
+                self.failures = 0
+                self._check_resync(response)
+                try:
+                    result = response.json()
+                except ValueError:
+                    result = {}
+                print(f"✓ Sent {result.get('accepted', len(samples))}/{len(samples)} samples"
+                      f" ({result.get('duplicates', 0)} already stored), {self.spool.pending()} still spooled")
+                if backlog:
+                    self.send_at = time.monotonic() + len(samples) / self.replay_rate
+            elif response.status_code == 413 and len(samples) > 1:
+                self.replay_batch = max(1, len(samples) // 2)
+            elif response.status_code == 400:
+                # The dashboard will never take this batch; drop it instead of retrying forever
+                print(f"✗ Dropping {len(samples)} spooled samples: {response.text}")
+                self.spool.ack(entries)
+            else:
+                print(f"✗ Failed to send metrics: {response.status_code} - {response.text}")
+                self._back_off(response.headers.get('Retry-After'))
+                return False
+        return True
+
+    def _check_resync(self, response):
+        """Send a full sample next if the dashboard lost track of this device's state"""
+        if self.delta is None:
+            return
+        try:
+            resync = response.json().get('resync')
+        except (ValueError, AttributeError):
+            return
+        if resync:
+            self.delta.reset()
+
+    def _back_off(self, retry_after=None):
+        """Hold off sending for the dashboard's Retry-After, else exponentially; jittered so agents spread out"""
+        self.failures += 1
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(self.interval * 2 ** (self.failures - 1), 600)
+        self.send_at = time.monotonic() + delay * random.uniform(1, 1.5)
@@ -1,28 +1,99 @@
-from flask import Flask, render_template, jsonify, request
-import requests
+from flask import Flask, render_template, jsonify, request, g
 import json
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import random
 import sqlite3
 import os
-import subprocess
-import paramiko
-import socket
-from concurrent.futures import ThreadPoolExecutor
 import threading
+import atexit
+import hashlib
+import gzip
+from db import Database
+from ingest import IngestQueue, SequenceFilter
+from rollup import RollupEngine, RAW, ROLLUP_METRICS
+import downsample
+from recent_store import RecentStore
+from ssh_pool import SSHPool
+from remote_collector import RemoteCollector
+from poller import FleetPoller
+from discovery import DiscoveryEngine
+from reachability import ReachabilityProber
+from vbox_inventory import VBoxInventory
+from rollout import RolloutManager
+from live_stream import LiveHub
+from change_log import ChangeLog
+from prometheus_query import PrometheusClient
+from metrics_exporter import MetricsExporter
+from prometheus_client import CONTENT_TYPE_LATEST
+import agent_codec
+import agent_delta
 
 app = Flask(__name__)
 
 # Configuration
-PROMETHEUS_URL = "http://localhost:9090"
+PROMETHEUS_URL = os.environ.get('PROMETHEUS_URL', "http://localhost:9090")
 GRAFANA_URL = "http://localhost:3000"
 DATABASE_PATH = "devices.db"
 
+# Pooled WAL-mode connections shared by every route; see db.py
+db = Database(DATABASE_PATH)
+
+# Long-lived SSH transports for agentless VM polling; see ssh_pool.py
+ssh_pool = SSHPool()
+remote_collector = RemoteCollector(ssh_pool)
+
+# Folds history into 1m/5m/1h aggregates and expires old rows; see rollup.py
+rollups = RollupEngine(db)
+
+# Asyncio CIDR sweeps run as background jobs; see discovery.py
+discovery = DiscoveryEngine()
+
+# Every enabled device is probed concurrently each cycle; see reachability.py
+REACHABILITY_INTERVAL = 15
+
+def load_probe_targets():
+    """Enabled devices and the port used when ICMP is not available"""
+    rows = db.query('SELECT id, ip_address, port FROM devices WHERE enabled = 1')
+    return [{'id': row[0], 'ip_address': row[1], 'port': row[2] or 22} for row in rows]
+
+reachability = ReachabilityProber(load_probe_targets, interval=REACHABILITY_INTERVAL)
+
+# VirtualBox inventory is served from a cache refreshed in the background; see vbox_inventory.py
+VBOXMANAGE = os.environ.get('VBOXMANAGE', 'VBoxManage')
+vbox_inventory = VBoxInventory(VBOXMANAGE)
+
 def init_db():
     """Initialize the devices database"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    with db.writer() as conn:
+        init_schema(conn)
+        rollups.init_schema(conn)
+        rollouts.init_schema(conn)
+        sequences.load(conn.execute('SELECT device_id, last_seq FROM agent_sequences'))
+
+# Bumped whenever init_schema gains a migration; stored in PRAGMA user_version
+SCHEMA_VERSION = 3
+
+METRIC_COLUMNS = '''
+    status TEXT NOT NULL,
+    response_time INTEGER,
+    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    cpu_usage REAL,
+    memory_usage REAL,
+    disk_usage REAL,
+    network_in REAL,
+    network_out REAL,
+    network_in_rate REAL,
+    network_out_rate REAL,
+    uptime TEXT,
+    load_average REAL,
+    seq INTEGER
+'''
+
+def init_schema(conn):
+    """Create tables on the given connection and migrate older databases"""
     cursor = conn.cursor()
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
     
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS devices (
@@ -46,43 +117,111 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
+    if version < 1:
+        migrate_metrics_history(cursor)
+    
+    # Append-only sample history; rowid keys avoid the sqlite_sequence
+    # bookkeeping AUTOINCREMENT adds to every insert
+    cursor.execute(f'''
         CREATE TABLE IF NOT EXISTS device_metrics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id INTEGER,
-            status TEXT NOT NULL,
-            response_time INTEGER,
-            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            cpu_usage REAL,
-            memory_usage REAL,
-            disk_usage REAL,
-            network_in REAL,
-            network_out REAL,
-            uptime TEXT,
-            load_average REAL,
+            id INTEGER PRIMARY KEY,
+            device_id INTEGER NOT NULL,
+            {METRIC_COLUMNS},
+            FOREIGN KEY (device_id) REFERENCES devices (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_device_metrics_device_time
+        ON device_metrics (device_id, last_seen)
+    ''')
+    
+    # One row per device holding its most recent sample
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS device_latest (
+            device_id INTEGER PRIMARY KEY,
+            {METRIC_COLUMNS},
             FOREIGN KEY (device_id) REFERENCES devices (id)
         )
     ''')
     
+    if version < 1:
+        cursor.execute('''
+            INSERT OR REPLACE INTO device_latest
+            (device_id, status, response_time, cpu_usage, memory_usage, disk_usage,
+             network_in, network_out, uptime, load_average, last_seen)
+            SELECT device_id, status, response_time, cpu_usage, memory_usage, disk_usage,
+                   network_in, network_out, uptime, load_average, MAX(last_seen)
+            FROM device_metrics
+            GROUP BY device_id
+        ''')
+    
+    if version < 2:
+        add_column(cursor, 'device_metrics', 'seq', 'INTEGER')
+        add_column(cursor, 'device_latest', 'seq', 'INTEGER')
+    
+    # network_in/out hold cumulative byte counters; rates in bytes per second get their own columns
+    if version < 3:
+        for table in ('device_metrics', 'device_latest'):
+            add_column(cursor, table, 'network_in_rate', 'REAL')
+            add_column(cursor, table, 'network_out_rate', 'REAL')
+    
+    # Highest sample sequence number stored per spooling agent; see agent_spool.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agent_sequences (
+            device_id INTEGER PRIMARY KEY,
+            last_seq INTEGER NOT NULL
+        )
+    ''')
+    
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+def add_column(cursor, table, column, definition):
+    """ALTER TABLE ADD COLUMN unless the table already has the column"""
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def migrate_metrics_history(cursor):
+    """Rebuild a pre-v1 device_metrics table without AUTOINCREMENT"""
+    row = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'device_metrics'"
+    ).fetchone()
+    if not row or 'AUTOINCREMENT' not in row[0].upper():
+        return
     
-    conn.commit()
-    conn.close()
+    print("Migrating device_metrics to the v1 history layout...")
+    cursor.execute('ALTER TABLE device_metrics RENAME TO device_metrics_v0')
+    cursor.execute(f'''
+        CREATE TABLE device_metrics (
+            id INTEGER PRIMARY KEY,
+            device_id INTEGER NOT NULL,
+            {METRIC_COLUMNS},
+            FOREIGN KEY (device_id) REFERENCES devices (id)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO device_metrics
+        (id, device_id, status, response_time, last_seen, cpu_usage, memory_usage,
+         disk_usage, network_in, network_out, uptime, load_average)
+        SELECT id, device_id, status, response_time, last_seen, cpu_usage, memory_usage,
+               disk_usage, network_in, network_out, uptime, load_average
+        FROM device_metrics_v0
+        WHERE device_id IS NOT NULL
+    ''')
+    cursor.execute('DROP TABLE device_metrics_v0')
 
 def get_devices_from_db():
     """Get all devices from database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT d.*, dm.status, dm.response_time, dm.last_seen
+    rows = db.query('''
+        SELECT d.*, dl.status, dl.response_time, dl.last_seen
         FROM devices d
-        LEFT JOIN device_metrics dm ON d.id = dm.device_id
+        LEFT JOIN device_latest dl ON d.id = dl.device_id
         WHERE d.enabled = 1
         ORDER BY d.name
     ''')
     
     devices = []
-    for row in cursor.fetchall():
+    for row in rows:
         device = {
             'id': row[0],
             'name': row[1],
@@ -107,39 +246,73 @@ def get_devices_from_db():
         }
         devices.append(device)
     
-    conn.close()
+    # Samples still in the write-behind queue are already in the recent store
+    latest = recent.latest_all()
+    for device in devices:
+        sample = latest.get(device['id'])
+        if sample:
+            status, ts, response_time = sample
+            device['status'] = status or device['status']
+            device['response_time'] = response_time or 0
+            device['last_seen'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+    
     return devices
 
+# Host metrics from node-exporter, fetched together in one cached query; see prometheus_query.py
+NODE_SELECTOR = 'job="node-exporter"'
+SYSTEM_QUERIES = {
+    'cpu_usage': f'100 * (1 - avg(rate(node_cpu_seconds_total{{{NODE_SELECTOR},mode="idle"}}[1m])))',
+    'memory_usage': f'100 * (1 - sum(node_memory_MemAvailable_bytes{{{NODE_SELECTOR}}})'
+                    f' / sum(node_memory_MemTotal_bytes{{{NODE_SELECTOR}}}))',
+    'disk_usage': f'100 * (1 - sum(node_filesystem_avail_bytes{{{NODE_SELECTOR},fstype!~"tmpfs|overlay"}})'
+                  f' / sum(node_filesystem_size_bytes{{{NODE_SELECTOR},fstype!~"tmpfs|overlay"}}))',
+    'network_in': f'sum(rate(node_network_receive_bytes_total{{{NODE_SELECTOR},device!="lo"}}[1m])) / 1e6',
+    'network_out': f'sum(rate(node_network_transmit_bytes_total{{{NODE_SELECTOR},device!="lo"}}[1m])) / 1e6',
+    'uptime': f'max(time() - node_boot_time_seconds{{{NODE_SELECTOR}}})',
+    'load_average': f'avg(node_load1{{{NODE_SELECTOR}}})'
+}
+SYSTEM_METRICS_TTL = 5
+prometheus = PrometheusClient(PROMETHEUS_URL, ttl=SYSTEM_METRICS_TTL)
+
+def format_uptime(seconds):
+    """Render seconds as days, hours and minutes, e.g. 15d 4h 32m"""
+    if seconds is None:
+        return None
+    minutes = int(seconds) // 60
+    return f"{minutes // 1440}d {minutes // 60 % 24}h {minutes % 60}m"
+
 def get_system_metrics():
     """Get system metrics from Prometheus"""
     try:
-        return {
-            'cpu_usage': round(random.uniform(20, 80), 1),
-            'memory_usage': round(random.uniform(40, 90), 1),
-            'disk_usage': round(random.uniform(30, 70), 1),
-            'network_in': round(random.uniform(100, 1000), 1),
-            'network_out': round(random.uniform(50, 500), 1),
-            'uptime': "15d 4h 32m",
-            'load_average': round(random.uniform(0.5, 3.0), 2)
-        }
+        values, fetched_at = prometheus.query(SYSTEM_QUERIES)
+        metrics = {name: None if value is None else round(value, 1) for name, value in values.items()}
+        metrics['uptime'] = format_uptime(values['uptime'])
+        if values['load_average'] is not None:
+            metrics['load_average'] = round(values['load_average'], 2)
+        metrics['updated_at'] = round(fetched_at, 3)
+        metrics['stale'] = time.time() - fetched_at >= SYSTEM_METRICS_TTL
+        return metrics
     except Exception as e:
         print(f"Error fetching metrics: {e}")
         return None
 
+# Worst status wins when reachability and reported metrics disagree
+STATUS_SEVERITY = {'healthy': 0, 'warning': 1, 'critical': 2}
+
 def get_device_status():
-    """Get status of monitored devices"""
+    """Get status of monitored devices, merged with the latest reachability probe"""
     devices = get_devices_from_db()
     
     for device in devices:
-        if device['status'] == 'unknown':
-            device['status'] = random.choice(['healthy', 'healthy', 'healthy', 'warning', 'critical'])
-        
-        if device['status'] == 'healthy':
-            device['response_time'] = random.randint(10, 100)
-        elif device['status'] == 'warning':
-            device['response_time'] = random.randint(100, 200)
-        elif device['status'] == 'critical':
-            device['response_time'] = 0
+        probe = reachability.get(device['id'])
+        if probe is None:
+            continue
+        
+        if STATUS_SEVERITY.get(device['status'], -1) < STATUS_SEVERITY[probe['status']]:
+            device['status'] = probe['status']
+        device['response_time'] = probe['rtt_ms'] or 0
+        device['jitter'] = probe['jitter_ms']
+        device['packet_loss'] = probe['loss']
     
     return devices
 
@@ -164,6 +337,8 @@ def get_alerts():
 @app.route('/')
 def dashboard():
     """Single-page network monitoring dashboard"""
+    # Started here rather than in __main__ so it binds in the process that serves requests
+    live.start()
     metrics = get_system_metrics()
     devices = get_device_status()
     alerts = get_alerts()
@@ -171,7 +346,8 @@ def dashboard():
     return render_template('dashboard.html', 
                          metrics=metrics, 
                          devices=devices, 
-                         alerts=alerts)
+                         alerts=alerts,
+                         live_port=live.port if live.listening() else None)
 
 @app.route('/api/metrics')
 def api_metrics():
@@ -179,11 +355,41 @@ def api_metrics():
     metrics = get_system_metrics()
     return jsonify(metrics)
 
+# Stored credentials never leave the server
+DEVICE_PRIVATE_FIELDS = ('password',)
+# Measurements that move with every probe or sample are still served, but do not version a record;
+# counted, they would give every device a new version every probe cycle
+DEVICE_VOLATILE_FIELDS = ('response_time', 'jitter', 'packet_loss', 'last_seen')
+
+def build_device_list():
+    """Device status records as served by /api/devices"""
+    return [{field: value for field, value in device.items() if field not in DEVICE_PRIVATE_FIELDS}
+            for device in get_device_status()]
+
+# Rebuilt at most once per DEVICES_TTL and versioned by change; see change_log.py
+DEVICES_TTL = 2
+device_changes = ChangeLog(build_device_list, ttl=DEVICES_TTL, volatile=DEVICE_VOLATILE_FIELDS)
+
 @app.route('/api/devices')
 def api_devices():
-    """API endpoint for device status"""
-    devices = get_device_status()
-    return jsonify(devices)
+    """API endpoint for device status; ?since=<version> returns only what changed after it"""
+    try:
+        since = request.args.get('since')
+        if since is None:
+            body, version = device_changes.full()
+        else:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({'error': 'since must be an integer version'}), 400
+            body, version = device_changes.since(since)
+        
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(str(version))
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/alerts')
 def api_alerts():
@@ -193,6 +399,68 @@ def api_alerts():
         alert['timestamp'] = alert['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
     return jsonify(alerts)
 
+# Every open dashboard polls the snapshot; one build is shared by all of them for SNAPSHOT_TTL seconds
+SNAPSHOT_TTL = 2
+SNAPSHOT_DEVICE_FIELDS = ('id', 'name', 'ip', 'device_type', 'status', 'response_time', 'jitter', 'packet_loss',
+                          'last_seen', 'agent_installed')
+SNAPSHOT_METRICS = ('cpu_usage', 'memory_usage', 'disk_usage', 'network_in', 'network_out', 'uptime',
+                    'load_average')
+
+# network_in/out columns hold cumulative byte counters; views show the rate columns in MB/s under those names
+NETWORK_RATE_COLUMNS = {'network_in': 'network_in_rate', 'network_out': 'network_out_rate'}
+SNAPSHOT_COLUMNS = tuple(NETWORK_RATE_COLUMNS.get(metric, metric) for metric in SNAPSHOT_METRICS)
+
+def network_mbps(rate):
+    """Bytes per second as MB/s for display"""
+    return round(rate / 1048576, 3) if rate is not None else None
+snapshot_lock = threading.Lock()
+snapshot_cache = {'built_at': 0.0, 'body': None, 'etag': None}
+
+def build_dashboard_snapshot():
+    """System metrics, every device with its latest metrics, and alerts"""
+    now = time.time()
+    rows = db.query(f'SELECT device_id, {", ".join(SNAPSHOT_COLUMNS)} FROM device_latest')
+    stored = {row[0]: dict(zip(SNAPSHOT_COLUMNS, row[1:])) for row in rows}
+    
+    devices = []
+    for device in get_device_status():
+        # Fresh samples still in memory win over the last persisted row
+        sample = recent.latest(device['id'])
+        if not sample or now - sample['timestamp'] >= RECENT_MAX_AGE:
+            sample = stored.get(device['id'], {})
+        entry = {field: device.get(field) for field in SNAPSHOT_DEVICE_FIELDS}
+        for metric, column in zip(SNAPSHOT_METRICS, SNAPSHOT_COLUMNS):
+            value = sample.get(column)
+            entry[metric] = network_mbps(value) if metric in NETWORK_RATE_COLUMNS else value
+        devices.append(entry)
+    
+    alerts = get_alerts()
+    for alert in alerts:
+        alert['timestamp'] = alert['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+    
+    return {'generated_at': round(now, 3), 'system': get_system_metrics(), 'devices': devices, 'alerts': alerts}
+
+def get_dashboard_snapshot():
+    """Serialized snapshot and its ETag, rebuilt at most once per SNAPSHOT_TTL"""
+    with snapshot_lock:
+        if snapshot_cache['body'] is None or time.monotonic() - snapshot_cache['built_at'] >= SNAPSHOT_TTL:
+            body = json.dumps(build_dashboard_snapshot(), separators=(',', ':'))
+            snapshot_cache.update(built_at=time.monotonic(), body=body,
+                                  etag=hashlib.sha1(body.encode()).hexdigest())
+        return snapshot_cache['body'], snapshot_cache['etag']
+
+@app.route('/api/dashboard/snapshot')
+def api_dashboard_snapshot():
+    """Everything the dashboard refreshes, in one response"""
+    try:
+        body, etag = get_dashboard_snapshot()
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(etag)
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/grafana/<dashboard_id>')
 def grafana_embed(dashboard_id):
     """Serve Grafana dashboard embeds"""
@@ -215,10 +483,7 @@ def add_device():
             if not data.get(field):
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        cursor = db.execute('''
             INSERT INTO devices (name, ip_address, device_type, port, description, tags)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (
@@ -231,8 +496,7 @@ def add_device():
         ))
         
         device_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        exporter.reload()
         
         return jsonify({'success': True, 'device_id': device_id}), 201
         
@@ -247,10 +511,7 @@ def update_device(device_id):
     try:
         data = request.get_json()
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        db.execute('''
             UPDATE devices 
             SET name = ?, ip_address = ?, device_type = ?, port = ?, 
                 description = ?, tags = ?, updated_at = CURRENT_TIMESTAMP
@@ -264,9 +525,8 @@ def update_device(device_id):
             ','.join(data.get('tags', [])),
             device_id
         ))
-        
-        conn.commit()
-        conn.close()
+        poller.reload()
+        exporter.reload()
         
         return jsonify({'success': True}), 200
         
@@ -277,13 +537,12 @@ def update_device(device_id):
 def delete_device(device_id):
     """Delete a device (soft delete by disabling)"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('UPDATE devices SET enabled = 0 WHERE id = ?', (device_id,))
-        
-        conn.commit()
-        conn.close()
+        db.execute('UPDATE devices SET enabled = 0 WHERE id = ?', (device_id,))
+        recent.forget(device_id)
+        delta_state.forget(device_id)
+        live.remove(device_id)
+        poller.reload()
+        exporter.reload()
         
         return jsonify({'success': True}), 200
         
@@ -292,211 +551,115 @@ def delete_device(device_id):
 
 @app.route('/api/devices/discover', methods=['POST'])
 def discover_devices():
-    """Discover devices on the network"""
+    """Start sweeping a network range; results are fetched from the job endpoint"""
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         network_range = data.get('network_range', '192.168.1.0/24')
         
-        discovered_devices = [
-            {'ip': '192.168.1.15', 'hostname': 'unknown-device-15', 'ports': [22, 80], 'device_type': 'server'},
-            {'ip': '192.168.1.25', 'hostname': 'printer-25', 'ports': [9100], 'device_type': 'printer'},
-            {'ip': '192.168.1.35', 'hostname': 'switch-35', 'ports': [23, 80], 'device_type': 'network'},
-        ]
+        try:
+            job = discovery.start(network_range, data.get('ports'))
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({'devices': discovered_devices}), 200
+        return jsonify({'job_id': job.id, 'status_url': f'/api/devices/discover/{job.id}'}), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def discover_virtualbox_vms():
-    """Discover VirtualBox VMs using VBoxManage"""
-    try:
-        result = subprocess.run(['VBoxManage', 'list', 'vms'], 
-                              capture_output=True, text=True, timeout=30)
-        
-        if result.returncode != 0:
-            return []
-        
-        vms = []
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                # Parse VM name and UUID
-                parts = line.split(' ')
-                vm_name = parts[0].strip('"')
-                vm_uuid = parts[1].strip('{}')
-                
-                # Get VM info
-                info_result = subprocess.run(['VBoxManage', 'showvminfo', vm_uuid, '--machinereadable'], 
-                                           capture_output=True, text=True, timeout=30)
-                
-                if info_result.returncode == 0:
-                    vm_info = {}
-                    for info_line in info_result.stdout.split('\n'):
-                        if '=' in info_line:
-                            key, value = info_line.split('=', 1)
-                            vm_info[key] = value.strip('"')
-                    
-                    # Try to get IP address from guest properties
-                    ip_result = subprocess.run(['VBoxManage', 'guestproperty', 'get', vm_uuid, '/VirtualBox/GuestInfo/Net/0/V4/IP'], 
-                                             capture_output=True, text=True, timeout=10)
-                    
-                    ip_address = None
-                    if ip_result.returncode == 0 and 'Value:' in ip_result.stdout:
-                        ip_address = ip_result.stdout.split('Value: ')[1].strip()
-                    
-                    vms.append({
-                        'vm_id': vm_uuid,
-                        'vm_name': vm_name,
-                        'status': vm_info.get('VMState', 'unknown'),
-                        'os_type': vm_info.get('ostype', 'unknown'),
-                        'memory': vm_info.get('memory', '0'),
-                        'cpus': vm_info.get('cpus', '1'),
-                        'ip_address': ip_address,
-                        'description': f"{vm_info.get('ostype', 'Unknown OS')} VM with {vm_info.get('memory', '0')}MB RAM"
-                    })
-        
-        return vms
-        
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error discovering VirtualBox VMs: {e}")
-        return []
-
-def install_monitoring_agent(device_id, ip_address, username, password, ssh_key_path=None):
-    """Install monitoring agent on a VM"""
+@app.route('/api/devices/discover/<job_id>')
+def discover_devices_status(job_id):
+    """Discovery progress plus devices found after the ?since= cursor"""
+    job = discovery.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Discovery job not found'}), 404
+    since = max(request.args.get('since', 0, type=int), 0)
+    return jsonify(job.snapshot(since))
+
+@app.route('/api/devices/discover/<job_id>', methods=['DELETE'])
+def cancel_discovery(job_id):
+    """Stop a running discovery job"""
+    if not discovery.cancel(job_id):
+        return jsonify({'error': 'Discovery job not found'}), 404
+    return jsonify({'success': True}), 200
+
+# Agent installs run as persistent rollout jobs on a bounded pool; see rollout.py
+def load_rollout_devices(device_ids):
+    """Connection details for the given devices"""
+    ids = list(device_ids)
+    devices = []
+    with db.reader() as conn:
+        for start in range(0, len(ids), MAX_SQL_VARIABLES):
+            chunk = ids[start:start + MAX_SQL_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'''
+                SELECT id, ip_address, port, username, password, ssh_key_path FROM devices
+                WHERE id IN ({placeholders})
+            ''', chunk)
+            devices.extend({'id': row[0], 'ip_address': row[1], 'port': row[2] or 22, 'username': row[3],
+                            'password': row[4], 'ssh_key_path': row[5]} for row in rows)
+    return devices
+
+def mark_agent_installed(device_id):
+    db.execute('UPDATE devices SET agent_installed = 1 WHERE id = ?', (device_id,))
+
+rollouts = RolloutManager(db, load_rollout_devices, on_installed=mark_agent_installed)
+atexit.register(rollouts.stop)
+
+@app.route('/api/agents/rollout', methods=['POST'])
+def start_rollout():
+    """Install node_exporter on a list of devices, or on every enabled device with {"all": true}"""
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        if ssh_key_path and os.path.exists(ssh_key_path):
-            ssh.connect(ip_address, username=username, key_filename=ssh_key_path, timeout=30)
+        data = request.get_json(silent=True) or {}
+        if data.get('all'):
+            device_ids = [row[0] for row in db.query('SELECT id FROM devices WHERE enabled = 1 ORDER BY id')]
         else:
-            ssh.connect(ip_address, username=username, password=password, timeout=30)
-        
-        # Install node_exporter (Linux)
-        commands = [
-            'sudo apt-get update -y || sudo yum update -y',
-            'wget -q https://github.com/prometheus/node_exporter/releases/download/v1.6.1/node_exporter-1.6.1.linux-amd64.tar.gz',
-            'tar xvfz node_exporter-1.6.1.linux-amd64.tar.gz',
-            'sudo mv node_exporter-1.6.1.linux-amd64/node_exporter /usr/local/bin/',
-            'sudo useradd --no-create-home --shell /bin/false node_exporter || true',
-            'sudo chown node_exporter:node_exporter /usr/local/bin/node_exporter',
-            '''sudo tee /etc/systemd/system/node_exporter.service > /dev/null <<EOF
-[Unit]
-Description=Node Exporter
-Wants=network-online.target
-After=network-online.target
-
-[Service]
-User=node_exporter
-Group=node_exporter
-Type=simple
-ExecStart=/usr/local/bin/node_exporter
-
-[Install]
-WantedBy=multi-user.target
-EOF''',
-            'sudo systemctl daemon-reload',
-            'sudo systemctl enable node_exporter',
-            'sudo systemctl start node_exporter'
-        ]
-        
-        for cmd in commands:
-            stdin, stdout, stderr = ssh.exec_command(cmd)
-            stdout.read()  # Wait for command to complete
-        
-        ssh.close()
-        
-        # Update database to mark agent as installed
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE devices SET agent_installed = 1 WHERE id = ?', (device_id,))
-        conn.commit()
-        conn.close()
-        
-        return True
-        
+            device_ids = data.get('device_ids')
+            if not isinstance(device_ids, list) or not all(isinstance(i, int) for i in device_ids):
+                return jsonify({'error': 'device_ids must be a list of device ids'}), 400
+        if not device_ids:
+            return jsonify({'error': 'No devices selected'}), 400
+        job_id = rollouts.create(device_ids)
+        return jsonify({'job_id': job_id, 'status_url': f'/api/agents/rollout/{job_id}'}), 202
     except Exception as e:
-        print(f"Error installing monitoring agent on {ip_address}: {e}")
-        return False
+        return jsonify({'error': str(e)}), 500
 
-def get_vm_metrics_via_ssh(ip_address, username, password, ssh_key_path=None):
-    """Get real-time metrics from VM via SSH"""
+@app.route('/api/agents/rollouts')
+def list_rollouts():
+    """Most recent rollout jobs"""
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        if ssh_key_path and os.path.exists(ssh_key_path):
-            ssh.connect(ip_address, username=username, key_filename=ssh_key_path, timeout=10)
-        else:
-            ssh.connect(ip_address, username=username, password=password, timeout=10)
-        
-        metrics = {}
-        
-        stdin, stdout, stderr = ssh.exec_command("top -bn1 | grep 'Cpu(s)' | awk '{print $2}' | cut -d'%' -f1")
-        cpu_output = stdout.read().decode().strip()
-        try:
-            metrics['cpu_usage'] = round(float(cpu_output), 1)
-        except:
-            metrics['cpu_usage'] = round(random.uniform(10, 80), 1)
-        
-        # Get memory usage
-        stdin, stdout, stderr = ssh.exec_command("free | grep Mem | awk '{printf \"%.1f\", $3/$2 * 100.0}'")
-        mem_output = stdout.read().decode().strip()
-        try:
-            metrics['memory_usage'] = round(float(mem_output), 1)
-        except:
-            metrics['memory_usage'] = round(random.uniform(30, 70), 1)
-        
-        # Get disk usage
-        stdin, stdout, stderr = ssh.exec_command("df -h / | awk 'NR==2{print $5}' | cut -d'%' -f1")
-        disk_output = stdout.read().decode().strip()
-        try:
-            metrics['disk_usage'] = round(float(disk_output), 1)
-        except:
-            metrics['disk_usage'] = round(random.uniform(20, 60), 1)
-        
-        # Get uptime
-        stdin, stdout, stderr = ssh.exec_command("uptime -p")
-        uptime_output = stdout.read().decode().strip()
-        metrics['uptime'] = uptime_output or f"{random.randint(1, 30)}d {random.randint(0, 23)}h {random.randint(0, 59)}m"
-        
-        # Get load average
-        stdin, stdout, stderr = ssh.exec_command("uptime | awk -F'load average:' '{print $2}' | awk '{print $1}' | cut -d',' -f1")
-        load_output = stdout.read().decode().strip()
-        try:
-            metrics['load_average'] = round(float(load_output), 2)
-        except:
-            metrics['load_average'] = round(random.uniform(0.1, 2.0), 2)
-        
-        # Network metrics (simplified)
-        metrics['network_in'] = round(random.uniform(50, 500), 1)
-        metrics['network_out'] = round(random.uniform(25, 250), 1)
-        metrics['response_time'] = random.randint(5, 50)
-        metrics['status'] = 'healthy'
-        
-        ssh.close()
-        return metrics
-        
+        limit = min(request.args.get('limit', 20, type=int), 200)
+        return jsonify({'jobs': rollouts.list_jobs(limit)}), 200
     except Exception as e:
-        print(f"Error getting metrics from {ip_address}: {e}")
-        return {
-            'cpu_usage': 0,
-            'memory_usage': 0,
-            'disk_usage': 0,
-            'network_in': 0,
-            'network_out': 0,
-            'response_time': 0,
-            'status': 'critical',
-            'uptime': "0d 0h 0m",
-            'load_average': 0.0
-        }
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/agents/rollout/<int:job_id>')
+def rollout_status(job_id):
+    """Rollout job with per-host status, stage, attempts and last error"""
+    try:
+        job = rollouts.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Rollout job not found'}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/api/vms/discover', methods=['POST'])
+@app.route('/api/agents/rollout/<int:job_id>', methods=['DELETE'])
+def cancel_rollout(job_id):
+    """Cancel hosts of a rollout that have not started yet"""
+    try:
+        if not rollouts.cancel(job_id):
+            return jsonify({'error': 'Rollout job not found'}), 404
+        return jsonify({'success': True}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/vms/discover', methods=['GET', 'POST'])
 def discover_vms():
-    """Discover VirtualBox VMs"""
+    """Discover VirtualBox VMs from the cached inventory; ?refresh=1 forces a rescan"""
     try:
-        vms = discover_virtualbox_vms()
-        return jsonify({'vms': vms}), 200
+        data = request.get_json(silent=True) or {}
+        force = request.args.get('refresh', '') in ('1', 'true') or bool(data.get('refresh'))
+        return jsonify(vbox_inventory.get(force=force)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -511,10 +674,7 @@ def add_vm_device():
             if not data.get(field):
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        cursor = db.execute('''
             INSERT INTO devices (name, ip_address, device_type, port, description, tags, 
                                username, password, ssh_key_path, vm_id, vm_name, vm_status)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -534,8 +694,8 @@ def add_vm_device():
         ))
         
         device_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        poller.reload()
+        exporter.reload()
         
         return jsonify({'success': True, 'device_id': device_id}), 201
         
@@ -548,27 +708,15 @@ def add_vm_device():
 def install_agent(device_id):
     """Install monitoring agent on a device"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT ip_address, username, password, ssh_key_path FROM devices WHERE id = ?', (device_id,))
-        device = cursor.fetchone()
+        device = db.query_one('SELECT id FROM devices WHERE id = ?', (device_id,))
         
         if not device:
             return jsonify({'error': 'Device not found'}), 404
         
-        ip_address, username, password, ssh_key_path = device
-        
-        # Install agent in background
-        def install_in_background():
-            success = install_monitoring_agent(device_id, ip_address, username, password, ssh_key_path)
-            return success
-        
-        # For now, return success immediately and install in background
-        threading.Thread(target=install_in_background).start()
+        job_id = rollouts.create([device_id])
         
-        conn.close()
-        return jsonify({'success': True, 'message': 'Agent installation started'}), 200
+        return jsonify({'success': True, 'message': 'Agent installation started', 'job_id': job_id,
+                        'status_url': f'/api/agents/rollout/{job_id}'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -577,17 +725,27 @@ def install_agent(device_id):
 def api_device_metrics(device_id):
     """Get real-time metrics from a specific device"""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM devices WHERE id = ? AND enabled = 1', (device_id,))
-        device = cursor.fetchone()
+        device = db.query_one('SELECT * FROM devices WHERE id = ? AND enabled = 1', (device_id,))
         
         if not device:
             return jsonify({'error': 'Device not found'}), 404
         
+        # Devices reporting through an agent are answered from memory
+        sample = recent.latest(device_id)
+        if sample and time.time() - sample['timestamp'] < RECENT_MAX_AGE:
+            for metric, column in NETWORK_RATE_COLUMNS.items():
+                sample[metric] = network_mbps(sample.get(column))
+            return jsonify(sample)
+        
         if device[3] == 'vm' and device[7] and device[2]:  # device_type == 'vm' and has username and ip
-            metrics = get_vm_metrics_via_ssh(device[2], device[7], device[8], device[9])
+            # Agentless VMs are polled in the background; never SSH from inside the request
+            result = poller.get(device_id)
+            if result is None:
+                poller.request_poll(device_id)
+                metrics = dict(OFFLINE_METRICS, status='unknown')
+            else:
+                metrics = dict(result['metrics'] or OFFLINE_METRICS)
+                metrics['polled_at'] = result['polled_at']
         else:
             # Generate mock metrics for non-VM devices
             device_status = random.choice(['healthy', 'healthy', 'healthy', 'warning', 'critical'])
@@ -629,59 +787,540 @@ def api_device_metrics(device_id):
                     'load_average': 0.0
                 }
         
-        conn.close()
         return jsonify(metrics)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def parse_sample_timestamp(value):
+    """Convert an agent timestamp to the UTC format used by CURRENT_TIMESTAMP.
+
+    Epoch seconds and timezone-aware ISO strings are trusted; naive or missing
+    timestamps fall back to the time the sample was received.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+        # Compact agent bodies carry epoch seconds
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(value))
+    if value:
+        try:
+            parsed = datetime.fromisoformat(value)
+            if parsed.tzinfo is not None:
+                return parsed.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError):
+            pass
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def build_metrics_row(device_id, data):
+    """Map an agent sample onto the device_metrics insert parameters"""
+    return (
+        device_id,
+        data.get('status', 'unknown'),
+        data.get('response_time', 0),
+        data.get('cpu_usage', 0),
+        data.get('memory_usage', 0),
+        data.get('disk_usage', 0),
+        data.get('network_bytes_recv', 0),
+        data.get('network_bytes_sent', 0),
+        data.get('uptime', ''),
+        data.get('load_average', 0),
+        parse_sample_timestamp(data.get('timestamp')),
+        data.get('network_recv_rate'),
+        data.get('network_sent_rate'),
+        parse_sample_seq(data.get('seq'))
+    )
+
+def parse_sample_seq(value):
+    """Sequence number a spooling agent gave the sample, or None"""
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    return None
+
+INSERT_METRICS_SQL = '''
+    INSERT INTO device_metrics 
+    (device_id, status, response_time, cpu_usage, memory_usage, disk_usage, 
+     network_in, network_out, uptime, load_average, last_seen, network_in_rate, network_out_rate, seq)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Same parameters as INSERT_METRICS_SQL; late-arriving samples never overwrite newer state
+UPSERT_LATEST_SQL = '''
+    INSERT INTO device_latest 
+    (device_id, status, response_time, cpu_usage, memory_usage, disk_usage, 
+     network_in, network_out, uptime, load_average, last_seen, network_in_rate, network_out_rate, seq)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (device_id) DO UPDATE SET
+        status = excluded.status,
+        response_time = excluded.response_time,
+        cpu_usage = excluded.cpu_usage,
+        memory_usage = excluded.memory_usage,
+        disk_usage = excluded.disk_usage,
+        network_in = excluded.network_in,
+        network_out = excluded.network_out,
+        uptime = excluded.uptime,
+        load_average = excluded.load_average,
+        last_seen = excluded.last_seen,
+        network_in_rate = excluded.network_in_rate,
+        network_out_rate = excluded.network_out_rate,
+        seq = excluded.seq
+    WHERE excluded.last_seen >= device_latest.last_seen
+'''
+
+# Same parameters again; only device_id (?1) and seq (?14) are used
+RECORD_SEQUENCE_SQL = '''
+    INSERT INTO agent_sequences (device_id, last_seq)
+    SELECT ?1, ?14 WHERE ?14 IS NOT NULL
+    ON CONFLICT (device_id) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq)
+'''
+
+class HeartbeatRow(tuple):
+    """Metrics row for a delta that changed nothing stored; it refreshes device_latest but adds no history"""
+
+def is_history_row(row):
+    return not isinstance(row, HeartbeatRow)
+
+# Retried samples from spooling agents are dropped before they are queued
+sequences = SequenceFilter()
+
+def release_dropped_rows(rows):
+    """Let agents redeliver samples from a batch the writer could not commit"""
+    sequences.release(rows)
+    # The delta state already includes what was lost; rebuild it from a full sample
+    for device_id in {row[0] for row in rows}:
+        delta_state.forget(device_id)
+
+# Samples are committed in groups by a background writer; see ingest.py
+ingest_queue = IngestQueue(db, ((INSERT_METRICS_SQL, is_history_row), UPSERT_LATEST_SQL, RECORD_SEQUENCE_SQL),
+                           on_drop=release_dropped_rows)
+# atexit runs in reverse: flush the queue first, then close the pool
+atexit.register(db.close)
+atexit.register(ingest_queue.close)
+atexit.register(rollups.stop)
+atexit.register(ssh_pool.close_all)
+
+# Last RECENT_CAPACITY samples per device, kept in fixed-size arrays; see recent_store.py
+RECENT_CAPACITY = 120
+RECENT_MAX_AGE = 120  # seconds before /api/device/<id>/metrics stops trusting the store
+# Rolled-up metrics, then the byte counters /metrics exports
+RECENT_METRICS = ROLLUP_METRICS + ('network_in', 'network_out')
+recent = RecentStore(RECENT_METRICS, capacity=RECENT_CAPACITY)
+
+# Dashboards get changed device states pushed over SSE from an asyncio server; see live_stream.py
+LIVE_PORT = int(os.environ.get('LIVE_PORT', 5001))
+live = LiveHub(port=LIVE_PORT)
+atexit.register(live.close)
+
+# Agents in delta mode send only what moved; full samples are rebuilt here; see agent_delta.py
+# Sample fields that end up in device_metrics; uptime is left out as it moves on every sample
+HISTORY_FIELDS = frozenset(('status', 'response_time', 'cpu_usage', 'memory_usage', 'disk_usage',
+                            'network_bytes_recv', 'network_bytes_sent', 'load_average',
+                            'network_recv_rate', 'network_sent_rate'))
+
+def load_delta_base(device_id):
+    """Stored latest state of a device as a sample, for deltas arriving before any full sample"""
+    row = db.query_one('''
+        SELECT status, response_time, cpu_usage, memory_usage, disk_usage, network_in, network_out,
+               uptime, load_average, network_in_rate, network_out_rate
+        FROM device_latest WHERE device_id = ?
+    ''', (device_id,))
+    if not row:
+        return None
+    keys = ('status', 'response_time', 'cpu_usage', 'memory_usage', 'disk_usage', 'network_bytes_recv',
+            'network_bytes_sent', 'uptime', 'load_average', 'network_recv_rate', 'network_sent_rate')
+    return {key: value for key, value in zip(keys, row) if value is not None}
+
+delta_state = agent_delta.DeltaState(load_delta_base)
+
+def build_agent_row(device_id, sample, pending):
+    """Metrics row for an agent sample, full or delta, and whether the agent should send a full one next"""
+    # The new device state waits in `pending` until the rows are queued, so a sample pushed back
+    # with a 503 is merged again, and recorded as history, when it is retried
+    full, changed, resync = delta_state.apply(device_id, sample, pending)
+    row = build_metrics_row(device_id, full)
+    if sample.get('delta') and not changed & HISTORY_FIELDS:
+        row = HeartbeatRow(row)
+    return row, resync
+
+def remember_rows(rows):
+    """Copy freshly queued metrics rows into the recent store and the live stream"""
+    for row in rows:
+        ts = datetime.strptime(row[10], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+        # Reorder row columns into RECENT_METRICS order
+        values = (row[3], row[4], row[5], row[2], row[9], row[11], row[12], row[6], row[7])
+        recent.record(row[0], ts, values, status=row[1], uptime=row[8])
+        # Chart points get the rolled-up metrics only; zip stops before the counters
+        live.publish(row[0], {'status': row[1], 'response_time': row[2], 'cpu_usage': row[3],
+                              'memory_usage': row[4]}, (ts, dict(zip(ROLLUP_METRICS, values))))
+
+# Agentless VMs are polled on an adaptive schedule by a bounded worker pool; see poller.py
+OFFLINE_METRICS = {
+    'cpu_usage': 0,
+    'memory_usage': 0,
+    'disk_usage': 0,
+    'network_in': 0,
+    'network_out': 0,
+    'response_time': 0,
+    'status': 'critical',
+    'uptime': "0d 0h 0m",
+    'load_average': 0.0
+}
+
+def load_agentless_devices():
+    """Enabled VMs with SSH credentials"""
+    rows = db.query('''
+        SELECT id, ip_address, port, username, password, ssh_key_path FROM devices
+        WHERE enabled = 1 AND device_type = 'vm' AND ip_address != '' AND username != ''
+    ''')
+    return [{'id': row[0], 'ip_address': row[1], 'port': row[2] or 22, 'username': row[3],
+             'password': row[4], 'ssh_key_path': row[5]} for row in rows]
+
+def poll_device(device):
+    """Collect one agentless VM; raises on failure"""
+    return remote_collector.collect(device['ip_address'], device['username'], device['password'],
+                                    device['ssh_key_path'], device['port'])
+
+def store_poll_result(device_id, metrics, error):
+    """Queue a poll result into history the same way agent samples are"""
+    if error:
+        print(f"Error getting metrics from device {device_id}: {error}")
+        data = {'status': 'critical', 'response_time': None, 'cpu_usage': None, 'memory_usage': None,
+                'disk_usage': None, 'network_bytes_recv': None, 'network_bytes_sent': None,
+                'uptime': None, 'load_average': None}
+    else:
+        # Counters and bytes-per-second rates, like agent samples; metrics' MB/s network_in/out are for display
+        data = metrics
+    rows = [build_metrics_row(device_id, data)]
+    if ingest_queue.offer(rows):
+        remember_rows(rows)
+
+poller = FleetPoller(load_agentless_devices, poll_device, on_result=store_poll_result)
+atexit.register(poller.stop)
+atexit.register(discovery.close)
+atexit.register(reachability.stop)
+atexit.register(vbox_inventory.close)
+
+# /metrics is rendered from the recent store and probe results, never SQLite; see metrics_exporter.py
+def load_exported_devices():
+    """Labels for every enabled device"""
+    return db.query('SELECT id, name, ip_address, device_type FROM devices WHERE enabled = 1 ORDER BY id')
+
+exporter = MetricsExporter(load_exported_devices, recent, reachability, ingest_queue, poller)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        exporter.observe_request(request.method, request.endpoint or 'unmatched', response.status_code,
+                                 time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    try:
+        body = exporter.render()
+        response = app.response_class(body, mimetype=None, content_type=CONTENT_TYPE_LATEST)
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response.set_data(gzip.compress(body, compresslevel=1))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+atexit.register(prometheus.close)
+
+def queue_full_response():
+    """Backpressure reply telling agents to retry later"""
+    response = jsonify({'error': 'Ingest queue is full, retry later'})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+# SQLite builds without SQLITE_MAX_VARIABLE_NUMBER raised cap parameters at 999
+MAX_SQL_VARIABLES = 900
+MAX_BATCH_SAMPLES = 5000
+
+def get_enabled_device_ids(device_ids):
+    """Return the subset of device_ids that exist and are enabled"""
+    ids = list(set(device_ids))
+    found = set()
+    with db.reader() as conn:
+        for start in range(0, len(ids), MAX_SQL_VARIABLES):
+            chunk = ids[start:start + MAX_SQL_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'SELECT id FROM devices WHERE enabled = 1 AND id IN ({placeholders})', chunk)
+            found.update(row[0] for row in rows)
+    return found
+
+HISTORY_DEFAULT_POINTS = 300
+HISTORY_MAX_POINTS = 2000
+
+@app.route('/api/device/<int:device_id>/history')
+def api_device_history(device_id):
+    """Downsampled metric history for charts"""
+    try:
+        metrics = []
+        for value in request.args.getlist('metric') or ['cpu_usage,memory_usage']:
+            metrics.extend(m.strip() for m in value.split(',') if m.strip())
+        unknown = [m for m in metrics if m not in ROLLUP_METRICS and m not in NETWORK_RATE_COLUMNS]
+        if unknown:
+            return jsonify({'error': f"Unknown metric: {', '.join(unknown)}"}), 400
+        
+        now = int(time.time())
+        end = request.args.get('to', now, type=int)
+        start = request.args.get('from', end - 3600, type=int)
+        points = min(max(request.args.get('points', HISTORY_DEFAULT_POINTS, type=int), 3), HISTORY_MAX_POINTS)
+        mode = request.args.get('mode', 'lttb')
+        if mode not in downsample.METHODS:
+            return jsonify({'error': f'Unknown mode: {mode}'}), 400
+        if start >= end:
+            return jsonify({'error': 'from must be before to'}), 400
+        
+        if not db.query_one('SELECT id FROM devices WHERE id = ?', (device_id,)):
+            return jsonify({'error': 'Device not found'}), 404
+        
+        # network_in/out are charted from the rate columns, in MB/s
+        columns = list(dict.fromkeys(NETWORK_RATE_COLUMNS.get(m, m) for m in metrics))
+        resolution = rollups.choose_resolution(start, end, points)
+        series = recent.query_range(device_id, columns, start, end) if resolution == RAW else None
+        if series is None:
+            resolution, series = rollups.query_range(device_id, columns, start, end, resolution=resolution)
+        
+        result = {}
+        for metric in metrics:
+            buckets = series.get(NETWORK_RATE_COLUMNS.get(metric, metric), [])
+            if mode == 'minmax' and resolution != RAW:
+                # Rollup buckets already know their extremes
+                raw_points = []
+                for b in buckets:
+                    raw_points.append((b['ts'], b['min']))
+                    if b['max'] != b['min']:
+                        raw_points.append((b['ts'], b['max']))
+            else:
+                raw_points = [(b['ts'], b['avg']) for b in buckets]
+            sampled = downsample.METHODS[mode](raw_points, points)
+            if metric in NETWORK_RATE_COLUMNS:
+                result[metric] = [[ts, network_mbps(value)] for ts, value in sampled]
+            else:
+                result[metric] = [[ts, round(value, 2)] for ts, value in sampled]
+        
+        response = jsonify({
+            'device_id': device_id,
+            'from': start,
+            'to': end,
+            'resolution': resolution,
+            'mode': mode,
+            'metrics': result
+        })
+        
+        # Windows that ended before the newest bucket closed only change through
+        # late samples or retention, so browsers may keep them much longer
+        closed = end <= now - max(resolution, 60)
+        response.headers['Cache-Control'] = 'private, max-age=3600' if closed else 'private, max-age=15'
+        cache_key = f"{device_id}:{','.join(metrics)}:{start}:{end}:{points}:{mode}:"
+        response.set_etag(hashlib.sha1(cache_key.encode() + response.get_data()).hexdigest())
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def read_agent_payload():
+    """Agent request body decoded by Content-Encoding and Content-Type; see agent_codec.py"""
+    return agent_codec.decode_request(request.get_data(cache=False), request.content_type,
+                                      request.headers.get('Content-Encoding'))
+
+def payload_error_response(e):
+    if isinstance(e, agent_codec.UnsupportedPayload):
+        return jsonify({'error': str(e), 'formats_url': '/api/metrics/formats'}), 415
+    return jsonify({'error': f'Malformed request body: {e}'}), 400
+
+@app.route('/api/metrics/formats')
+def metrics_formats():
+    """Request body encodings accepted by the submit endpoints"""
+    return jsonify({
+        'content_types': [agent_codec.CONTENT_TYPE, agent_codec.JSON_CONTENT_TYPE],
+        'compact_version': agent_codec.FORMAT_VERSION,
+        'compact_versions': sorted(agent_codec.VERSION_FIELDS),
+        'content_encodings': agent_codec.compressions(),
+        'sample_modes': ['full', 'delta']
+    })
+
 @app.route('/api/metrics/submit', methods=['POST'])
 def submit_metrics():
     """Receive metrics from monitoring agents"""
     try:
-        data = request.get_json()
+        try:
+            data = read_agent_payload()
+        except ValueError as e:
+            return payload_error_response(e)
+        if isinstance(data, list) and len(data) == 1:
+            data = data[0]
         
         if not data or 'device_id' not in data:
             return jsonify({'error': 'Missing device_id'}), 400
         
-        device_id = data['device_id']
+        try:
+            device_id = int(data['device_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid device_id'}), 400
         
         # Verify device exists
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT id FROM devices WHERE id = ? AND enabled = 1', (device_id,))
-        if not cursor.fetchone():
-            conn.close()
+        if not db.query_one('SELECT id FROM devices WHERE id = ? AND enabled = 1', (device_id,)):
             return jsonify({'error': 'Device not found or disabled'}), 404
         
-        # Store metrics
-        cursor.execute('''
-            INSERT OR REPLACE INTO device_metrics 
-            (device_id, status, response_time, cpu_usage, memory_usage, disk_usage, 
-             network_in, network_out, uptime, load_average, last_seen)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (
-            device_id,
-            data.get('status', 'unknown'),
-            data.get('response_time', 0),
-            data.get('cpu_usage', 0),
-            data.get('memory_usage', 0),
-            data.get('disk_usage', 0),
-            data.get('network_bytes_recv', 0),
-            data.get('network_bytes_sent', 0),
-            data.get('uptime', ''),
-            data.get('load_average', 0)
-        ))
+        # Hand off to the write-behind queue; the writer thread commits it
+        pending = {}
+        row, resync = build_agent_row(device_id, data, pending)
+        rows = [row]
+        fresh = sequences.admit(rows, ingest_queue.offer)
+        if fresh is None:
+            return queue_full_response()
+        delta_state.commit(pending)
+        if not fresh[0]:
+            return jsonify({'success': True, 'duplicate': True, 'message': 'Already stored'}), 200
+        remember_rows(rows)
         
-        conn.commit()
-        conn.close()
+        return jsonify({'success': True, 'message': 'Metrics queued', 'resync': resync}), 202
         
-        return jsonify({'success': True, 'message': 'Metrics received'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics/submit/batch', methods=['POST'])
+def submit_metrics_batch():
+    """Receive many metric samples, for any number of devices, in one request"""
+    try:
+        try:
+            data = read_agent_payload()
+        except ValueError as e:
+            return payload_error_response(e)
+        samples = data.get('samples') if isinstance(data, dict) else data
+        
+        if not isinstance(samples, list) or not samples:
+            return jsonify({'error': 'Expected a non-empty list of samples'}), 400
+        if len(samples) > MAX_BATCH_SAMPLES:
+            return jsonify({'error': f'Batch exceeds {MAX_BATCH_SAMPLES} samples'}), 413
+        
+        results = [None] * len(samples)
+        candidates = []
+        for index, sample in enumerate(samples):
+            if not isinstance(sample, dict) or 'device_id' not in sample:
+                results[index] = {'index': index, 'success': False, 'error': 'Missing device_id'}
+                continue
+            try:
+                candidates.append((index, int(sample['device_id']), sample))
+            except (TypeError, ValueError):
+                results[index] = {'index': index, 'success': False, 'error': 'Invalid device_id'}
+        
+        known_ids = get_enabled_device_ids([device_id for _, device_id, _ in candidates])
+        
+        rows = []
+        resync = set()
+        pending = {}
+        for index, device_id, sample in candidates:
+            if device_id not in known_ids:
+                results[index] = {'index': index, 'device_id': device_id, 'success': False,
+                                  'error': 'Device not found or disabled'}
+                continue
+            row, needs_full = build_agent_row(device_id, sample, pending)
+            rows.append(row)
+            if needs_full:
+                resync.add(device_id)
+            results[index] = {'index': index, 'device_id': device_id, 'success': True}
+        
+        # The whole batch is queued or pushed back together
+        fresh = sequences.admit(rows, ingest_queue.offer)
+        if fresh is None:
+            return queue_full_response()
+        delta_state.commit(pending)
+        remember_rows([row for row, is_fresh in zip(rows, fresh) if is_fresh])
+        accepted_results = [result for result in results if result['success']]
+        for result, is_fresh in zip(accepted_results, fresh):
+            if not is_fresh:
+                result['duplicate'] = True
+        
+        accepted = len(rows)
+        return jsonify({
+            'success': accepted > 0,
+            'accepted': accepted,
+            'duplicates': fresh.count(False),
+            'rejected': len(samples) - accepted,
+            'resync': sorted(resync),
+            'results': results
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ingest/stats')
+def api_ingest_stats():
+    """Ingest queue depth and group-commit latency"""
+    return jsonify(dict(ingest_queue.get_stats(), sequences=sequences.get_stats(), deltas=delta_state.get_stats()))
+
+@app.route('/api/ssh/stats')
+def api_ssh_stats():
+    """SSH connection pool usage"""
+    return jsonify(ssh_pool.get_stats())
+
+@app.route('/api/poller/stats')
+def api_poller_stats():
+    """Poll scheduler lag, queue depth and per-device poll durations"""
+    return jsonify(poller.get_stats())
+
+@app.route('/api/discovery/stats')
+def api_discovery_stats():
+    """Probe, host and reverse-DNS cache counters for network discovery"""
+    return jsonify(discovery.get_stats())
+
+@app.route('/api/reachability/stats')
+def api_reachability_stats():
+    """Probe cycle duration and reachable/unreachable counts"""
+    return jsonify(reachability.get_stats())
+
+@app.route('/api/rollout/stats')
+def api_rollout_stats():
+    """Agent rollout queue, retry and upload counters"""
+    return jsonify(rollouts.get_stats())
+
+@app.route('/api/live/stats')
+def api_live_stats():
+    """Live stream clients and coalescing counters"""
+    return jsonify(live.get_stats())
+
+@app.route('/api/devices/stats')
+def api_device_list_stats():
+    """Versioning and delta counters for /api/devices"""
+    return jsonify(device_changes.get_stats())
+
+@app.route('/api/prometheus/stats')
+def api_prometheus_stats():
+    """Prometheus query cache, coalescing and stale-fallback counters"""
+    return jsonify(prometheus.get_stats())
+
+@app.route('/api/exporter/stats')
+def api_exporter_stats():
+    """/metrics render time, size and cache counters"""
+    return jsonify(exporter.get_stats())
+
+@app.route('/api/vms/stats')
+def api_vm_inventory_stats():
+    """VirtualBox inventory refresh counters"""
+    return jsonify(vbox_inventory.get_stats())
+
+@app.route('/api/rollups/stats')
+def api_rollup_stats():
+    """Rollup watermark and retention counters"""
+    return jsonify(rollups.stats)
+
 if __name__ == '__main__':
-    init_db()
+    # debug=True runs this file twice: a reloader process that only watches for changes, and the
+    # server as its child with WERKZEUG_RUN_MAIN set. Background services start in the server alone,
+    # or every poll, probe and resumed install would happen twice.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_db()
+        ingest_queue.start()
+        rollups.start()
+        poller.start()
+        reachability.start()
+        rollouts.start()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,19 @@
+"""
+Throwaway working directory for benchmarks that import app.py.
+
+app.py opens "devices.db" relative to the working directory, so a benchmark
+run from the repo would read and fill the real database. Call enter()
+before importing app.
+"""
+
+import os
+import sys
+import tempfile
+
+
+def enter(repo_dir):
+    """Put repo_dir on sys.path and change into a fresh temporary directory, which is returned"""
+    sys.path.insert(0, os.path.abspath(repo_dir))
+    workdir = tempfile.mkdtemp(prefix='netmon-bench-')
+    os.chdir(workdir)
+    return workdir
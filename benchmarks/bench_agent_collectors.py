@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Agent collection cost per report: every collector on every report against
+the default collector schedule in agent_collectors.py.
+
+Runs LinuxMonitoringAgent.get_system_metrics for C reports twice, once
+with every collector's interval at 0 (what the agent used to do) and once
+with the default schedule. The clock is advanced by the report interval
+between calls, so rarely run collectors come due as they would over C
+real reports without waiting for them. Reports wall time per report, CPU
+time per report, and each collector's runs and cost.
+
+Usage: python3 benchmarks/bench_agent_collectors.py [repo_dir] [--reports 2000] [--report 30]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--reports', type=int, default=2000)
+    parser.add_argument('--report', type=float, default=30.0, help='seconds between reports')
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.abspath(args.repo_dir))
+
+    import agent_collectors
+    from monitoring_agent_linux import LinuxMonitoringAgent
+
+    real_monotonic = time.monotonic
+    print(f"{args.reports} reports, {args.report:g} s apart")
+    print(f"{'schedule':10s} {'wall ms/report':>15s} {'cpu ms/report':>14s}")
+    results = {}
+    every = {name: 0 for name in agent_collectors.standard_collectors(None, '/')}
+    every['load'] = 0
+    for schedule, intervals in (('every', every), ('default', None)):
+        agent = LinuxMonitoringAgent('http://127.0.0.1:9', 1, spool_dir=tempfile.mkdtemp(prefix='netmon-bench-'),
+                                     collector_intervals=intervals)
+        agent.collectors.sampler = None     # the sampler thread is never started; leave it out of the stats
+        agent.collectors.stats_at = float('inf')
+        offset = 0.0
+        # Collectors schedule on time.monotonic(); shift it by one report interval per call
+        agent_collectors.time.monotonic = lambda: real_monotonic() + offset
+        try:
+            wall = cpu = 0.0
+            for _ in range(args.reports):
+                started, started_cpu = time.perf_counter(), time.process_time()
+                agent.get_system_metrics()
+                wall += time.perf_counter() - started
+                cpu += time.process_time() - started_cpu
+                offset += args.report
+        finally:
+            agent_collectors.time.monotonic = real_monotonic
+        results[schedule] = agent.collectors.get_stats()
+        print(f"{schedule:10s} {wall * 1000 / args.reports:15.3f} {cpu * 1000 / args.reports:14.3f}")
+
+    print(f"{'collector':12s} {'interval':>9s} {'runs every/default':>19s} {'avg ms':>8s} {'total ms every/default':>23s}")
+    for name, stats in results['default'].items():
+        every = results['every'][name]
+        print(f"{name:12s} {stats['interval']:9g} {every['runs']:9d}/{stats['runs']:<9d} {every['avg_ms']:8.3f} "
+              f"{every['total_ms']:11.1f}/{stats['total_ms']:<11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Delta reporting on a mostly idle fleet: bytes sent, history rows written,
+and whether the dashboard rebuilds the same state.
+
+Simulates N devices over C collection cycles. Most devices idle, with CPU
+and memory jittering inside the deadbands and counters creeping up. A
+configurable share are busy and move every cycle. Each cycle's samples
+are posted to the batch route through app.py's test client, once as full
+samples and once through agent_delta.DeltaEncoder, in JSON and compact
+encodings. Reports bytes per sample on the wire, rows added to
+device_metrics, and how far device_latest after the delta run is from
+the full run, field by field, against the deadbands.
+
+Usage: python3 benchmarks/bench_agent_delta.py [repo_dir] [--devices 1000] [--cycles 40] [--busy 0.05]
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+import app_sandbox
+
+
+def simulate(devices, cycles, busy_share, seed=1):
+    """[[sample per device] per cycle], 30 s apart"""
+    rng = random.Random(seed)
+    start = time.time() - cycles * 30
+    state = {}
+    for device_id in range(1, devices + 1):
+        state[device_id] = {
+            'busy': rng.random() < busy_share, 'cpu': rng.uniform(1, 10), 'memory': rng.uniform(20, 60),
+            'sent': rng.randint(2 ** 30, 2 ** 36), 'recv': rng.randint(2 ** 30, 2 ** 36),
+            'uptime': rng.randint(86400, 86400 * 90)
+        }
+    history = []
+    for cycle in range(cycles):
+        ts = start + cycle * 30
+        samples = []
+        for device_id, device in state.items():
+            scale = 25 if device['busy'] else 0.5
+            device['sent'] += int(rng.expovariate(1 / (50e6 if device['busy'] else 20e3)))
+            device['recv'] += int(rng.expovariate(1 / (80e6 if device['busy'] else 30e3)))
+            seconds = device['uptime'] + cycle * 30
+            samples.append({
+                'device_id': device_id,
+                'hostname': f'host-{device_id:05d}.example.net',
+                'timestamp': datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+                'cpu_usage': round(max(0.0, min(100.0, device['cpu'] + rng.uniform(-scale, scale))), 1),
+                'cpu_count': 8,
+                'load_average': round(device['cpu'] / 25, 2),
+                'memory_usage': round(device['memory'] + rng.uniform(-scale / 2, scale / 2), 1),
+                'memory_total': 16 * 2 ** 30,
+                'disk_usage': 42.0,
+                'disk_total': 512 * 2 ** 30,
+                'network_bytes_sent': device['sent'],
+                'network_bytes_recv': device['recv'],
+                'uptime': f"{seconds // 86400}d {seconds % 86400 // 3600}h {seconds % 3600 // 60}m",
+                'uptime_seconds': seconds,
+                'platform': 'Linux-6.1.0-18-amd64-x86_64-with-glibc2.36',
+                'status': 'healthy'
+            })
+        history.append(samples)
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--cycles', type=int, default=40)
+    parser.add_argument('--busy', type=float, default=0.05, help='share of devices that move every cycle')
+    args = parser.parse_args()
+
+    app_sandbox.enter(args.repo_dir)
+
+    import agent_codec
+    import agent_delta
+    import app
+
+    app.init_db()
+    with app.db.writer() as conn:
+        conn.executemany('INSERT INTO devices (name, ip_address, device_type) VALUES (?, ?, ?)',
+                         [(f'bench-{i}', f'10.{i // 65536}.{i // 256 % 256}.{i % 256}', 'server')
+                          for i in range(args.devices * 2)])
+    app.ingest_queue.max_depth = args.devices * args.cycles * 2
+    app.ingest_queue.start()
+    client = app.app.test_client()
+    history = simulate(args.devices, args.cycles, args.busy)
+
+    print(f"{args.devices} devices ({args.busy:.0%} busy) x {args.cycles} cycles")
+    print(f"{'mode':8s} {'json B/sample':>14s} {'compact+gzip B/sample':>22s} {'history rows':>13s} {'post ms/cycle':>14s}")
+    latest = {}
+    for mode, offset in (('full', 0), ('delta', args.devices)):
+        encoders = {device_id: agent_delta.DeltaEncoder() for device_id in range(1, args.devices + 1)}
+        json_bytes = compact_bytes = 0
+        rows_before = app.db.query_one('SELECT COUNT(*) FROM device_metrics')[0]
+        elapsed = 0.0
+        for cycle, samples in enumerate(history):
+            batch = []
+            for sample in samples:
+                sample = dict(sample, device_id=sample['device_id'] + offset)
+                if mode == 'delta':
+                    sample = encoders[sample['device_id'] - offset].encode(sample)
+                sample['seq'] = cycle + 1
+                batch.append(sample)
+            json_bytes += len(agent_codec.encode_request({'samples': batch})[0])
+            body, headers = agent_codec.encode_request({'samples': batch}, agent_codec.CONTENT_TYPE, 'gzip')
+            compact_bytes += len(body)
+            started = time.perf_counter()
+            response = client.post('/api/metrics/submit/batch', data=body, headers=headers)
+            elapsed += time.perf_counter() - started
+            assert response.status_code == 202, response.get_data(as_text=True)
+        app.ingest_queue.close()
+        app.ingest_queue.start()
+        rows = app.db.query_one('SELECT COUNT(*) FROM device_metrics')[0] - rows_before
+        latest[mode] = {row[0] - offset: row[1:] for row in app.db.query(
+            'SELECT device_id, status, cpu_usage, memory_usage, disk_usage, network_in, network_out, uptime, '
+            'load_average FROM device_latest WHERE device_id > ? AND device_id <= ?',
+            (offset, offset + args.devices))}
+        total = args.devices * args.cycles
+        print(f"{mode:8s} {json_bytes / total:14.0f} {compact_bytes / total:22.1f} {rows:13d} "
+              f"{elapsed * 1000 / args.cycles:14.1f}")
+
+    # Rebuilt state may lag the real values by less than a deadband, and must match exactly otherwise
+    columns = ('status', 'cpu_usage', 'memory_usage', 'disk_usage', 'network_bytes_recv', 'network_bytes_sent',
+               'uptime', 'load_average')
+    print("device_latest after the delta run against the full run:")
+    for index, column in enumerate(columns):
+        band = agent_delta.DEADBANDS.get(column)
+        if band is None:
+            exact = sum(1 for device_id, row in latest['full'].items() if latest['delta'][device_id][index] == row[index])
+            print(f"  {column:20s} {exact}/{args.devices} identical")
+        else:
+            worst = max(abs(latest['delta'][device_id][index] - row[index]) for device_id, row in latest['full'].items())
+            print(f"  {column:20s} max deviation {worst:g} (deadband {band:g}) -> {'OK' if worst < band else 'OUTSIDE'}")
+    print(f"dashboard delta state: {app.delta_state.get_stats()}")
+    app.ingest_queue.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Agent payload encodings: bytes on the wire and server decode cost.
+
+Builds N samples shaped like monitoring_agent_linux.py's (hostname,
+platform string, ISO timestamp and all) and encodes them the ways an agent
+can send them: JSON as today, compact, each optionally gzip or zstd
+compressed. Reports wire bytes per sample when every sample is posted on
+its own and when they go in batches, the time agent_codec.decode_request
+takes per 10k samples, and the time the batch route takes end to end
+through app.py's test client.
+
+Usage: python3 benchmarks/bench_agent_encoding.py [repo_dir] [--samples 10000] [--batch 100] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+import app_sandbox
+
+
+def make_sample(device_id):
+    return {
+        'device_id': str(device_id),
+        'hostname': f'web-{device_id:05d}.prod.example.net',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'cpu_usage': round(random.uniform(0, 100), 1),
+        'cpu_count': 8,
+        'load_average': round(random.uniform(0, 4), 2),
+        'memory_usage': round(random.uniform(10, 95), 1),
+        'memory_total': 16 * 2 ** 30,
+        'memory_available': random.randint(2 ** 30, 15 * 2 ** 30),
+        'swap_usage': round(random.uniform(0, 20), 1),
+        'disk_usage': round(random.uniform(10, 90), 1),
+        'disk_total': 512 * 2 ** 30,
+        'disk_free': random.randint(2 ** 34, 2 ** 38),
+        'disk_read_bytes': random.randint(2 ** 30, 2 ** 40),
+        'disk_write_bytes': random.randint(2 ** 30, 2 ** 40),
+        'network_bytes_sent': random.randint(2 ** 30, 2 ** 40),
+        'network_bytes_recv': random.randint(2 ** 30, 2 ** 40),
+        'network_packets_sent': random.randint(2 ** 20, 2 ** 32),
+        'network_packets_recv': random.randint(2 ** 20, 2 ** 32),
+        'uptime': '15d 5h 12m',
+        'uptime_seconds': 1314720 + device_id,
+        'platform': 'Linux-6.1.0-18-amd64-x86_64-with-glibc2.36',
+        'status': 'healthy'
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app_sandbox.enter(args.repo_dir)
+
+    import agent_codec
+    import app
+
+    app.init_db()
+    with app.db.writer() as conn:
+        conn.executemany('INSERT INTO devices (name, ip_address, device_type) VALUES (?, ?, ?)',
+                         [(f'bench-{i}', f'10.0.{i // 256}.{i % 256}', 'server') for i in range(args.devices)])
+    app.ingest_queue.max_depth = args.samples * 2
+    client = app.app.test_client()
+
+    samples = [make_sample(i % args.devices + 1) for i in range(args.samples)]
+    batches = [{'samples': samples[i:i + args.batch]} for i in range(0, len(samples), args.batch)]
+    formats = [(agent_codec.JSON_CONTENT_TYPE, None), (agent_codec.JSON_CONTENT_TYPE, 'gzip'),
+               (agent_codec.CONTENT_TYPE, None), (agent_codec.CONTENT_TYPE, 'gzip')]
+    if 'zstd' in agent_codec.compressions():
+        formats += [(agent_codec.JSON_CONTENT_TYPE, 'zstd'), (agent_codec.CONTENT_TYPE, 'zstd')]
+    scale = 10000 / args.samples
+
+    print(f"{args.samples} samples; batches of {args.batch}; times are per 10k samples")
+    print(f"{'format':24s} {'single B/sample':>16s} {'batched B/sample':>17s} {'decode ms':>10s} {'route ms':>9s}")
+    for content_type, compression in formats:
+        single = sum(len(agent_codec.encode_request(sample, content_type, compression)[0]) for sample in samples)
+        bodies = [agent_codec.encode_request(batch, content_type, compression) for batch in batches]
+        batched = sum(len(body) for body, _ in bodies)
+
+        # Best of a few runs; one noisy core otherwise swamps the differences
+        decode = route = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for body, headers in bodies:
+                agent_codec.decode_request(body, headers['Content-Type'], headers.get('Content-Encoding'))
+            decode = min(decode, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for body, headers in bodies:
+                response = client.post('/api/metrics/submit/batch', data=body, headers=headers)
+                assert response.status_code == 202, response.get_data(as_text=True)
+            route = min(route, time.perf_counter() - started)
+            app.ingest_queue._rows.clear()
+
+        name = ('compact' if content_type == agent_codec.CONTENT_TYPE else 'json') + (f'+{compression}' if compression else '')
+        print(f"{name:24s} {single / args.samples:16.0f} {batched / args.samples:17.0f} "
+              f"{decode * scale * 1000:10.1f} {route * scale * 1000:9.1f}")
+
+    response = client.post('/api/metrics/submit', json=samples[0])
+    print(f"plain JSON still accepted: {response.status_code}; "
+          f"unknown type: {client.post('/api/metrics/submit', data=b'x', content_type='text/plain').status_code}; "
+          f"formats: {client.get('/api/metrics/formats').get_json()}")
+
+
+if __name__ == '__main__':
+    main()
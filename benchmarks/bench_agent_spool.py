@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Agent spool: samples kept through an outage, replay pace, duplicate drops.
+
+Starts app.py on a local port against a throwaway database and creates N
+Linux agents, each with its own spool directory. Every agent takes M
+samples while the dashboard is down, then the dashboard comes back and the
+agents replay their backlogs, once with the replay rate limit and once
+without it. Reports samples stored against samples taken, the peak rate
+of samples reaching the dashboard in any second, and how long the
+replay took. A copy of one agent's spool is then replayed a second time to
+check that the dashboard drops every resent sample.
+
+Usage: python3 benchmarks/bench_agent_spool.py [repo_dir] [--agents 20] [--samples 2000] [--replay-rate 200]
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+from werkzeug.serving import make_server
+
+import app_sandbox
+
+
+def make_sample(device_id, n):
+    return {
+        'device_id': device_id,
+        'timestamp': datetime.fromtimestamp(time.time() - 30 * n, timezone.utc).isoformat(),
+        'cpu_usage': n % 100,
+        'memory_usage': 50.0,
+        'disk_usage': 40.0,
+        'network_bytes_sent': n * 1000,
+        'network_bytes_recv': n * 2000,
+        'uptime_seconds': 86400 + n,
+        'status': 'healthy'
+    }
+
+
+def serve(app, port):
+    """Start the dashboard on `port`; returns the server, stopped with shutdown() and server_close()"""
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def replay(app, agents):
+    """Drain every agent's spool; returns (seconds, peak samples/s over one-second windows)"""
+    peak = [0.0]
+    done = threading.Event()
+
+    def watch():
+        last = app.ingest_queue.get_stats()['enqueued']
+        while not done.wait(1):
+            now = app.ingest_queue.get_stats()['enqueued']
+            peak[0] = max(peak[0], now - last)
+            last = now
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    started = time.monotonic()
+    while any(agent.spool.pending() for agent in agents):
+        for agent in agents:
+            agent.drain_spool()
+        time.sleep(0.01)
+    elapsed = time.monotonic() - started
+    done.set()
+    watcher.join()
+    return elapsed, peak[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=2000, help='samples each agent takes during the outage')
+    parser.add_argument('--replay-rate', type=float, default=200, help='samples per second per agent')
+    args = parser.parse_args()
+
+    workdir = app_sandbox.enter(args.repo_dir)
+
+    import app
+    from monitoring_agent_linux import LinuxMonitoringAgent
+
+    app.init_db()
+    with app.db.writer() as conn:
+        conn.executemany('INSERT INTO devices (name, ip_address, device_type) VALUES (?, ?, ?)',
+                         [(f'bench-{i}', f'10.0.{i // 256}.{i % 256}', 'server') for i in range(args.agents * 2)])
+    app.ingest_queue.start()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    quiet = contextlib.redirect_stdout(io.StringIO())    # agents print a line per send
+
+    # A port with nothing listening until the outage ends, so agents see connections refused
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    url = f'http://127.0.0.1:{port}'
+
+    for label, rate in (('rate-limited', args.replay_rate), ('unlimited', float('inf'))):
+        offset = 0 if label == 'rate-limited' else args.agents
+        agents = []
+        for i in range(args.agents):
+            agent = LinuxMonitoringAgent(url, offset + i + 1, spool_dir=os.path.join(workdir, f'spool-{offset + i}'))
+            agent.interval = 1          # backoff base, so the bench does not wait out real intervals
+            agent.replay_rate = rate
+            agents.append(agent)
+
+        # Outage: nothing is listening yet, so every sample lands in the spool
+        started = time.perf_counter()
+        with quiet:
+            for n in range(args.samples):
+                for agent in agents:
+                    agent.send_metrics(make_sample(agent.device_id, args.samples - n))
+        spooled = sum(agent.spool.pending() for agent in agents)
+        append_ms = (time.perf_counter() - started) * 1000 / (args.samples * args.agents)
+
+        server = serve(app, port)
+        before = app.ingest_queue.get_stats()['enqueued']
+        with quiet:
+            elapsed, peak = replay(app, agents)
+        stored = app.ingest_queue.get_stats()['enqueued'] - before
+        server.shutdown()
+        server.server_close()
+
+        print(f"{label}: {args.agents} agents x {args.samples} samples, {append_ms:.2f} ms per spooled sample; "
+              f"{spooled} spooled, {stored} stored in {elapsed:.1f} s, peak {peak:.0f} samples/s")
+
+    # Resend a spool the dashboard has already taken, as after lost responses
+    copy = os.path.join(workdir, 'spool-resend')
+    shutil.copytree(os.path.join(workdir, 'spool-0'), copy)
+    os.remove(os.path.join(copy, 'position.json'))
+    resender = LinuxMonitoringAgent(url, 1, spool_dir=copy)
+    server = serve(app, port)
+    before = app.sequences.get_stats()['duplicates']
+    pending = resender.spool.pending()
+    with quiet:
+        replay(app, [resender])
+    server.shutdown()
+    app.ingest_queue.close()
+    rows = app.db.query_one('SELECT COUNT(*) FROM device_metrics WHERE device_id = 1')[0]
+    print(f"resent {pending} spooled samples (kept segments only): "
+          f"{app.sequences.get_stats()['duplicates'] - before} dropped as duplicates, device 1 has {rows} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+One dashboard refresh cycle: per-device fetches vs. /api/dashboard/snapshot.
+
+Runs app.py in a threaded werkzeug server against a throwaway database with
+N devices reporting through the agent API, then has T browser tabs refresh
+at once. The old cycle is /api/devices plus /api/device/<id>/metrics per
+device; the new one is a single snapshot request.
+
+Usage: python3 benchmarks/bench_dashboard_snapshot.py [repo_dir] [--devices 300] [--tabs 10]
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import app_sandbox
+
+warnings.filterwarnings('ignore')
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+
+def old_cycle(session, base_url):
+    devices = session.get(f'{base_url}/api/devices').json()
+    for device in devices:
+        session.get(f"{base_url}/api/device/{device['id']}/metrics").json()
+    return 1 + len(devices)
+
+
+def new_cycle(session, base_url):
+    session.get(f'{base_url}/api/dashboard/snapshot').json()
+    return 1
+
+
+def run(cycle, base_url, tabs):
+    sessions = [requests.Session() for _ in range(tabs)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(tabs) as pool:
+        counts = list(pool.map(lambda session: cycle(session, base_url), sessions))
+    return time.perf_counter() - started, sum(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--devices', type=int, default=300)
+    parser.add_argument('--tabs', type=int, default=10)
+    args = parser.parse_args()
+
+    app_sandbox.enter(args.repo_dir)
+
+    import app
+    from werkzeug.serving import make_server
+
+    app.init_db()
+    client = app.app.test_client()
+    for i in range(args.devices):
+        client.post('/api/devices/add', json={
+            'name': f'bench-{i}', 'ip_address': f'10.{i // 65536}.{i // 256 % 256}.{i % 256}',
+            'device_type': 'server'
+        })
+    client.post('/api/metrics/submit/batch', json={'samples': [
+        {'device_id': i + 1, 'status': 'healthy', 'cpu_usage': 10.0, 'memory_usage': 20.0, 'response_time': 5}
+        for i in range(args.devices)
+    ]})
+
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    print(f"{args.devices} devices, {args.tabs} tabs refreshing at once")
+    for name, cycle in (('per-device fetches', old_cycle), ('snapshot', new_cycle)):
+        elapsed, count = run(cycle, base_url, args.tabs)
+        print(f"{name:20s} {count:6d} requests  {elapsed * 1000:8.1f} ms for the cycle")
+
+    size = len(requests.get(f'{base_url}/api/dashboard/snapshot').content)
+    etag = requests.get(f'{base_url}/api/dashboard/snapshot').headers['ETag']
+    status = requests.get(f'{base_url}/api/dashboard/snapshot', headers={'If-None-Match': etag}).status_code
+    print(f"snapshot body {size / 1024:.1f} KiB, revalidation within the TTL -> {status}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Many viewers polling /api/devices while a small share of the fleet changes.
+
+Runs app.py in a threaded werkzeug server against a throwaway database with
+N devices on loopback addresses. Each round, C devices submit a new sample
+and the reachability prober runs a cycle over the whole fleet, as it does
+every 15 s in production, moving every device's RTT. Then V viewers poll
+the list three ways: a plain GET of the full list (the old behaviour), a GET
+revalidated with If-None-Match, and a ?since=<version> delta that the
+viewer applies to its own copy. Reports bytes and time per round for each,
+and checks that the delta-maintained copies end up equal to the full list
+apart from the probe measurements, which do not version a record.
+
+Usage: python3 benchmarks/bench_device_deltas.py [repo_dir] [--devices 2000] [--viewers 50] [--changes 20] [--rounds 5] [--no-probe]
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import app_sandbox
+
+warnings.filterwarnings('ignore')
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+
+class Viewer:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.etag = None
+        self.version = None
+        self.devices = {}
+
+    def full(self):
+        response = self.session.get(f'{self.base_url}/api/devices')
+        response.json()
+        return len(response.content)
+
+    def revalidate(self):
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        response = self.session.get(f'{self.base_url}/api/devices', headers=headers)
+        if response.status_code == 200:
+            self.etag = response.headers['ETag']
+            response.json()
+        return len(response.content)
+
+    def delta(self):
+        params = {'since': self.version} if self.version is not None else {}
+        response = self.session.get(f'{self.base_url}/api/devices', params=params)
+        data = response.json()
+        if isinstance(data, list):
+            data = {'version': max(device['version'] for device in data), 'full': True, 'devices': data,
+                    'removed': []}
+        if data['full']:
+            self.devices = {}
+        for device in data['devices']:
+            self.devices[device['id']] = device
+        for device_id in data['removed']:
+            self.devices.pop(device_id, None)
+        self.version = data['version']
+        return len(response.content)
+
+
+def poll(viewers, method):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(viewers)) as pool:
+        sizes = list(pool.map(lambda viewer: getattr(viewer, method)(), viewers))
+    return time.perf_counter() - started, sum(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--viewers', type=int, default=50)
+    parser.add_argument('--changes', type=int, default=20, help='devices changing between polls')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--no-probe', action='store_true', help='skip the reachability cycle each round')
+    args = parser.parse_args()
+
+    app_sandbox.enter(args.repo_dir)
+
+    import app
+    from werkzeug.serving import make_server
+
+    app.init_db()
+    client = app.app.test_client()
+    for i in range(args.devices):
+        client.post('/api/devices/add', json={
+            'name': f'bench-{i}', 'ip_address': f'127.1.{i // 250}.{i % 250 + 1}',
+            'device_type': 'server'
+        })
+
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    viewers = [Viewer(base_url) for _ in range(args.viewers)]
+    for viewer in viewers:
+        viewer.revalidate()
+        viewer.delta()
+
+    totals = {'full': [0.0, 0], 'revalidate': [0.0, 0], 'delta': [0.0, 0]}
+    quiet = {}
+    for round_number in range(args.rounds):
+        first = round_number * args.changes % args.devices
+        client.post('/api/metrics/submit/batch', json={'samples': [
+            {'device_id': (first + i) % args.devices + 1, 'status': 'warning', 'response_time': round_number + 1}
+            for i in range(args.changes)
+        ]})
+        if round_number == args.rounds - 1:
+            client.delete(f'/api/devices/{args.devices}')
+        if not args.no_probe:
+            app.reachability.run_cycle()
+        time.sleep(app.DEVICES_TTL)
+        for method in totals:
+            elapsed, size = poll(viewers, method)
+            totals[method][0] += elapsed
+            totals[method][1] += size
+    for method in totals:
+        quiet[method] = poll(viewers, method)
+
+    print(f"{args.devices} devices, {args.viewers} viewers, {args.changes} devices changing per round, "
+          f"{args.rounds} rounds, {'no probes' if args.no_probe else 'a probe cycle per round'}")
+    for method, (elapsed, size) in totals.items():
+        print(f"{method:12s} {size / args.rounds / 1024:10.1f} KiB/round  {elapsed / args.rounds * 1000:8.1f} ms/round"
+              f"   nothing changed: {quiet[method][1] / 1024:8.1f} KiB  {quiet[method][0] * 1000:6.1f} ms")
+
+    def stable(devices):
+        # Probe measurements are served but do not version a record, so deltas do not carry them
+        return {device_id: {field: value for field, value in device.items() if field not in app.DEVICE_VOLATILE_FIELDS}
+                for device_id, device in devices.items()}
+
+    expected = {device['id']: device for device in requests.get(f'{base_url}/api/devices').json()}
+    consistent = sum(1 for viewer in viewers if stable(viewer.devices) == stable(expected))
+    print(f"delta copies equal to the full list (probe measurements aside): {consistent}/{args.viewers}")
+    print(f"probe measurements served: {'response_time' in next(iter(expected.values()))}")
+    print(f"password exposed: {'password' in next(iter(expected.values()))}")
+    print(f"change log: {app.device_changes.get_stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
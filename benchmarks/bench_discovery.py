@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Sweep rate of the asyncio discovery engine against a loopback stand-in range.
+
+Every 127.x.y.z address answers on Linux, so the stand-in is a set of TCP
+listeners bound to a few addresses inside a 127.0.0.0/N range: those hosts
+must come back with their ports open, every other address with the ports
+refused. The sweep rate is extrapolated to a /16.
+
+Usage: python3 benchmarks/bench_discovery.py [--prefix 20] [--listeners 16] [--resolve]
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from discovery import DiscoveryEngine
+
+PORTS = (22, 80, 443, 9100)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefix', type=int, default=20, help='sweep 127.0.0.0/PREFIX')
+    parser.add_argument('--listeners', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=1024)
+    parser.add_argument('--resolve', action='store_true', help='also reverse-resolve every live host')
+    args = parser.parse_args()
+
+    network = ipaddress.ip_network(f'127.0.0.0/{args.prefix}')
+    hosts = list(network.hosts())
+    expected = {}
+    listeners = []
+    for address in random.sample(hosts[1:], args.listeners):
+        port = random.choice(PORTS)
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((str(address), port))
+        sock.listen(128)
+        listeners.append(sock)
+        expected[str(address)] = [port]
+
+    engine = DiscoveryEngine(ports=PORTS, max_concurrency=args.concurrency, subnet_rate=100000,
+                             resolve_hostnames=args.resolve)
+    started = time.perf_counter()
+    job = engine.start(str(network))
+    job.future.result()
+    elapsed = time.perf_counter() - started
+
+    found = {d['ip']: d['ports'] for d in job.devices if d['ports']}
+    stats = engine.get_stats()
+    rate = job.scanned / elapsed
+    print(f"{network}: {job.scanned} addresses x {len(PORTS)} ports in {elapsed:.2f}s "
+          f"({rate:.0f} hosts/s, {stats['probes'] / elapsed:.0f} probes/s, icmp={stats['icmp']})")
+    print(f"open hosts found {len(found)}/{len(expected)}, correct={found == expected}")
+    print(f"extrapolated /16 sweep: {65534 / rate:.0f}s")
+
+    engine.close()
+    for sock in listeners:
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
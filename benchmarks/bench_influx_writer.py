@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Throughput and outage behaviour of the batched InfluxDB line protocol writer.
+
+Runs against a local /api/v2/write stand-in (see influx_standin.py):
+
+1. one POST per point, as monitor.py used to do, for a baseline;
+2. the batched writer with the same points;
+3. an outage: the stand-in answers 503 while points keep arriving, so the
+   writer spills to its on-disk spool, then recovers and replays it. Every
+   point must arrive exactly once.
+
+Usage: python3 benchmarks/bench_influx_writer.py [--points N] [--baseline-points N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import requests
+
+from influx_standin import InfluxStandIn
+from influx_writer import LineProtocolWriter, encode_line
+
+
+def make_lines(count, offset=0):
+    now = 1700000000
+    return [encode_line('device_status', {'device': f'device-{n % 10000}', 'ip': f'10.0.{n // 256 % 256}.{n % 256}'},
+                        {'status': 1, 'response_time': 12.5, 'jitter': 0.4, 'packet_loss': 0.0}, now + n)
+            for n in range(offset, offset + count)]
+
+
+def wait_for(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return predicate()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--baseline-points', type=int, default=2000)
+    args = parser.parse_args()
+
+    server = InfluxStandIn()
+
+    lines = make_lines(args.baseline_points)
+    session = requests.Session()
+    started = time.perf_counter()
+    for line in lines:
+        session.post(server.url + '/api/v2/write', params={'org': 'o', 'bucket': 'b', 'precision': 's'}, data=line)
+    elapsed = time.perf_counter() - started
+    print(f"one POST per point:  {len(lines) / elapsed:9.0f} points/s ({len(lines)} points)")
+
+    spool_dir = tempfile.mkdtemp()
+    writer = LineProtocolWriter(server.url, 'o', 'b', flush_interval=0.2, max_retries=1, max_backoff=0.1,
+                                spool_dir=spool_dir)
+    server.lines.clear()
+    requests_before = server.requests
+    lines = make_lines(args.points)
+    started = time.perf_counter()
+    for start in range(0, len(lines), 1000):
+        writer.write(lines[start:start + 1000])
+    wait_for(lambda: len(server.lines) >= len(lines))
+    elapsed = time.perf_counter() - started
+    print(f"batched writer:      {len(lines) / elapsed:9.0f} points/s ({len(lines)} points, "
+          f"{server.requests - requests_before} requests, spilled {writer.get_stats()['spilled']})")
+
+    server.lines.clear()
+    server.failing = True
+    outage = make_lines(args.points, offset=args.points)
+    for start in range(0, len(outage), 1000):
+        writer.write(outage[start:start + 1000])
+        time.sleep(0.001)
+    wait_for(lambda: writer.buffered() == 0, 30)
+    stats = writer.get_stats()
+    print(f"during outage:       buffered {stats['buffered']}, spilled {stats['spilled']}, "
+          f"spool {stats['spool_bytes'] / 1024:.0f} KiB")
+
+    server.failing = False
+    started = time.perf_counter()
+    writer.write(make_lines(1, offset=2 * args.points))
+    wait_for(lambda: len(server.lines) >= len(outage) + 1)
+    elapsed = time.perf_counter() - started
+    received = server.lines
+    stats = writer.get_stats()
+    print(f"after recovery:      {len(received)} lines in {elapsed:.2f}s, unique {len(set(received))}, "
+          f"replayed {stats['replayed']}, spool {stats['spool_bytes']} bytes")
+    print(f"all outage points delivered once: {sorted(received) == sorted(outage + make_lines(1, offset=2 * args.points))}")
+
+    writer.close()
+    server.close()
+
+
+if __name__ == '__main__':
+    main()
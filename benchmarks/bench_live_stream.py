@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Fan-out of the SSE live stream to many dashboards.
+
+Starts a LiveHub on a free port and connects C clients to it, a few of which
+stop reading after the first event to play slow consumers. A publisher
+thread then updates every one of D devices R times a second, the way
+ingest does. Reports delivery latency measured on a sample of clients,
+events and bytes per client, how much was coalesced for the slow ones and
+whether they were dropped, and the thread count, which does not grow with C.
+
+Usage: python3 benchmarks/bench_live_stream.py [--clients 500] [--slow 20] [--devices 300] [--rate 1] [--seconds 45]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from live_stream import LiveHub
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Reader:
+    def __init__(self, measure):
+        self.measure = measure
+        self.events = 0
+        self.bytes = 0
+        self.latencies = []
+
+
+async def read_stream(port, reader_stats, slow):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    if slow:
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    writer.write(b'GET /api/stream HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n')
+    await reader.readuntil(b'\r\n\r\n')
+    try:
+        while True:
+            event = await reader.readuntil(b'\n\n')
+            reader_stats.events += 1
+            reader_stats.bytes += len(event)
+            if slow:
+                # Stop reading and let the server's buffers fill up
+                await asyncio.sleep(3600)
+            if reader_stats.measure and b'event: update' in event:
+                now = time.time()
+                data = json.loads(event.split(b'data: ', 1)[1])
+                reader_stats.latencies.extend(now - state['sent'] for state in data['devices'].values() if state)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+def publish(hub, devices, rate, seconds):
+    deadline = time.time() + seconds
+    n = 0
+    while time.time() < deadline:
+        started = time.time()
+        for device_id in range(1, devices + 1):
+            n += 1
+            hub.publish(device_id, {'status': 'healthy', 'cpu_usage': n % 100, 'sent': time.time()},
+                        (started, {'cpu_usage': n % 100}))
+        time.sleep(max(0.0, 1 / rate - (time.time() - started)))
+
+
+async def run(args):
+    hub = LiveHub(host='127.0.0.1', port=0, stall_timeout=args.stall)
+    hub.start()
+    readers = [Reader(measure=i < 20) for i in range(args.clients)]
+    slow = [Reader(measure=False) for _ in range(args.slow)]
+    tasks = [asyncio.create_task(read_stream(hub.port, r, False)) for r in readers]
+    tasks += [asyncio.create_task(read_stream(hub.port, r, True)) for r in slow]
+    while hub.get_stats()['clients'] < args.clients + args.slow:
+        await asyncio.sleep(0.05)
+    threads_before = threading.active_count()
+
+    publisher = threading.Thread(target=publish, args=(hub, args.devices, args.rate, args.seconds))
+    publisher.start()
+    while publisher.is_alive():
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(1)
+
+    stats = hub.get_stats()
+    latencies = [lat * 1000 for r in readers for lat in r.latencies]
+    print(f"{args.clients} clients + {args.slow} slow, {args.devices} devices x {args.rate}/s for {args.seconds}s")
+    print(f"threads: {threads_before} with every client connected (publisher adds 1)")
+    print(f"published {stats['published']}, changes {stats['changes']}, events written {stats['events']}")
+    print(f"per fast client: {sum(r.events for r in readers) / len(readers):.1f} events, "
+          f"{sum(r.bytes for r in readers) / len(readers) / 1024:.0f} KiB")
+    print(f"delivery latency (20 sampled clients): p50 {percentile(latencies, 50):.1f} ms, "
+          f"p95 {percentile(latencies, 95):.1f} ms, max {max(latencies, default=0):.1f} ms")
+    print(f"slow clients: coalesced {stats['coalesced']} states, dropped {stats['points_dropped']} points, "
+          f"{stats['stalled']}/{args.slow} disconnected after stalling")
+    hub.close()
+    for task in tasks:
+        task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--slow', type=int, default=20)
+    parser.add_argument('--devices', type=int, default=300)
+    parser.add_argument('--rate', type=float, default=1, help='updates per device per second')
+    parser.add_argument('--seconds', type=float, default=45)
+    parser.add_argument('--stall', type=float, default=5, help='stall_timeout for slow consumers')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+/metrics scrape time over a large fleet.
+
+Loads app.py against a throwaway database with N devices, fills the recent
+store with one sample per device and the reachability results with one
+probe per device, then scrapes /metrics repeatedly with the render cache
+disabled while a background thread keeps submitting agent samples. Reports
+scrape latency against a time budget, exposition size plain and gzipped,
+and how often device labels were loaded from SQLite. For comparison, the
+same device series are also rendered through prometheus_client sample
+objects.
+
+Usage: python3 benchmarks/bench_metrics_exporter.py [repo_dir] [--devices 10000] [--scrapes 20] [--budget 1.0]
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+import app_sandbox
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class ObjectCollector:
+    """The device series built as one prometheus_client sample per value"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def collect(self):
+        latest = self.app.recent.latest_rows()
+        for index, metric in enumerate(self.app.recent.metrics):
+            family = GaugeMetricFamily(f'netmon_device_{metric}', metric,
+                                       labels=['device_id', 'name', 'ip_address', 'device_type'])
+            for device_id, name, ip_address, device_type in self.app.load_exported_devices():
+                sample = latest.get(device_id)
+                if sample:
+                    family.add_metric([str(device_id), name, ip_address, device_type], sample[2][index])
+            yield family
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--devices', type=int, default=10000)
+    parser.add_argument('--scrapes', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds a scrape may take')
+    args = parser.parse_args()
+
+    app_sandbox.enter(args.repo_dir)
+
+    import app
+
+    app.init_db()
+    with app.db.writer() as conn:
+        conn.executemany('INSERT INTO devices (name, ip_address, device_type) VALUES (?, ?, ?)',
+                         [(f'bench-{i}', f'10.{i // 65536}.{i // 256 % 256}.{i % 256}', 'server')
+                          for i in range(args.devices)])
+    now = time.time()
+    for device_id in range(1, args.devices + 1):
+        app.recent.record(device_id, now, (random.uniform(0, 100), random.uniform(0, 100), 50.0, random.randint(1, 50),
+                                           0.5, 2.1e5, 8.4e4, 1.2e9, 3.4e8), status='healthy', uptime='1d 0h 0m')
+        app.reachability._results[device_id] = {'status': 'healthy', 'rtt_ms': 1.5, 'jitter_ms': 0.1, 'loss': 0.0}
+
+    stop = threading.Event()
+    submitted = [0]
+
+    def submit():
+        client = app.app.test_client()
+        while not stop.is_set():
+            first = random.randint(1, args.devices - 100)
+            client.post('/api/metrics/submit/batch', json={'samples': [
+                {'device_id': device_id, 'status': 'warning', 'cpu_usage': 90.0, 'response_time': 7}
+                for device_id in range(first, first + 100)
+            ]})
+            submitted[0] += 100
+
+    app.ingest_queue.start()
+    threading.Thread(target=submit, daemon=True).start()
+
+    client = app.app.test_client()
+    app.exporter.cache_ttl = 0
+    latencies = []
+    for _ in range(args.scrapes):
+        started = time.perf_counter()
+        response = client.get('/metrics')
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    size = len(response.data)
+    gzipped = len(client.get('/metrics', headers={'Accept-Encoding': 'gzip'}).data)
+    stop.set()
+
+    lines = response.data.decode().splitlines()
+    series = sum(1 for line in lines if line and not line.startswith('#'))
+    print(f"{args.devices} devices, {args.scrapes} uncached scrapes while {submitted[0]} samples were submitted")
+    print(f"scrape: p50 {percentile(latencies, 50) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms "
+          f"(budget {args.budget * 1000:.0f} ms) -> {'OK' if max(latencies) <= args.budget else 'OVER BUDGET'}")
+    print(f"exposition: {series} series, {size / 1048576:.2f} MiB plain, {gzipped / 1048576:.2f} MiB gzip")
+    print(f"exporter: {app.exporter.get_stats()}")
+    print(f"internals present: {[name for name in ('netmon_ingest_queue_depth', 'netmon_http_requests_total', 'netmon_poller_polls_total') if any(line.startswith(name) for line in lines)]}")
+
+    registry = CollectorRegistry()
+    registry.register(ObjectCollector(app))
+    started = time.perf_counter()
+    body = generate_latest(registry)
+    print(f"same device series as prometheus_client objects with labels on every series: "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms, {len(body) / 1048576:.2f} MiB")
+    app.ingest_queue.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Dashboard system metrics against a local Prometheus stand-in.
+
+V viewers ask for the system metrics at the same moment, several times:
+
+1. the naive pattern for comparison: one unpooled GET per metric per viewer;
+2. app.get_system_metrics through the cached client, once per cache TTL;
+3. the same with Prometheus answering slowly after the cache expired;
+4. the same with Prometheus failing, with a cached answer and without one.
+
+Reports upstream requests, connections opened and per-viewer latency.
+
+Usage: python3 benchmarks/bench_prometheus_query.py [--viewers 100] [--rounds 5] [--slow 2]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app_sandbox
+from prometheus_standin import PrometheusStandIn
+
+CANNED = {'cpu_usage': 37.25, 'memory_usage': 61.5, 'disk_usage': 44.0, 'network_in': 12.75,
+          'network_out': 3.5, 'uptime': 1314720, 'load_average': 1.234}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def burst(viewers, call):
+    def timed(_):
+        started = time.perf_counter()
+        result = call()
+        return time.perf_counter() - started, result
+    with ThreadPoolExecutor(viewers) as pool:
+        return list(pool.map(timed, range(viewers)))
+
+
+def report(name, standin, before, results):
+    latencies = [elapsed * 1000 for elapsed, _ in results]
+    answered = sum(1 for _, result in results if result is not None)
+    stale = sum(1 for _, result in results if result and result.get('stale'))
+    print(f"{name:28s} upstream {standin.requests - before[0]:4d}  connections {standin.connections - before[1]:4d}  "
+          f"p50 {percentile(latencies, 50):7.1f} ms  max {max(latencies):7.1f} ms  "
+          f"answered {answered}/{len(results)}, stale {stale}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--viewers', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--slow', type=float, default=2.0, help='seconds a slow Prometheus takes to answer')
+    args = parser.parse_args()
+
+    app_sandbox.enter(os.path.join(os.path.dirname(__file__), '..'))
+    import app
+    from prometheus_query import PrometheusClient
+
+    standin = PrometheusStandIn(CANNED, app.SYSTEM_QUERIES)
+    ttl = 1
+    app.SYSTEM_METRICS_TTL = ttl
+    app.prometheus = PrometheusClient(standin.url, ttl=ttl)
+    print(f"{args.viewers} viewers at once, {args.rounds} rounds")
+
+    def naive():
+        values = {}
+        for name, expression in app.SYSTEM_QUERIES.items():
+            body = requests.get(f'{standin.url}/api/v1/query', params={'query': expression}).json()
+            values[name] = float(body['data']['result'][0]['value'][1])
+        return values
+
+    before = (standin.requests, standin.connections)
+    results = []
+    for _ in range(args.rounds):
+        results += burst(args.viewers, naive)
+    report('naive, per-metric GETs', standin, before, results)
+
+    before = (standin.requests, standin.connections)
+    results = []
+    for _ in range(args.rounds):
+        results += burst(args.viewers, app.get_system_metrics)
+        time.sleep(ttl)
+    report('cached client', standin, before, results)
+    values = results[-1][1]
+    print(f"  values: { {name: values[name] for name in CANNED} }")
+
+    standin.delay = args.slow
+    before = (standin.requests, standin.connections)
+    results = burst(args.viewers, app.get_system_metrics)
+    report(f'Prometheus taking {args.slow:.0f}s', standin, before, results)
+    time.sleep(args.slow + ttl)
+    standin.delay = 0
+
+    standin.failing = True
+    before = (standin.requests, standin.connections)
+    results = []
+    for _ in range(args.rounds * 4):
+        results += burst(args.viewers, app.get_system_metrics)
+        time.sleep(ttl / 4)
+    report('Prometheus failing, cached', standin, before, results)
+
+    app.prometheus = PrometheusClient(standin.url, ttl=ttl)
+    before = (standin.requests, standin.connections)
+    results = burst(args.viewers, app.get_system_metrics)
+    report('Prometheus failing, cold', standin, before, results)
+    print(f"client stats: {app.prometheus.get_stats()}")
+    standin.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Cycle time of the reachability prober for a large fleet.
+
+Builds N devices (default 10k) on loopback addresses 127.1.x.y, with a TCP
+listener on one of them, plus optional dead devices in TEST-NET-2
+(198.51.100.0/24). Those are only dead if nothing on the local network
+answers for them; `ip route add blackhole 198.51.100.0/24` makes sure of it.
+Runs one probe cycle and reports its duration against the refresh interval.
+
+Usage: python3 benchmarks/bench_reachability.py [--devices N] [--dead N] [--probes 3]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from reachability import ReachabilityProber
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=10000)
+    parser.add_argument('--dead', type=int, default=0, help='devices in 198.51.100.0/24')
+    parser.add_argument('--probes', type=int, default=3)
+    parser.add_argument('--interval', type=float, default=15)
+    args = parser.parse_args()
+
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.1.0.1', 0))
+    listener.listen(1024)
+    open_port = listener.getsockname()[1]
+
+    devices = []
+    for n in range(args.devices):
+        ip_address = f'127.1.{n // 250}.{n % 250 + 1}'
+        devices.append({'id': n, 'ip_address': ip_address, 'port': open_port if n == 0 else 9})
+    for n in range(args.dead):
+        devices.append({'id': args.devices + n, 'ip_address': f'198.51.100.{n % 254 + 1}', 'port': 9})
+
+    prober = ReachabilityProber(lambda: devices, interval=args.interval, probes=args.probes)
+    started = time.perf_counter()
+    results = prober.run_cycle(devices)
+    elapsed = time.perf_counter() - started
+
+    by_status = {}
+    for result in results.values():
+        by_status[result['status']] = by_status.get(result['status'], 0) + 1
+    stats = prober.get_stats()
+    print(f"{len(devices)} devices x {args.probes} probes: cycle {elapsed:.2f}s "
+          f"({elapsed / args.interval * 100:.0f}% of a {args.interval:.0f}s interval, icmp={stats['icmp']})")
+    rtts = sorted(r['rtt_ms'] for r in results.values() if r['rtt_ms'] is not None)
+    print(f"statuses {by_status}")
+    if rtts:
+        print(f"rtt p50 {rtts[len(rtts) // 2]:.2f} ms, p95 {rtts[int(len(rtts) * 0.95)]:.2f} ms "
+              f"(includes event-loop scheduling delay)")
+
+    prober.stop()
+    listener.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Memory and speed of the in-memory recent-metrics store.
+
+Fills a RecentStore with N devices (default 10k) to full capacity and reports
+traced memory, record() throughput and the cost of the whole-fleet
+latest_all() read used by /api/devices.
+
+Usage: python3 benchmarks/bench_recent_store.py [--devices N] [--capacity N]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from recent_store import RecentStore
+from rollup import ROLLUP_METRICS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=10000)
+    parser.add_argument('--capacity', type=int, default=120)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    store = RecentStore(ROLLUP_METRICS, capacity=args.capacity)
+
+    values = (12.5, 40.0, 55.0, 1000.0, 500.0, 20.0, 0.5)
+    now = time.time()
+    started = time.perf_counter()
+    for n in range(args.capacity):
+        ts = now - (args.capacity - n) * 30
+        for device_id in range(args.devices):
+            store.record(device_id, ts, values, status='healthy', uptime='1d 2h 3m')
+    elapsed = time.perf_counter() - started
+    samples = args.capacity * args.devices
+
+    after = tracemalloc.take_snapshot()
+    used = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    store.latest_all()
+    latest_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{args.devices} devices x {args.capacity} samples x {len(ROLLUP_METRICS)} metrics")
+    print(f"  traced memory      {used / 1024 / 1024:8.1f} MiB  ({used / args.devices:.0f} B/device)")
+    print(f"  sample arrays      {store.memory_bytes() / 1024 / 1024:8.1f} MiB")
+    print(f"  record()           {samples / elapsed:8.0f} samples/s")
+    print(f"  latest_all()       {latest_ms:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
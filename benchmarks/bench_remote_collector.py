@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Per-host collection latency: legacy five-command SSH poll vs. pooled /proc collector.
+
+Both strategies run against a local paramiko stand-in server (see
+ssh_standin.py) that executes commands with this machine's /bin/sh, so the
+remote side does the same work a real Linux VM would.
+
+Usage: python3 benchmarks/bench_remote_collector.py [--polls N] [--handshake-delay SECONDS]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import warnings
+
+warnings.filterwarnings('ignore')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import paramiko
+
+from remote_collector import RemoteCollector
+from ssh_pool import SSHPool
+from ssh_standin import SSHStandIn
+
+LEGACY_COMMANDS = [
+    "top -bn1 | grep 'Cpu(s)' | awk '{print $2}' | cut -d'%' -f1",
+    "free | grep Mem | awk '{printf \"%.1f\", $3/$2 * 100.0}'",
+    "df -h / | awk 'NR==2{print $5}' | cut -d'%' -f1",
+    "uptime -p",
+    "uptime | awk -F'load average:' '{print $2}' | awk '{print $1}' | cut -d',' -f1",
+]
+
+
+def legacy_poll(port):
+    """What get_vm_metrics_via_ssh used to do: connect, five exec_commands, disconnect"""
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect('127.0.0.1', port=port, username='bench', password='bench', timeout=10,
+                look_for_keys=False, allow_agent=False)
+    for command in LEGACY_COMMANDS:
+        stdin, stdout, stderr = ssh.exec_command(command)
+        stdout.read()
+    ssh.close()
+
+
+def measure(label, poll, polls):
+    timings = []
+    for _ in range(polls):
+        started = time.perf_counter()
+        poll()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"  {label:28s} mean {statistics.mean(timings):7.1f} ms   "
+          f"p50 {timings[len(timings) // 2]:7.1f} ms   p95 {timings[int(len(timings) * 0.95)]:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--polls', type=int, default=20)
+    parser.add_argument('--handshake-delay', type=float, default=0.0,
+                        help='extra seconds the stand-in waits before each SSH handshake')
+    args = parser.parse_args()
+
+    server = SSHStandIn(handshake_delay=args.handshake_delay)
+    pool = SSHPool()
+    collector = RemoteCollector(pool)
+
+    print(f"{args.polls} polls per strategy, handshake delay {args.handshake_delay * 1000:.0f} ms")
+
+    connections = server.connections
+    commands = server.commands
+    measure('legacy (connect + 5 execs)', lambda: legacy_poll(server.port), args.polls)
+    print(f"    connections {server.connections - connections}, channels {server.commands - commands}")
+
+    connections = server.connections
+    commands = server.commands
+    measure('pooled /proc collector', lambda: collector.collect('127.0.0.1', 'bench', 'bench', port=server.port),
+            args.polls)
+    print(f"    connections {server.connections - connections}, channels {server.commands - commands}")
+
+    pool.close_all()
+    server.close()
+
+
+if __name__ == '__main__':
+    main()
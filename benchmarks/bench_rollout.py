@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Agent rollout harness against a local paramiko SSH/SFTP stand-in.
+
+Every simulated host is a device pointing at the stand-in with its own
+install root under a temp directory, so the real check and install scripts
+run end to end without touching the system. A fake node_exporter archive
+is placed in the artifact cache, so nothing is downloaded.
+
+1. the old install pattern for comparison: a thread per host, a fresh
+   connection and one exec round trip per step (the apt-get and wget steps
+   are left out, so it is optimistic);
+2. a rollout to every host with the first connections dropped, which must
+   be retried and still succeed;
+3. the same rollout again: every host reports already installed and no
+   archive is uploaded;
+4. a restart in the middle of a rollout: a new manager on the same database
+   resumes the unfinished hosts.
+
+Usage: python3 benchmarks/bench_rollout.py [--hosts 200] [--workers 16] [--latency 0.02] [--archive-kb 1024]
+"""
+
+import argparse
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import paramiko
+
+from db import Database
+from rollout import ArtifactCache, RolloutManager
+from ssh_standin import SSHStandIn
+
+FAKE_BINARY = b'#!/bin/sh\necho "node_exporter, version %s (branch: HEAD, revision: fake)"\n'
+
+LEGACY_STEPS = [
+    'tar tzf /dev/null 2>/dev/null || true',
+    'mkdir -p "$ROOT/usr/local/bin"',
+    'true',
+    'true',
+    'true',
+    'mkdir -p "$ROOT/etc/systemd/system"',
+    'true',
+    'true',
+    'true',
+]
+
+
+def make_artifact(cache, padding_bytes):
+    os.makedirs(cache.directory, exist_ok=True)
+    binary = FAKE_BINARY % cache.version.encode()
+    with tarfile.open(os.path.join(cache.directory, cache.filename), 'w:gz') as tar:
+        info = tarfile.TarInfo(f'node_exporter-{cache.version}.linux-amd64/node_exporter')
+        info.size = len(binary)
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(binary))
+        # Pad the archive so uploads cost something
+        padding = os.urandom(padding_bytes)
+        info = tarfile.TarInfo(f'node_exporter-{cache.version}.linux-amd64/LICENSE')
+        info.size = len(padding)
+        tar.addfile(info, io.BytesIO(padding))
+
+
+def legacy_install(device, root, failures):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        client.connect(device['ip_address'], port=device['port'], username='user', password='x', timeout=30)
+        for step in LEGACY_STEPS:
+            stdin, stdout, stderr = client.exec_command(f'ROOT={root} sh -c \'{step}\'')
+            stdout.read()
+    except Exception:
+        failures.append(device['id'])
+    finally:
+        client.close()
+
+
+def wait_for(manager, job_id, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job['status'] != 'running':
+            return job
+        time.sleep(0.1)
+    return manager.get(job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hosts', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added per handshake and per command')
+    parser.add_argument('--archive-kb', type=int, default=1024, help='size of the fake node_exporter archive')
+    parser.add_argument('--drop', type=int, default=10, help='connections dropped at the start of the rollout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    standin = SSHStandIn(handshake_delay=args.latency, command_delay=args.latency)
+    devices = {n: {'id': n, 'ip_address': '127.0.0.1', 'port': standin.port, 'username': 'root',
+                   'password': 'x', 'ssh_key_path': None}
+               for n in range(1, args.hosts + 1)}
+    for device_id in devices:
+        os.makedirs(os.path.join(workdir, 'hosts', str(device_id), 'tmp'))
+
+    def load_devices(device_ids):
+        return [devices[device_id] for device_id in device_ids if device_id in devices]
+
+    database = Database(os.path.join(workdir, 'rollout.db'))
+    cache = ArtifactCache(os.path.join(workdir, 'artifacts'))
+    make_artifact(cache, args.archive_kb * 1024)
+    root = os.path.join(workdir, 'hosts', '{id}')
+
+    def new_manager():
+        manager = RolloutManager(database, load_devices, artifacts=cache, workers=args.workers,
+                                 retry_delay=0.2, root=root)
+        with database.writer() as conn:
+            manager.init_schema(conn)
+        return manager
+
+    print(f"{args.hosts} hosts, {args.workers} workers, {args.latency * 1000:.0f} ms per handshake/command")
+
+    legacy_root = os.path.join(workdir, 'legacy')
+    standin.peak_active = 0
+    commands = standin.commands
+    started = time.perf_counter()
+    failures = []
+    threads = [threading.Thread(target=legacy_install, args=(device, legacy_root, failures))
+               for device in devices.values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"legacy pattern:       {time.perf_counter() - started:6.2f}s  "
+          f"{(standin.commands - commands) / args.hosts:.1f} execs/host, peak {standin.peak_active} connections, "
+          f"{len(failures)} hosts failed")
+
+    manager = new_manager()
+    time.sleep(1.5)
+    standin.peak_active = 0
+    standin.drop_first = standin.connections + args.drop
+    commands, uploads = standin.commands, standin.uploads
+    started = time.perf_counter()
+    job = wait_for(manager, manager.create(list(devices)))
+    stats = manager.get_stats()
+    print(f"rollout:              {time.perf_counter() - started:6.2f}s  "
+          f"{(standin.commands - commands) / args.hosts:.1f} execs/host, peak {standin.peak_active} connections, "
+          f"status {job['status']} {job['counts']}, retries {stats['retries']}, "
+          f"uploads {standin.uploads - uploads}, archive downloads {stats['artifact']['downloads']}")
+    installed = sum(1 for device_id in devices
+                    if os.path.exists(os.path.join(workdir, 'hosts', str(device_id), 'usr/local/bin/node_exporter')))
+    print(f"binaries in place:    {installed}/{args.hosts}")
+
+    commands, uploads = standin.commands, standin.uploads
+    started = time.perf_counter()
+    job = wait_for(manager, manager.create(list(devices)))
+    print(f"rerun:                {time.perf_counter() - started:6.2f}s  "
+          f"{(standin.commands - commands) / args.hosts:.1f} execs/host, uploads {standin.uploads - uploads}, "
+          f"already installed {manager.get_stats()['already_installed']}")
+    manager.stop()
+
+    for device_id in devices:
+        os.remove(os.path.join(workdir, 'hosts', str(device_id), 'usr/local/bin/node_exporter'))
+    manager = new_manager()
+    job_id = manager.create(list(devices))
+    time.sleep(0.5)
+    manager.stop()
+    done = manager.get(job_id)['counts'].get('succeeded', 0)
+    time.sleep(1)
+    manager = new_manager()
+    manager.start()
+    job = wait_for(manager, job_id)
+    print(f"restart mid-rollout:  {done} hosts done before the restart, job {job['status']} {job['counts']} after")
+    manager.stop()
+    standin.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Concurrent load benchmark for the /api/devices and /api/metrics/submit routes.
+
+Runs app.py in a threaded werkzeug server against a throwaway database and
+hammers both routes at once from a pool of client threads.
+
+Usage: python3 benchmarks/bench_routes.py [repo_dir] [--devices N] [--threads N] [--seconds N]
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import app_sandbox
+
+warnings.filterwarnings('ignore')
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('repo_dir', nargs='?', default=os.path.join(os.path.dirname(__file__), '..'))
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    app_sandbox.enter(args.repo_dir)
+
+    import app
+    from werkzeug.serving import make_server
+
+    app.init_db()
+    client = app.app.test_client()
+    for i in range(args.devices):
+        client.post('/api/devices/add', json={
+            'name': f'bench-{i}', 'ip_address': f'10.{i // 65536}.{i // 256 % 256}.{i % 256}',
+            'device_type': 'server'
+        })
+
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    latencies = {'devices': [], 'submit': []}
+    errors = {'devices': 0, 'submit': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+
+    def worker(worker_id):
+        session = requests.Session()
+        n = 0
+        while time.monotonic() < deadline:
+            n += 1
+            # One dashboard read for every four agent submits
+            if n % 5 == 0:
+                route, call = 'devices', lambda: session.get(f'{base_url}/api/devices')
+            else:
+                device_id = (worker_id * 7919 + n) % args.devices + 1
+                route, call = 'submit', lambda: session.post(f'{base_url}/api/metrics/submit', json={
+                    'device_id': device_id, 'status': 'healthy', 'cpu_usage': 12.5, 'memory_usage': 40.0
+                })
+            started = time.perf_counter()
+            response = call()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies[route].append(elapsed)
+                if response.status_code >= 400:
+                    errors[route] += 1
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(worker, range(args.threads)))
+    server.shutdown()
+
+    print(f"{args.devices} devices, {args.threads} client threads, {args.seconds}s")
+    for route, values in latencies.items():
+        print(f"  {route:8s} {len(values) / args.seconds:8.1f} req/s   "
+              f"p50 {percentile(values, 50):7.2f} ms   p95 {percentile(values, 95):7.2f} ms   "
+              f"p99 {percentile(values, 99):7.2f} ms   errors {errors[route]}")
+
+
+if __name__ == '__main__':
+    main()
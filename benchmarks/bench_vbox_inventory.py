@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+VirtualBox discovery latency: legacy sequential scan vs. cached inventory.
+
+Runs against fake_vboxmanage.py with a per-call delay standing in for a
+slow VBoxManage. Reports:
+
+1. the legacy discover_virtualbox_vms loop (showvminfo + guestproperty per
+   VM, one after another);
+2. a cold inventory refresh on the bounded pool;
+3. an incremental refresh after two VMs changed state;
+4. the latency of a cached read, which is what /api/vms/discover serves.
+
+Usage: python3 benchmarks/bench_vbox_inventory.py [--vms 40] [--delay 0.2] [--workers 8]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_vboxmanage import generate
+from vbox_inventory import VBoxInventory
+
+FAKE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_vboxmanage.py')
+
+
+def legacy_discover(vboxmanage):
+    """What discover_virtualbox_vms used to do"""
+    result = subprocess.run([vboxmanage, 'list', 'vms'], capture_output=True, text=True, timeout=30)
+    vms = []
+    for line in result.stdout.strip().split('\n'):
+        if line:
+            uuid = line.rsplit('{', 1)[1].strip('}')
+            subprocess.run([vboxmanage, 'showvminfo', uuid, '--machinereadable'],
+                           capture_output=True, text=True, timeout=30)
+            subprocess.run([vboxmanage, 'guestproperty', 'get', uuid, '/VirtualBox/GuestInfo/Net/0/V4/IP'],
+                           capture_output=True, text=True, timeout=10)
+            vms.append(uuid)
+    return vms
+
+
+def calls(log):
+    with open(log) as f:
+        return sum(1 for _ in f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vms', type=int, default=40)
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds per showvminfo/guestproperty call')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    state_path = os.path.join(workdir, 'state.json')
+    log = os.path.join(workdir, 'calls.log')
+    vms = generate(args.vms)
+    with open(state_path, 'w') as f:
+        json.dump(vms, f)
+    open(log, 'w').close()
+    os.environ.update({'FAKE_VBOX_STATE': state_path, 'FAKE_VBOX_DELAY': str(args.delay), 'FAKE_VBOX_LOG': log})
+
+    print(f"{args.vms} VMs, {args.delay * 1000:.0f} ms per showvminfo/guestproperty, {args.workers} workers")
+
+    started = time.perf_counter()
+    legacy_discover(FAKE)
+    print(f"legacy sequential scan:  {time.perf_counter() - started:7.2f}s  {calls(log):4d} VBoxManage calls")
+
+    inventory = VBoxInventory(FAKE, workers=args.workers)
+    open(log, 'w').close()
+    started = time.perf_counter()
+    inventory.refresh()
+    print(f"cold inventory refresh:  {time.perf_counter() - started:7.2f}s  {calls(log):4d} VBoxManage calls")
+
+    # Power one VM off and start a stopped one
+    uuids = list(vms)
+    vms[uuids[0]].update(state='poweroff', ip=None)
+    vms[uuids[2]].update(state='running', ip='10.0.2.250')
+    with open(state_path, 'w') as f:
+        json.dump(vms, f)
+    open(log, 'w').close()
+    started = time.perf_counter()
+    inventory.refresh()
+    print(f"incremental refresh:     {time.perf_counter() - started:7.2f}s  {calls(log):4d} VBoxManage calls")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        result = inventory.get()
+    print(f"cached read:             {(time.perf_counter() - started) / 1000 * 1e6:7.1f}us per call, "
+          f"{len(result['vms'])} VMs")
+    changed = {vm['vm_id']: vm['status'] for vm in result['vms'] if vm['vm_id'] in (uuids[0], uuids[2])}
+    print(f"changed VMs picked up: {changed}")
+    inventory.close()
+
+
+if __name__ == '__main__':
+    main()
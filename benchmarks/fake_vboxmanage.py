@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the VBoxManage commands NetMon uses, for tests and benchmarks.
+
+Point the app at it with VBOXMANAGE=benchmarks/fake_vboxmanage.py.
+
+The VM set comes from the JSON file named by FAKE_VBOX_STATE
+({uuid: {"name", "state", "ip", "ostype", "memory", "cpus"}}); without it,
+FAKE_VBOX_VMS (default 40) VMs are generated, every third one powered off.
+FAKE_VBOX_DELAY adds a per-call delay (seconds) to showvminfo and
+guestproperty, which are the slow calls on a real host. Every invocation is
+appended to FAKE_VBOX_LOG when it is set.
+
+Supported: list vms, list runningvms, showvminfo <uuid> --machinereadable,
+guestproperty get <uuid> <property>.
+"""
+
+import json
+import os
+import sys
+import time
+
+
+def generate(count):
+    vms = {}
+    for n in range(count):
+        uuid = f'00000000-0000-4000-8000-{n:012d}'
+        running = n % 3 != 2
+        vms[uuid] = {
+            'name': f'vm {n:03d}',
+            'state': 'running' if running else 'poweroff',
+            'ip': f'10.0.2.{n % 250 + 2}' if running else None,
+            'ostype': 'Ubuntu_64',
+            'memory': 2048,
+            'cpus': 2,
+        }
+    return vms
+
+
+def load():
+    path = os.environ.get('FAKE_VBOX_STATE')
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return generate(int(os.environ.get('FAKE_VBOX_VMS', '40')))
+
+
+def main(args):
+    log = os.environ.get('FAKE_VBOX_LOG')
+    if log:
+        with open(log, 'a') as f:
+            f.write(' '.join(args[:2]) + '\n')
+
+    vms = load()
+    delay = float(os.environ.get('FAKE_VBOX_DELAY', '0'))
+
+    if args[:2] == ['list', 'vms']:
+        for uuid, vm in vms.items():
+            print(f'"{vm["name"]}" {{{uuid}}}')
+    elif args[:2] == ['list', 'runningvms']:
+        for uuid, vm in vms.items():
+            if vm['state'] in ('running', 'paused'):
+                print(f'"{vm["name"]}" {{{uuid}}}')
+    elif args[:1] == ['showvminfo'] and len(args) >= 2:
+        time.sleep(delay)
+        vm = vms.get(args[1])
+        if vm is None:
+            print(f'VBoxManage: error: Could not find a registered machine named \'{args[1]}\'', file=sys.stderr)
+            return 1
+        print(f'name="{vm["name"]}"')
+        print(f'ostype="{vm["ostype"]}"')
+        print(f'UUID="{args[1]}"')
+        print(f'memory={vm["memory"]}')
+        print(f'cpus={vm["cpus"]}')
+        print(f'VMState="{vm["state"]}"')
+    elif args[:2] == ['guestproperty', 'get'] and len(args) >= 4:
+        time.sleep(delay)
+        vm = vms.get(args[2])
+        if vm and vm.get('ip') and vm['state'] == 'running':
+            print(f'Value: {vm["ip"]}')
+        else:
+            print('No value set!')
+    else:
+        print(f'VBoxManage: error: Unsupported fake command: {" ".join(args)}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
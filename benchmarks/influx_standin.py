@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Minimal HTTP server standing in for InfluxDB's /api/v2/write.
+
+Accepts gzip or plain line protocol, keeps every received line, and can be
+switched to answer 503 to simulate an outage. Optional per-request delay
+simulates a slow server.
+"""
+
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        standin = self.server.standin
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if urlparse(self.path).path != '/api/v2/write':
+            self.send_response(404)
+            self.end_headers()
+            return
+        standin.requests += 1
+        if standin.failing:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        if standin.delay:
+            threading.Event().wait(standin.delay)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        with standin.lock:
+            standin.lines.extend(line for line in body.decode('utf-8').split('\n') if line)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InfluxStandIn:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.failing = False
+        self.requests = 0
+        self.lines = []
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.standin = self
+        self.port = self._server.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
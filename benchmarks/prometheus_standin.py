@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Minimal HTTP server standing in for Prometheus' /api/v1/query.
+
+Answers GET or POST instant queries with canned values. A query built by
+prometheus_query.combine_queries gets one series per requested name,
+labelled the same way; any other query that equals one of `expressions`
+gets that expression's value as an unlabelled series. Keeps connections
+alive and counts requests and connections. Can be switched to answer 503,
+and an optional per-request delay simulates a slow server.
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+NAMED = re.compile(r'"netmon_metric", "(\w+)"')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.standin.lock:
+            self.server.standin.connections += 1
+
+    def do_GET(self):
+        self._answer(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._answer(parse_qs(body.decode()))
+
+    def _answer(self, params):
+        standin = self.server.standin
+        if urlparse(self.path).path != '/api/v1/query':
+            self._send(404, {'status': 'error', 'error': 'not found'})
+            return
+        with standin.lock:
+            standin.requests += 1
+        if standin.delay:
+            time.sleep(standin.delay)
+        if standin.failing:
+            self._send(503, {'status': 'error', 'error': 'unavailable'})
+            return
+
+        query = params.get('query', [''])[0]
+        now = time.time()
+        names = NAMED.findall(query)
+        if names:
+            result = [{'metric': {'netmon_metric': name}, 'value': [now, str(standin.values[name])]}
+                      for name in names if name in standin.values]
+        else:
+            name = standin.names.get(query)
+            result = [{'metric': {}, 'value': [now, str(standin.values[name])]}] if name in standin.values else []
+        self._send(200, {'status': 'success', 'data': {'resultType': 'vector', 'result': result}})
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PrometheusStandIn:
+    def __init__(self, values, expressions=None, delay=0.0):
+        self.values = values                # name -> value
+        self.names = {expression: name for name, expression in (expressions or {}).items()}
+        self.delay = delay
+        self.failing = False
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.standin = self
+        self.port = self._server.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
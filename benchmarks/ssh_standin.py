@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Minimal paramiko SSH server used as a local stand-in target for benchmarks.
+
+Accepts any password, and runs exec requests with the local /bin/sh so the
+commands see this machine's real /proc. SFTP is served from the local
+filesystem. Optional per-connection handshake delay simulates network
+latency, and the first `drop_first` connections can be cut off right after
+accept to exercise client retries.
+"""
+
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+import warnings
+
+warnings.filterwarnings('ignore')
+logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+
+import paramiko
+
+HOST_KEY = paramiko.RSAKey.generate(2048)
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, standin):
+        self.standin = standin
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        self.standin.commands += 1
+        threading.Thread(target=self._run, args=(channel, command), daemon=True).start()
+        return True
+
+    def _run(self, channel, command):
+        if self.standin.command_delay:
+            time.sleep(self.standin.command_delay)
+        result = subprocess.run(['/bin/sh', '-c', command.decode()], capture_output=True)
+        try:
+            channel.sendall(result.stdout)
+            channel.sendall_stderr(result.stderr)
+            channel.send_exit_status(result.returncode)
+            channel.close()
+        except (EOFError, OSError):
+            pass            # client went away first
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.standin = server.standin
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+            self.standin.uploads += 1
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        f = os.fdopen(fd, mode)
+        handle = _SFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+class SSHStandIn:
+    def __init__(self, handshake_delay=0.0, command_delay=0.0, drop_first=0):
+        self.handshake_delay = handshake_delay
+        self.command_delay = command_delay
+        self.drop_first = drop_first
+        self.connections = 0
+        self.commands = 0
+        self.uploads = 0
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(100)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            if self.connections <= self.drop_first:
+                client.close()
+                continue
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            if self.handshake_delay:
+                time.sleep(self.handshake_delay)
+            transport = paramiko.Transport(client)
+            transport.add_server_key(HOST_KEY)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _SFTPServer)
+            server = _Server(self)
+            try:
+                transport.start_server(server=server)
+            except Exception:
+                return
+            # Accepted channels must stay referenced or paramiko closes them on GC
+            channels = []
+            while transport.is_active():
+                channel = transport.accept(0.2)
+                if channel is not None:
+                    channels = [c for c in channels if not c.closed] + [channel]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def close(self):
+        self._sock.close()
@@ -0,0 +1,157 @@
+"""
+Versioned view of the device list for conditional and delta responses.
+
+The device list is assembled from several sources that change independently:
+the devices table, the latest stored samples, the recent store and the
+reachability prober. Rather than hook every one of them, the list is rebuilt
+at most once per `ttl` seconds (shared by every caller) and compared with the
+previous build. Each rebuild that finds a difference takes the next value of
+a monotonic version counter, and every record added or changed in it is
+stamped with that version; devices that disappeared are kept as tombstones
+stamped the same way.
+
+Callers get the full list and its version, which doubles as the ETag, or
+only what changed after a version they already hold. Records are kept in
+version order, so a delta is read from the newest end and stops at the first
+older record. The counter is seeded from the wall clock in milliseconds and
+advances at most once per rebuild, so versions keep growing across restarts;
+a `since` older than this process, newer than the current version, or older
+than the oldest tombstone still kept gets the full list instead, flagged so
+the client replaces what it has.
+
+Fields listed as `volatile` (measurements that move on every probe, say)
+are served with their latest values but do not count as a change: a
+record whose other fields are unchanged keeps its version, so neither
+the ETag nor a delta moves for them alone.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ChangeLog:
+    def __init__(self, build, ttl=2, max_removed=10000, max_deltas=64, volatile=()):
+        self.build = build                  # () -> [{'id': ..., ...}, ...] in display order
+        self.ttl = ttl
+        self.volatile = frozenset(volatile) # record fields left out of change detection
+        self.max_removed = max_removed      # tombstones kept for delta clients
+        self.max_deltas = max_deltas        # serialized deltas cached per version
+
+        self._lock = threading.Lock()
+        self._version = int(time.time() * 1000)
+        self._horizon = self._version       # deltas since anything older are answered in full
+        self._built_at = None
+        self._order = []
+        self._records = OrderedDict()       # id -> (version, record), oldest version first
+        self._removed = OrderedDict()       # id -> version it was removed in
+        self._full = None
+        self._deltas = {}
+        self.stats = {'builds': 0, 'versions': 0, 'changed': 0, 'removed': 0, 'full': 0, 'deltas': 0,
+                      'resets': 0}
+
+    def _refresh(self):
+        if self._built_at is not None and time.monotonic() - self._built_at < self.ttl:
+            return
+        records = self.build()
+        self._built_at = time.monotonic()
+        self.stats['builds'] += 1
+
+        changed = []
+        refreshed = False
+        seen = set()
+        for record in records:
+            seen.add(record['id'])
+            current = self._records.get(record['id'])
+            if current is None or self._stable(current[1]) != self._stable(record):
+                changed.append(record)
+            elif current[1] != record:
+                # Only volatile fields moved: serve the new values under the same version
+                self._records[record['id']] = (current[0], record)
+                refreshed = True
+        removed = [device_id for device_id in self._records if device_id not in seen]
+        order = [record['id'] for record in records]
+        if not changed and not removed and order == self._order:
+            if refreshed:
+                self._full = None
+                self._deltas = {}
+            return
+
+        self._version += 1
+        version = self._version
+        for record in changed:
+            self._records[record['id']] = (version, record)
+            self._records.move_to_end(record['id'])
+            self._removed.pop(record['id'], None)
+        for device_id in removed:
+            del self._records[device_id]
+            self._removed[device_id] = version
+        while len(self._removed) > self.max_removed:
+            _, dropped = self._removed.popitem(last=False)
+            self._horizon = max(self._horizon, dropped)
+        self._order = order
+        self._full = None
+        self._deltas = {}
+        self.stats['versions'] += 1
+        self.stats['changed'] += len(changed)
+        self.stats['removed'] += len(removed)
+
+    def _stable(self, record):
+        if not self.volatile:
+            return record
+        return {field: value for field, value in record.items() if field not in self.volatile}
+
+    def _stamped(self, device_id):
+        version, record = self._records[device_id]
+        return dict(record, version=version)
+
+    def full(self):
+        """Serialized list of every record and the version it reflects"""
+        with self._lock:
+            self._refresh()
+            self.stats['full'] += 1
+            if self._full is None:
+                self._full = json.dumps([self._stamped(device_id) for device_id in self._order],
+                                        separators=(',', ':'))
+            return self._full, self._version
+
+    def since(self, since):
+        """Serialized delta of records added, changed or removed after `since`, and the current version"""
+        with self._lock:
+            self._refresh()
+            body = self._deltas.get(since)
+            if body is not None:
+                self.stats['deltas'] += 1
+                return body, self._version
+
+            if since < self._horizon or since > self._version:
+                self.stats['resets'] += 1
+                body = {'version': self._version, 'full': True, 'removed': [],
+                        'devices': [self._stamped(device_id) for device_id in self._order]}
+            else:
+                self.stats['deltas'] += 1
+                devices = []
+                for device_id, (version, record) in reversed(self._records.items()):
+                    if version <= since:
+                        break
+                    devices.append(dict(record, version=version))
+                removed = []
+                for device_id, version in reversed(self._removed.items()):
+                    if version <= since:
+                        break
+                    removed.append(device_id)
+                body = {'version': self._version, 'full': False, 'devices': devices, 'removed': removed}
+
+            body = json.dumps(body, separators=(',', ':'))
+            if len(self._deltas) >= self.max_deltas:
+                self._deltas.clear()
+            self._deltas[since] = body
+            return body, self._version
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['version'] = self._version
+        stats['devices'] = len(self._records)
+        stats['tombstones'] = len(self._removed)
+        return stats
@@ -0,0 +1,121 @@
+"""
+Shared SQLite access layer for the NetMon dashboard.
+
+The database runs in WAL mode so dashboard reads proceed while ingest commits
+are in flight. Reads are served from a small pool of query-only connections;
+all writes go through one writer connection guarded by a lock, which matches
+SQLite's single-writer model and avoids SQLITE_BUSY retries between threads.
+
+Connections are long-lived and keep sqlite3's per-connection statement cache
+warm, so repeated queries reuse their prepared statements instead of being
+re-parsed on every request.
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+PRAGMAS = {
+    'synchronous': 'NORMAL',     # durable across app crashes in WAL mode, fsync only at checkpoints
+    'cache_size': -32000,        # 32 MB page cache per connection
+    'mmap_size': 268435456,      # map up to 256 MB of the database file
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+STATEMENT_CACHE_SIZE = 256
+
+
+class Database:
+    def __init__(self, path, max_readers=8):
+        self.path = path
+        self.max_readers = max_readers
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._wal_enabled = False
+
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.path, timeout=PRAGMAS['busy_timeout'] / 1000,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        if not self._wal_enabled:
+            # journal_mode is persistent in the file, so this only has to succeed once
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._wal_enabled = True
+        for name, value in PRAGMAS.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        if read_only:
+            conn.execute('PRAGMA query_only=1')
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Borrow a query-only connection from the pool"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._reader_lock:
+                can_open = self._reader_count < self.max_readers
+                if can_open:
+                    self._reader_count += 1
+            if can_open:
+                try:
+                    conn = self._connect(read_only=True)
+                except Exception:
+                    with self._reader_lock:
+                        self._reader_count -= 1
+                    raise
+            else:
+                conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            # End any implicit read transaction so WAL checkpoints are not held back
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """Exclusive access to the writer connection; commits on success, rolls back on error"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def query(self, sql, params=()):
+        """Run a read query and return all rows"""
+        with self.reader() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        """Run a read query and return the first row or None"""
+        with self.reader() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        """Run a single write statement in its own transaction and return the cursor"""
+        with self.writer() as conn:
+            return conn.execute(sql, params)
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._reader_lock:
+            self._reader_count = 0
@@ -20,6 +20,20 @@ if not exist "monitoring_agent_windows.py" (
     exit /b 1
 )
 
+if not exist "agent_collectors.py" (
+    echo ERROR: agent_collectors.py not found
+    echo Please ensure all files are in the same directory
+    pause
+    exit /b 1
+)
+
+if not exist "agent_transport.py" (
+    echo ERROR: agent_transport.py not found
+    echo Please ensure all files are in the same directory
+    pause
+    exit /b 1
+)
+
 if not exist "install_windows_agent.ps1" (
     echo ERROR: install_windows_agent.ps1 not found
     echo Please ensure all files are in the same directory
@@ -0,0 +1,464 @@
+"""
+Asynchronous network discovery for CIDR ranges.
+
+A single asyncio loop running in a background thread sweeps every address of
+a range with TCP connect probes to a handful of well-known ports plus an
+unprivileged ICMP echo (SOCK_DGRAM ping socket, used when the kernel's
+net.ipv4.ping_group_range allows it). A host counts as alive if it answers
+the echo, accepts a connection or actively refuses one.
+
+- A global semaphore caps the number of probes in flight across all jobs.
+- Each /24 has a token bucket, so one subnet never sees more than
+  `subnet_rate` probes per second.
+- Probe timeouts adapt per /24 from observed round-trip times (RFC 6298
+  style smoothed RTT plus four deviations, clamped to min/max).
+- Live hosts are reverse-resolved in batches on a small thread pool with a
+  TTL cache, then appended to the job's result list, which callers page
+  through with a cursor while the sweep is still running.
+"""
+
+import asyncio
+import ipaddress
+import itertools
+import socket
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PORTS = (22, 23, 80, 443, 445, 515, 3389, 9100)
+
+# First matching rule wins; hosts with open ports but no match are servers
+PORT_TYPES = (
+    ({9100, 515, 631}, 'printer'),
+    ({23, 161, 179}, 'network'),
+    ({2049, 3260}, 'storage'),
+)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def guess_device_type(ports):
+    open_ports = set(ports)
+    for signature, device_type in PORT_TYPES:
+        if open_ports & signature:
+            return device_type
+    return 'server' if open_ports else 'other'
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _reverse_lookup(ip_address):
+    try:
+        return socket.gethostbyaddr(ip_address)[0]
+    except (OSError, UnicodeError):
+        return None
+
+
+class _Subnet:
+    """Token bucket and RTT estimate shared by every probe into one /24"""
+
+    __slots__ = ('rate', 'tokens', 'updated', 'srtt', 'rttvar')
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.srtt = None
+        self.rttvar = None
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def observe(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def timeout(self, initial, low, high):
+        if self.srtt is None:
+            return initial
+        return min(max(self.srtt + 4 * self.rttvar, low), high)
+
+
+class IcmpPinger:
+    """Echo requests over one unprivileged ICMP socket, replies matched by (address, sequence)"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        self.sock.setblocking(False)
+        # Thousands of echoes can be outstanding; don't let replies overflow the default buffers
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        self._waiters = {}
+        self._writable = None
+        self._seq = itertools.count()
+        loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # A queued ICMP error for some earlier echo; reading it clears it
+                continue
+            # Ping sockets deliver the ICMP message without the IP header
+            if len(data) < 8 or data[0] != ICMP_ECHO_REPLY:
+                continue
+            seq = struct.unpack('!H', data[6:8])[0]
+            waiter = self._waiters.pop((addr[0], seq), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(self.loop.time())
+
+    async def ping(self, ip_address, timeout):
+        """Round-trip time in seconds, or None if no reply arrived in time"""
+        seq = next(self._seq) & 0xffff
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+        payload = b'netmon-discovery'
+        packet = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, _checksum(header + payload), 0, seq) + payload
+
+        waiter = self.loop.create_future()
+        self._waiters[(ip_address, seq)] = waiter
+        timer = self.loop.call_later(timeout, lambda: waiter.done() or waiter.set_result(None))
+        sent = self.loop.time()
+        try:
+            await self._send(packet, ip_address)
+            received = await waiter
+            return received - sent if received is not None else None
+        except OSError:
+            return None
+        finally:
+            timer.cancel()
+            self._waiters.pop((ip_address, seq), None)
+
+    async def _send(self, packet, ip_address):
+        stale_error = False
+        while True:
+            try:
+                self.sock.sendto(packet, (ip_address, 0))
+                return
+            except BlockingIOError:
+                # Send buffer full: every blocked sender waits on one shared writability future
+                if self._writable is None:
+                    self._writable = self.loop.create_future()
+                    self.loop.add_writer(self.sock.fileno(), self._on_writable)
+                await self._writable
+            except OSError:
+                # The error may belong to an earlier echo to another host; it is cleared by being
+                # reported, so only a second failure is about this destination
+                if stale_error:
+                    raise
+                stale_error = True
+
+    def _on_writable(self):
+        self.loop.remove_writer(self.sock.fileno())
+        writable, self._writable = self._writable, None
+        if writable is not None and not writable.done():
+            writable.set_result(None)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+
+class DiscoveryJob:
+    def __init__(self, network, ports):
+        self.id = uuid.uuid4().hex
+        self.network = network
+        self.ports = ports
+        self.status = 'running'
+        self.total = max(network.num_addresses - 2, 1) if network.prefixlen < network.max_prefixlen - 1 \
+            else network.num_addresses
+        self.scanned = 0
+        self.devices = []
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.future = None
+
+    def snapshot(self, since=0):
+        """Progress plus every device found after cursor `since`"""
+        devices = self.devices[since:]
+        return {
+            'job_id': self.id,
+            'network_range': str(self.network),
+            'ports': list(self.ports),
+            'status': self.status,
+            'scanned': self.scanned,
+            'total': self.total,
+            'found': len(self.devices),
+            'devices': devices,
+            'next': since + len(devices),
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class DiscoveryEngine:
+    def __init__(self, ports=DEFAULT_PORTS, max_concurrency=1024, subnet_rate=1000, initial_timeout=1.0,
+                 min_timeout=0.2, max_timeout=3.0, max_hosts=65536, resolve_hostnames=True,
+                 dns_ttl=3600, dns_workers=16, dns_batch=64, job_ttl=3600, use_icmp=True):
+        self.ports = tuple(ports)
+        self.max_concurrency = max_concurrency
+        self.subnet_rate = subnet_rate          # probes per second into any single /24
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_hosts = max_hosts
+        self.resolve_hostnames = resolve_hostnames
+        self.dns_ttl = dns_ttl
+        self.dns_batch = dns_batch
+        self.job_ttl = job_ttl                  # seconds a finished job stays queryable
+        self.use_icmp = use_icmp
+
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._pinger = None
+        self._subnets = {}
+        self._dns_cache = {}                    # ip -> (hostname, expires)
+        self._dns_executor = ThreadPoolExecutor(dns_workers, thread_name_prefix='discovery-dns')
+        self.stats = {'jobs': 0, 'probes': 0, 'hosts_found': 0, 'dns_lookups': 0, 'dns_cache_hits': 0,
+                      'icmp': None}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                if self.use_icmp:
+                    try:
+                        self._pinger = IcmpPinger(self._loop)
+                    except OSError as e:
+                        print(f"ICMP discovery disabled, falling back to TCP probes only: {e}")
+                self.stats['icmp'] = self._pinger is not None
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='discovery-loop', daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def start(self, network_range, ports=None):
+        """Begin sweeping a CIDR range; returns the job. Raises ValueError for bad input."""
+        network = ipaddress.ip_network(network_range, strict=False)
+        if network.version != 4:
+            raise ValueError('Only IPv4 ranges can be swept')
+        if network.num_addresses > self.max_hosts:
+            raise ValueError(f'Range too large: {network.num_addresses} addresses (limit {self.max_hosts})')
+        ports = tuple(int(p) for p in ports) if ports else self.ports
+        if any(not 0 < p < 65536 for p in ports):
+            raise ValueError('Ports must be between 1 and 65535')
+
+        self._ensure_loop()
+        self._prune()
+        job = DiscoveryJob(network, ports)
+        with self._lock:
+            self._jobs[job.id] = job
+        self.stats['jobs'] += 1
+        job.future = asyncio.run_coroutine_threadsafe(self._run_job(job), self._loop)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job.status == 'running':
+            job.status = 'cancelled'
+        return True
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def _subnet(self, address):
+        key = int(address) >> 8
+        subnet = self._subnets.get(key)
+        if subnet is None:
+            subnet = self._subnets[key] = _Subnet(self.subnet_rate)
+        return subnet
+
+    async def _run_job(self, job):
+        hosts = iter(job.network.hosts())
+        pending = []
+        wakeup = asyncio.Event()
+        # Every host in flight can have one probe per port plus an echo outstanding
+        workers = max(1, min(job.total, self.max_concurrency // (len(job.ports) + 1) * 2))
+
+        async def sweep():
+            for address in hosts:
+                if job.status != 'running':
+                    return
+                host = await self._probe_host(address, job.ports)
+                job.scanned += 1
+                if host:
+                    pending.append(host)
+                    if len(pending) >= self.dns_batch:
+                        wakeup.set()
+
+        async def publish():
+            while True:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), 0.25)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+                if pending:
+                    batch = pending[:]
+                    del pending[:len(batch)]
+                    await self._publish(job, batch)
+                if sweeping.done() and not pending:
+                    return
+
+        try:
+            sweeping = asyncio.gather(*(sweep() for _ in range(workers)))
+            await asyncio.gather(sweeping, publish())
+            if job.status == 'running':
+                job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            print(f"Discovery of {job.network} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    async def _publish(self, job, hosts):
+        names = await self._resolve([h['ip'] for h in hosts]) if self.resolve_hostnames else {}
+        for host in hosts:
+            host['hostname'] = names.get(host['ip'])
+            host['device_type'] = guess_device_type(host['ports'])
+        job.devices.extend(hosts)
+        self.stats['hosts_found'] += len(hosts)
+
+    async def _resolve(self, addresses):
+        now = time.monotonic()
+        names = {}
+        misses = []
+        for address in addresses:
+            cached = self._dns_cache.get(address)
+            if cached and cached[1] > now:
+                names[address] = cached[0]
+                self.stats['dns_cache_hits'] += 1
+            else:
+                misses.append(address)
+
+        if misses:
+            loop = asyncio.get_running_loop()
+            lookups = [asyncio.wait_for(loop.run_in_executor(self._dns_executor, _reverse_lookup, a), 2.0)
+                       for a in misses]
+            results = await asyncio.gather(*lookups, return_exceptions=True)
+            self.stats['dns_lookups'] += len(misses)
+            expires = time.monotonic() + self.dns_ttl
+            for address, name in zip(misses, results):
+                name = name if isinstance(name, str) else None
+                self._dns_cache[address] = (name, expires)
+                names[address] = name
+        return names
+
+    async def _probe_host(self, address, ports):
+        ip_address = str(address)
+        subnet = self._subnet(address)
+        probes = [self._tcp_probe(ip_address, port, subnet) for port in ports]
+        if self._pinger is not None:
+            probes.append(self._icmp_probe(ip_address, subnet))
+        results = await asyncio.gather(*probes)
+
+        answered = [r for r in results if r is not None]
+        if not answered:
+            return None
+        return {
+            'ip': ip_address,
+            'ports': sorted(port for port, is_open, _ in answered if port and is_open),
+            'icmp': any(port is None for port, _, _ in answered),
+            'rtt_ms': round(min(rtt for _, _, rtt in answered) * 1000, 2),
+        }
+
+    async def _tcp_probe(self, ip_address, port, subnet):
+        """(port, open, rtt) if the host answered at all, None on timeout or unreachable"""
+        async with self._semaphore:
+            await subnet.acquire()
+            self.stats['probes'] += 1
+            loop = asyncio.get_running_loop()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            # Close with RST so a /16 sweep does not leave tens of thousands of TIME_WAIT sockets
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            started = loop.time()
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, (ip_address, port)),
+                                       subnet.timeout(self.initial_timeout, self.min_timeout, self.max_timeout))
+                is_open = True
+            except ConnectionRefusedError:
+                is_open = False
+            except (asyncio.TimeoutError, OSError):
+                return None
+            finally:
+                sock.close()
+            rtt = loop.time() - started
+            subnet.observe(rtt)
+            return port, is_open, rtt
+
+    async def _icmp_probe(self, ip_address, subnet):
+        async with self._semaphore:
+            await subnet.acquire()
+            self.stats['probes'] += 1
+            rtt = await self._pinger.ping(ip_address,
+                                          subnet.timeout(self.initial_timeout, self.min_timeout, self.max_timeout))
+            if rtt is None:
+                return None
+            subnet.observe(rtt)
+            return None, False, rtt
+
+    def get_stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == 'running')
+        stats = dict(self.stats)
+        stats['running_jobs'] = running
+        stats['dns_cache_size'] = len(self._dns_cache)
+        return stats
+
+    def close(self):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == 'running':
+                    job.status = 'cancelled'
+        if self._loop is not None:
+            if self._pinger is not None:
+                self._loop.call_soon_threadsafe(self._pinger.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._dns_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,72 @@
+"""
+Server-side downsampling for chart series.
+
+Both functions take a list of (timestamp, value) pairs sorted by timestamp
+and return at most `threshold` pairs, so the payload sent to Chart.js is
+bounded no matter how long the requested range is.
+"""
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets: keeps the points that preserve the visual shape"""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points) if threshold >= n else list(points[:threshold])
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(p[0] for p in points[next_start:next_end]) / span
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / span
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax(points, threshold):
+    """Keep the minimum and maximum of each time bucket, in time order; preserves spikes"""
+    n = len(points)
+    if threshold >= n:
+        return list(points)
+
+    buckets = max(1, threshold // 2)
+    bucket_size = n / buckets
+    sampled = []
+    for i in range(buckets):
+        chunk = points[int(i * bucket_size):int((i + 1) * bucket_size)]
+        if not chunk:
+            continue
+        lo = min(chunk, key=lambda p: p[1])
+        hi = max(chunk, key=lambda p: p[1])
+        if lo is hi:
+            sampled.append(lo)
+        else:
+            sampled.extend(sorted((lo, hi), key=lambda p: p[0]))
+    return sampled
+
+
+METHODS = {
+    'lttb': lttb,
+    'minmax': minmax,
+}
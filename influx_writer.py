@@ -0,0 +1,272 @@
+"""
+Batched, non-blocking line protocol writer for InfluxDB v2.
+
+write() only appends encoded lines to an in-memory buffer. A background
+thread sends them to /api/v2/write in gzip-compressed batches of at most
+`batch_size` lines, or whatever has accumulated after `flush_interval`
+seconds. Failed batches are retried with exponential backoff; when InfluxDB
+stays unavailable, batches (and anything beyond `max_buffered` lines in
+memory) are appended to an on-disk spool of fixed-size segment files. The
+spool is capped at `spool_max_bytes` by deleting the oldest segment, and is
+replayed oldest-first once writes succeed again.
+"""
+
+import gzip
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _escape(value, specials):
+    value = str(value).replace('\\', '\\\\')
+    for char in specials:
+        value = value.replace(char, '\\' + char)
+    return value.replace('\n', '\\n')
+
+
+def format_field(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f'{value}i'
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def encode_line(measurement, tags, fields, timestamp=None):
+    """One line of InfluxDB line protocol; None-valued fields are left out"""
+    key = _escape(measurement, ', ')
+    for tag, value in sorted(tags.items()):
+        if value is not None and value != '':
+            key += f",{_escape(tag, ',= ')}={_escape(value, ',= ')}"
+    field_set = ','.join(f"{_escape(name, ',= ')}={format_field(value)}"
+                         for name, value in fields.items() if value is not None)
+    if not field_set:
+        raise ValueError(f'{measurement} point has no fields')
+    line = f'{key} {field_set}'
+    return f'{line} {timestamp}' if timestamp is not None else line
+
+
+class LineSpool:
+    """Append-only overflow on disk, split into segments so the oldest can be dropped cheaply"""
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.dropped_bytes = 0
+        self._reading = None    # segment handed out by oldest(); appends never touch it
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.lp'))
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in self._segments())
+
+    def append(self, lines):
+        if not lines:
+            return
+        with self._lock:
+            segments = self._segments()
+            path = os.path.join(self.directory, segments[-1]) if segments else None
+            if path is None or path == self._reading or os.path.getsize(path) >= self.segment_bytes:
+                sequence = int(segments[-1][:-3]) + 1 if segments else 1
+                path = os.path.join(self.directory, f'{sequence:012d}.lp')
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            # Keep the newest data when the spool is full
+            segments = [name for name in self._segments() if os.path.join(self.directory, name) != self._reading]
+            total = self.size()
+            while total > self.max_bytes and len(segments) > 1:
+                oldest = os.path.join(self.directory, segments.pop(0))
+                size = os.path.getsize(oldest)
+                os.remove(oldest)
+                self.dropped_bytes += size
+                total -= size
+
+    def oldest(self):
+        """(path, lines) of the oldest segment, or None when the spool is empty"""
+        with self._lock:
+            for name in self._segments():
+                path = os.path.join(self.directory, name)
+                with open(path, encoding='utf-8') as f:
+                    lines = [line for line in f.read().split('\n') if line]
+                if lines:
+                    self._reading = path
+                    return path, lines
+                os.remove(path)
+            return None
+
+    def replace(self, path, lines):
+        """Rewrite a partially replayed segment with the lines still to send"""
+        with self._lock:
+            self._reading = None
+            if not lines:
+                os.remove(path)
+                return
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(tmp, path)
+
+
+class LineProtocolWriter:
+    def __init__(self, url, org, bucket, token='', precision='s', batch_size=5000, flush_interval=1.0,
+                 max_buffered=100000, max_retries=4, max_backoff=30.0, timeout=10,
+                 spool_dir='influx_spool', spool_max_bytes=256 * 1024 * 1024):
+        self.write_url = url.rstrip('/') + '/api/v2/write'
+        self.params = {'org': org, 'bucket': bucket, 'precision': precision}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.spool = LineSpool(spool_dir, max_bytes=spool_max_bytes)
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'text/plain; charset=utf-8', 'Content-Encoding': 'gzip'})
+        if token:
+            self.session.headers['Authorization'] = f'Token {token}'
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closing = False
+        self._healthy = True
+        self.stats = {'written': 0, 'batches': 0, 'retries': 0, 'failed_batches': 0, 'spilled': 0,
+                      'replayed': 0, 'rejected': 0}
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='influx-writer', daemon=True)
+                self._thread.start()
+
+    def write(self, lines):
+        """Queue encoded lines; never blocks on the network"""
+        if not self._thread:
+            self.start()
+        overflow = []
+        with self._cond:
+            self._buffer.extend(lines)
+            while len(self._buffer) > self.max_buffered:
+                overflow.append(self._buffer.popleft())
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        if overflow:
+            # Memory is bounded; the oldest lines wait on disk instead
+            self.spool.append(overflow)
+            self.stats['spilled'] += len(overflow)
+
+    def buffered(self):
+        return len(self._buffer)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['buffered'] = len(self._buffer)
+        stats['spool_bytes'] = self.spool.size()
+        stats['spool_dropped_bytes'] = self.spool.dropped_bytes
+        return stats
+
+    def close(self, timeout=10):
+        """Send what is buffered; whatever cannot be sent in time goes to the spool"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._cond:
+            leftover = list(self._buffer)
+            self._buffer.clear()
+        if leftover:
+            self.spool.append(leftover)
+            self.stats['spilled'] += len(leftover)
+
+    def _take_batch(self):
+        """Up to batch_size lines once a batch is full or flush_interval has passed; [] when idle"""
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closing and len(self._buffer) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._buffer), self.batch_size)
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def _post(self, lines):
+        """True on success, False if worth retrying; non-retryable rejections are dropped"""
+        body = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'), compresslevel=5)
+        try:
+            response = self.session.post(self.write_url, params=self.params, data=body, timeout=self.timeout)
+        except requests.RequestException:
+            return False, None
+        if response.status_code < 300:
+            return True, None
+        retry_after = response.headers.get('Retry-After')
+        if response.status_code in RETRYABLE_STATUS:
+            return False, float(retry_after) if retry_after and retry_after.isdigit() else None
+        # Malformed points will never be accepted; don't let them block everything behind them
+        print(f"InfluxDB rejected {len(lines)} lines: {response.status_code} {response.text[:200]}")
+        self.stats['rejected'] += len(lines)
+        return True, None
+
+    def _send(self, lines):
+        backoff = 0.5
+        for attempt in range(self.max_retries + 1):
+            ok, retry_after = self._post(lines)
+            if ok:
+                self.stats['batches'] += 1
+                return True
+            if attempt == self.max_retries or self._closing:
+                break
+            self.stats['retries'] += 1
+            time.sleep(min(retry_after or backoff, self.max_backoff))
+            backoff *= 2
+        self.stats['failed_batches'] += 1
+        return False
+
+    def _replay_segment(self):
+        """Send the oldest spooled segment; stops at the first failure"""
+        segment = self.spool.oldest()
+        if segment is None:
+            return
+        path, lines = segment
+        sent = 0
+        while sent < len(lines):
+            chunk = lines[sent:sent + self.batch_size]
+            ok, _ = self._post(chunk)
+            if not ok:
+                self._healthy = False
+                break
+            sent += len(chunk)
+            self.stats['replayed'] += len(chunk)
+        self.spool.replace(path, lines[sent:])
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                if self._send(batch):
+                    self.stats['written'] += len(batch)
+                    self._healthy = True
+                else:
+                    self.spool.append(batch)
+                    self.stats['spilled'] += len(batch)
+                    self._healthy = False
+            # One spooled segment per round, so a long backlog never starves fresh points
+            if self._healthy and not self._closing:
+                self._replay_segment()
+            with self._cond:
+                if self._closing and not self._buffer:
+                    return
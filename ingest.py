@@ -0,0 +1,234 @@
+"""
+Write-behind ingest pipeline for agent metrics.
+
+Request handlers validate samples and hand the resulting rows to an
+IngestQueue; a single writer thread drains the queue and commits rows in
+groups, running each configured statement with executemany over the same
+row parameters. Ingest throughput is therefore no longer bounded by one
+fsync per HTTP request.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class IngestQueue:
+    def __init__(self, database, statements, max_depth=50000, batch_size=500, max_delay=0.5, on_drop=None):
+        self.database = database        # db.Database; commits share its writer connection
+        self.statements = statements    # SQL run with executemany over each batch, in order, or
+                                        # (SQL, predicate) to run it over only the rows the predicate accepts
+        self.max_depth = max_depth      # rows held before producers are pushed back
+        self.batch_size = batch_size    # commit once this many rows are waiting...
+        self.max_delay = max_delay      # ...or once the oldest row has waited this long (seconds)
+        self.on_drop = on_drop          # called with each batch given up on after failed commits
+
+        self._rows = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._thread = None
+        self._stopping = False
+
+        self.stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'committed': 0,
+            'dropped': 0,
+            'commits': 0,
+            'commit_failures': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+            'last_batch_size': 0,
+        }
+
+    def start(self):
+        """Start the writer thread if it is not already running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    def offer(self, rows):
+        """Enqueue rows for writing; returns False if the queue cannot take all of them"""
+        if not self._thread:
+            self.start()
+
+        with self._lock:
+            if self._stopping or len(self._rows) + len(rows) > self.max_depth:
+                self.stats['rejected'] += len(rows)
+                return False
+            self._rows.extend(rows)
+            self.stats['enqueued'] += len(rows)
+            self._not_empty.notify()
+        return True
+
+    def depth(self):
+        with self._lock:
+            return len(self._rows)
+
+    def get_stats(self):
+        """Snapshot of queue depth and commit latency counters"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['depth'] = len(self._rows)
+        stats['max_depth'] = self.max_depth
+        stats['total_commit_ms'] = round(stats['total_commit_ms'], 3)
+        stats['avg_commit_ms'] = round(stats['total_commit_ms'] / stats['commits'], 3) if stats['commits'] else 0.0
+        stats['running'] = bool(self._thread and self._thread.is_alive())
+        return stats
+
+    def close(self, timeout=10):
+        """Stop accepting rows, flush everything queued and stop the writer"""
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify()
+            thread = self._thread
+        if thread:
+            thread.join(timeout)
+
+    def _take_batch(self):
+        """Block until a batch is due by size or age, then pop it"""
+        with self._lock:
+            while not self._rows and not self._stopping:
+                self._not_empty.wait()
+
+            deadline = time.monotonic() + self.max_delay
+            while len(self._rows) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+
+            count = min(len(self._rows), self.batch_size)
+            return [self._rows.popleft() for _ in range(count)]
+
+    def _commit(self, batch):
+        for attempt in range(3):
+            started = time.perf_counter()
+            try:
+                with self.database.writer() as conn:
+                    for statement in self.statements:
+                        if isinstance(statement, tuple):
+                            sql, wanted = statement
+                            conn.executemany(sql, [row for row in batch if wanted(row)])
+                        else:
+                            conn.executemany(statement, batch)
+            except sqlite3.OperationalError as e:
+                print(f"Ingest commit failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.1 * (attempt + 1))
+                continue
+            except Exception as e:
+                print(f"Ingest commit failed: {e}")
+                break
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.stats['committed'] += len(batch)
+                self.stats['commits'] += 1
+                self.stats['last_commit_ms'] = round(elapsed_ms, 3)
+                self.stats['max_commit_ms'] = max(self.stats['max_commit_ms'], round(elapsed_ms, 3))
+                self.stats['total_commit_ms'] += elapsed_ms
+                self.stats['last_batch_size'] = len(batch)
+            return
+
+        with self._lock:
+            self.stats['commit_failures'] += 1
+            self.stats['dropped'] += len(batch)
+        if self.on_drop:
+            try:
+                self.on_drop(batch)
+            except Exception as e:
+                print(f"Ingest drop handler failed: {e}")
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._commit(batch)
+            elif self._stopping:
+                break
+
+
+class SequenceFilter:
+    """
+    Drops agent samples the dashboard has already stored.
+
+    Spooling agents number their samples and resend them until a delivery
+    is acknowledged, so a sample whose response was lost arrives twice.
+    This keeps the highest sequence number queued per device, seeded from
+    the agent_sequences table, and refuses anything at or below it. Rows
+    carry the number in their last column, None for senders that do not
+    number samples.
+
+    Marks advance when rows are queued, so a resend arriving before the
+    commit is still caught. Rows in a batch the writer drops are passed to
+    release(), which admits each of those numbers once more.
+    """
+
+    def __init__(self):
+        self._marks = {}
+        self._released = {}     # device_id -> numbers at or below the mark that were never stored
+        self._lock = threading.Lock()
+        self.stats = {'admitted': 0, 'duplicates': 0, 'released': 0}
+
+    def load(self, marks):
+        """Seed high-water marks from (device_id, last_seq) pairs"""
+        with self._lock:
+            for device_id, seq in marks:
+                if seq > self._marks.get(device_id, -1):
+                    self._marks[device_id] = seq
+
+    def admit(self, rows, offer):
+        """Pass unseen rows to `offer`; returns one fresh flag per row, or None if `offer` refused them"""
+        with self._lock:
+            marks = {}
+            refilled = set()
+            fresh = []
+            for row in rows:
+                device_id, seq = row[0], row[-1]
+                if seq is None:
+                    fresh.append(True)
+                    continue
+                mark = marks.get(device_id, self._marks.get(device_id, -1))
+                if seq > mark:
+                    marks[device_id] = seq
+                    fresh.append(True)
+                elif seq in self._released.get(device_id, ()) and (device_id, seq) not in refilled:
+                    refilled.add((device_id, seq))
+                    fresh.append(True)
+                else:
+                    fresh.append(False)
+
+            admitted = [row for row, is_fresh in zip(rows, fresh) if is_fresh]
+            # Marks only advance once the rows are queued, so refused rows can be resent
+            if admitted and not offer(admitted):
+                return None
+            self._marks.update(marks)
+            for device_id, seq in refilled:
+                released = self._released[device_id]
+                released.discard(seq)
+                if not released:
+                    del self._released[device_id]
+            self.stats['admitted'] += len(admitted)
+            self.stats['duplicates'] += len(rows) - len(admitted)
+            return fresh
+
+    def release(self, rows):
+        """Admit these rows' numbers again; their batch was dropped before it was stored"""
+        with self._lock:
+            for row in rows:
+                device_id, seq = row[0], row[-1]
+                if seq is not None:
+                    self._released.setdefault(device_id, set()).add(seq)
+                    self.stats['released'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['devices'] = len(self._marks)
+            stats['pending_release'] = sum(len(released) for released in self._released.values())
+        return stats
@@ -71,6 +71,42 @@ install_agent() {
         exit 1
     fi
     
+    # Scheduled collectors shared by the agents; required
+    if [[ -f "agent_collectors.py" ]]; then
+        cp agent_collectors.py $INSTALL_DIR/
+    else
+        print_error "agent_collectors.py not found in current directory"
+        exit 1
+    fi
+    
+    # Dashboard transport (negotiation, spool replay, backoff) shared by the agents; required
+    if [[ -f "agent_transport.py" ]]; then
+        cp agent_transport.py $INSTALL_DIR/
+    else
+        print_error "agent_transport.py not found in current directory"
+        exit 1
+    fi
+    
+    # Compact metric encoding; without it the agent sends plain JSON
+    if [[ -f "agent_codec.py" ]]; then
+        cp agent_codec.py $INSTALL_DIR/
+    fi
+    
+    # Durable spool for samples taken while the dashboard is down
+    if [[ -f "agent_spool.py" ]]; then
+        cp agent_spool.py $INSTALL_DIR/
+    fi
+    
+    # Delta and heartbeat reporting; without it every sample is sent in full
+    if [[ -f "agent_delta.py" ]]; then
+        cp agent_delta.py $INSTALL_DIR/
+    fi
+    
+    # Background sampling with window aggregates; without it CPU is averaged per report
+    if [[ -f "agent_sampler.py" ]]; then
+        cp agent_sampler.py $INSTALL_DIR/
+    fi
+    
     chmod +x $INSTALL_DIR/monitoring_agent_linux.py
     
     # Create configuration file
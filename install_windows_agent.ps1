@@ -89,6 +89,40 @@ function Install-Agent {
     # Copy agent script
     Copy-Item "monitoring_agent_windows.py" "$InstallDir\" -Force
     
+    # Scheduled collectors shared by the agents; required
+    if (!(Test-Path "agent_collectors.py")) {
+        Write-Error "agent_collectors.py not found in current directory"
+        exit 1
+    }
+    Copy-Item "agent_collectors.py" "$InstallDir\" -Force
+    
+    # Dashboard transport (negotiation, spool replay, backoff) shared by the agents; required
+    if (!(Test-Path "agent_transport.py")) {
+        Write-Error "agent_transport.py not found in current directory"
+        exit 1
+    }
+    Copy-Item "agent_transport.py" "$InstallDir\" -Force
+    
+    # Compact metric encoding; without it the agent sends plain JSON
+    if (Test-Path "agent_codec.py") {
+        Copy-Item "agent_codec.py" "$InstallDir\" -Force
+    }
+    
+    # Durable spool for samples taken while the dashboard is down
+    if (Test-Path "agent_spool.py") {
+        Copy-Item "agent_spool.py" "$InstallDir\" -Force
+    }
+    
+    # Delta and heartbeat reporting; without it every sample is sent in full
+    if (Test-Path "agent_delta.py") {
+        Copy-Item "agent_delta.py" "$InstallDir\" -Force
+    }
+    
+    # Background sampling with window aggregates; without it CPU is averaged per report
+    if (Test-Path "agent_sampler.py") {
+        Copy-Item "agent_sampler.py" "$InstallDir\" -Force
+    }
+    
     # Create configuration file
     $config = @{
         dashboard_url = $DashboardUrl
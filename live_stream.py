@@ -0,0 +1,258 @@
+"""
+Server-Sent Events push stream for live dashboard updates.
+
+Flask serves every request on its own thread, which suits short API calls
+but would pin a thread to each open dashboard for a long-lived stream. The
+stream is therefore served by a small asyncio HTTP server running in a
+background thread on its own port, and each viewer is one coroutine.
+
+Ingest publishes device states and new metric points from any thread.
+Updates are collected for batch_interval seconds and handed to the loop as
+one batch, and states equal to the last published one are dropped. Each batch is serialized once and the same bytes
+go to every client that is caught up. A client still draining an earlier
+event instead collects changes in a pending dict keyed by device, so newer
+states replace older ones rather than queueing behind them, and only the
+last few points per device are kept. A client whose socket stays blocked for
+stall_timeout seconds is disconnected; EventSource reconnects on its own and
+starts again from a full snapshot.
+"""
+
+import asyncio
+import itertools
+import json
+import socket
+import threading
+from urllib.parse import urlsplit
+
+STREAM_PATH = '/api/stream'
+
+
+class _Client:
+    __slots__ = ('writer', 'shared', 'states', 'points', 'busy', 'wake')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.shared = None      # (payload, states, points) of a batch this client has not been sent yet
+        self.states = {}        # device_id -> newest unsent state, None once removed
+        self.points = {}        # device_id -> [point, ...] not sent yet
+        self.busy = False       # writing or draining an event
+        self.wake = asyncio.Event()
+
+
+class LiveHub:
+    def __init__(self, host='0.0.0.0', port=5001, max_clients=2000, batch_interval=0.1, keepalive=15,
+                 stall_timeout=30, points_per_device=10, write_buffer=256 * 1024):
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.batch_interval = batch_interval        # seconds publishes are collected before fanning out
+        self.keepalive = keepalive                  # seconds between comment lines on an idle stream
+        self.stall_timeout = stall_timeout          # seconds a client may leave its socket full
+        self.points_per_device = points_per_device  # newest points kept per device for a lagging client
+        self.write_buffer = write_buffer
+
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._incoming_states = {}
+        self._incoming_points = {}
+        self._scheduled = False
+        self._state = {}                            # device_id -> last published state, for new clients
+        self._clients = set()
+        self._tasks = set()
+        self._seq = itertools.count(1)
+        self.stats = {'published': 0, 'changes': 0, 'events': 0, 'coalesced': 0, 'points_dropped': 0,
+                      'connects': 0, 'rejected': 0, 'stalled': 0}
+
+    def start(self):
+        """Start the loop thread and listen for stream clients"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='live-stream', daemon=True)
+            self._thread.start()
+            ready.wait()
+        try:
+            self._server = asyncio.run_coroutine_threadsafe(
+                asyncio.start_server(self._handle, self.host, self.port, backlog=1024), self._loop).result()
+        except OSError as e:
+            print(f"Live stream disabled, cannot listen on port {self.port}: {e}")
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def listening(self):
+        return self._server is not None
+
+    def close(self):
+        with self._lock:
+            if self._loop is None or self._closed:
+                return
+            self._closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(5)
+        except Exception as e:
+            print(f"Live stream shutdown failed: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def publish(self, device_id, state, point=None):
+        """Record a device's current state and optionally a new (timestamp, values) point"""
+        if self._loop is None:
+            return
+        with self._lock:
+            self.stats['published'] += 1
+            self._incoming_states[device_id] = state
+            if point is not None:
+                self._incoming_points.setdefault(device_id, []).append(point)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._loop.call_soon_threadsafe(self._loop.call_later, self.batch_interval, self._fanout)
+
+    def remove(self, device_id):
+        """Tell clients a device is gone"""
+        self.publish(device_id, None)
+
+    def _fanout(self):
+        with self._lock:
+            states, self._incoming_states = self._incoming_states, {}
+            points, self._incoming_points = self._incoming_points, {}
+            self._scheduled = False
+
+        changed = {}
+        for device_id, state in states.items():
+            if state is None:
+                if self._state.pop(device_id, None) is not None:
+                    changed[device_id] = None
+            elif self._state.get(device_id) != state:
+                self._state[device_id] = state
+                changed[device_id] = state
+        if not changed and not points:
+            return
+        self.stats['changes'] += len(changed)
+
+        payload = None
+        for client in self._clients:
+            if client.shared is None and not client.busy and not client.states and not client.points:
+                # Caught up: reuse one serialized event for every such client
+                if payload is None:
+                    payload = (self._event('update', changed, points), changed, points)
+                client.shared = payload
+            else:
+                self._merge(client, changed, points)
+            client.wake.set()
+
+    def _merge(self, client, changed, points):
+        if client.shared is not None:
+            _, shared_states, shared_points = client.shared
+            client.shared = None
+            self._merge(client, shared_states, shared_points)
+        pending = client.states
+        for device_id, state in changed.items():
+            if device_id in pending:
+                self.stats['coalesced'] += 1
+            pending[device_id] = state
+        limit = self.points_per_device
+        for device_id, new_points in points.items():
+            queue = client.points.setdefault(device_id, [])
+            queue.extend(new_points)
+            if len(queue) > limit:
+                self.stats['points_dropped'] += len(queue) - limit
+                del queue[:-limit]
+
+    def _event(self, name, devices, points):
+        data = json.dumps({'devices': devices, 'points': points}, separators=(',', ':'))
+        self.stats['events'] += 1
+        return f'id: {next(self._seq)}\nevent: {name}\ndata: {data}\n\n'.encode()
+
+    @staticmethod
+    async def _reply(writer, status, extra=''):
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n{extra}\r\n'.encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        request = head.split(b'\r\n', 1)[0].decode('latin-1').split()
+        if len(request) < 2 or request[0] != 'GET' or urlsplit(request[1]).path != STREAM_PATH:
+            await self._reply(writer, '404 Not Found')
+            return
+        if len(self._clients) >= self.max_clients:
+            self.stats['rejected'] += 1
+            await self._reply(writer, '503 Service Unavailable', 'Retry-After: 10\r\n')
+            return
+
+        # Bound what one stalled viewer can hold in user space and in the kernel
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.write_buffer)
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n'
+                     b'Connection: keep-alive\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n'
+                     b'X-Accel-Buffering: no\r\n\r\n'
+                     b'retry: 3000\n\n')
+        writer.write(self._event('snapshot', self._state, {}))
+        client = _Client(writer)
+        task = asyncio.current_task()
+        self._clients.add(client)
+        self._tasks.add(task)
+        self.stats['connects'] += 1
+        try:
+            while not reader.at_eof():
+                try:
+                    await asyncio.wait_for(client.wake.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    writer.write(b': keepalive\n\n')
+                else:
+                    client.wake.clear()
+                    if client.shared is not None:
+                        writer.write(client.shared[0])
+                        client.shared = None
+                    else:
+                        states, client.states = client.states, {}
+                        points, client.points = client.points, {}
+                        writer.write(self._event('update', states, points))
+                # Updates published while this waits are coalesced into client.states
+                client.busy = True
+                await asyncio.wait_for(writer.drain(), self.stall_timeout)
+                client.busy = False
+        except asyncio.TimeoutError:
+            self.stats['stalled'] += 1
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(client)
+            self._tasks.discard(task)
+            writer.transport.abort()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['clients'] = len(self._clients)
+        stats['devices'] = len(self._state)
+        stats['port'] = self.port
+        return stats
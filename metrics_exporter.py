@@ -0,0 +1,223 @@
+"""
+Prometheus exposition for /metrics, built from in-memory state.
+
+Per-device series come from the recent store (latest agent or poller
+sample) and the reachability prober (latest probe), so a scrape never
+touches SQLite. Only the device labels (name, address, type) are loaded
+from the database, and only after a device is added, changed or removed,
+or every `labels_ttl` seconds.
+
+Device labels go on one netmon_device_info series per device; every other
+device series carries only device_id, which keeps a 10k-device scrape to a
+few megabytes. Those series are written straight into the exposition text
+with label strings escaped once per device, because building one
+prometheus_client sample object per value costs about a second at that
+size. NetMon's own internals (HTTP requests, ingest queue, poller and
+reachability cycles) are small and go through a prometheus_client registry
+with a custom collector, appended after the device series.
+
+A rendered scrape is reused for `cache_ttl` seconds, so concurrent scrapers
+share one render.
+"""
+
+import math
+import threading
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Status as a number; a device with no sample and no probe yet is -1
+STATUS_CODES = {'healthy': 0, 'warning': 1, 'critical': 2}
+
+# (series name, type, help, recent store metric); counters are the device's cumulative totals, so
+# Prometheus rate() works on them
+DEVICE_SERIES = (
+    ('netmon_device_cpu_usage_percent', 'gauge', 'CPU usage reported by the device', 'cpu_usage'),
+    ('netmon_device_memory_usage_percent', 'gauge', 'Memory usage reported by the device', 'memory_usage'),
+    ('netmon_device_disk_usage_percent', 'gauge', 'Disk usage reported by the device', 'disk_usage'),
+    ('netmon_device_network_receive_bytes_total', 'counter', 'Bytes received by the device', 'network_in'),
+    ('netmon_device_network_transmit_bytes_total', 'counter', 'Bytes sent by the device', 'network_out'),
+    ('netmon_device_network_receive_bytes_per_second', 'gauge',
+     'Receive rate over the latest sample window or poll interval', 'network_in_rate'),
+    ('netmon_device_network_transmit_bytes_per_second', 'gauge',
+     'Transmit rate over the latest sample window or poll interval', 'network_out_rate'),
+    ('netmon_device_load_average', 'gauge', 'One-minute load average reported by the device', 'load_average'),
+)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _InternalsCollector:
+    """NetMon's own ingest, poller and reachability counters"""
+
+    def __init__(self, ingest_queue, poller, reachability):
+        self.ingest_queue = ingest_queue
+        self.poller = poller
+        self.reachability = reachability
+
+    def collect(self):
+        ingest = self.ingest_queue.get_stats()
+        for name, key, text in (('netmon_ingest_rows_enqueued', 'enqueued', 'Metric rows accepted into the queue'),
+                                ('netmon_ingest_rows_rejected', 'rejected', 'Metric rows refused because the queue was full'),
+                                ('netmon_ingest_rows_committed', 'committed', 'Metric rows committed to SQLite'),
+                                ('netmon_ingest_rows_dropped', 'dropped', 'Metric rows dropped after failed commits'),
+                                ('netmon_ingest_commits', 'commits', 'Group commits'),
+                                ('netmon_ingest_commit_failures', 'commit_failures', 'Failed group commits')):
+            yield CounterMetricFamily(name, text, value=ingest[key])
+        yield CounterMetricFamily('netmon_ingest_commit_seconds', 'Time spent committing',
+                                  value=ingest['total_commit_ms'] / 1000)
+        yield GaugeMetricFamily('netmon_ingest_queue_depth', 'Metric rows waiting to be committed',
+                                value=ingest['depth'])
+        yield GaugeMetricFamily('netmon_ingest_last_commit_seconds', 'Duration of the latest commit',
+                                value=ingest['last_commit_ms'] / 1000)
+
+        poller = self.poller.get_stats()
+        yield CounterMetricFamily('netmon_poller_polls', 'Agentless polls completed', value=poller['polls'])
+        yield CounterMetricFamily('netmon_poller_failures', 'Agentless polls that failed', value=poller['failures'])
+        yield GaugeMetricFamily('netmon_poller_devices', 'Devices on the poll schedule', value=poller['devices'])
+        yield GaugeMetricFamily('netmon_poller_in_flight', 'Polls running now', value=poller['in_flight'])
+        yield GaugeMetricFamily('netmon_poller_queue_depth', 'Polls due but not started', value=poller['queue_depth'])
+        for name, key, text in (('netmon_poller_poll_duration_seconds', 'duration_ms', 'Recent poll durations'),
+                                ('netmon_poller_lag_seconds', 'lag_ms', 'Recent delay between a poll falling due and starting')):
+            family = GaugeMetricFamily(name, text, labels=['quantile'])
+            for quantile, label in (('p50', '0.5'), ('p95', '0.95'), ('max', '1')):
+                family.add_metric([label], poller[key][quantile] / 1000)
+            yield family
+
+        reachability = self.reachability.get_stats()
+        yield CounterMetricFamily('netmon_reachability_cycles', 'Probe cycles completed', value=reachability['cycles'])
+        yield CounterMetricFamily('netmon_reachability_overruns', 'Probe cycles that overran the interval',
+                                  value=reachability['overruns'])
+        yield GaugeMetricFamily('netmon_reachability_last_cycle_seconds', 'Duration of the latest probe cycle',
+                                value=reachability['last_cycle_ms'] / 1000)
+        family = GaugeMetricFamily('netmon_reachability_devices', 'Devices by result of the latest cycle',
+                                   labels=['result'])
+        family.add_metric(['reachable'], reachability['reachable'])
+        family.add_metric(['unreachable'], reachability['unreachable'])
+        yield family
+
+
+class MetricsExporter:
+    def __init__(self, load_devices, recent, reachability, ingest_queue, poller, cache_ttl=1, labels_ttl=300):
+        self.load_devices = load_devices    # () -> [(id, name, ip_address, device_type), ...] of enabled devices
+        self.recent = recent
+        self.reachability = reachability
+        self.cache_ttl = cache_ttl
+        self.labels_ttl = labels_ttl
+
+        self.registry = CollectorRegistry()
+        self.registry.register(_InternalsCollector(ingest_queue, poller, reachability))
+        self.http_requests = Counter('netmon_http_requests', 'HTTP requests served',
+                                     ['method', 'endpoint', 'status'], registry=self.registry)
+        self.http_duration = Histogram('netmon_http_request_duration_seconds', 'HTTP request duration',
+                                       ['endpoint'], registry=self.registry,
+                                       buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+        self._lock = threading.Lock()
+        self._devices = None                # [(device_id, '{device_id="..."}')]
+        self._info = ''
+        self._labels_at = 0.0
+        self._body = None
+        self._rendered_at = 0.0
+        self.stats = {'scrapes': 0, 'renders': 0, 'label_loads': 0, 'last_render_ms': 0.0, 'max_render_ms': 0.0,
+                      'last_size': 0}
+
+    def reload(self):
+        """Reload device labels on the next scrape"""
+        with self._lock:
+            self._devices = None
+            self._body = None
+
+    def observe_request(self, method, endpoint, status, seconds):
+        self.http_requests.labels(method, endpoint, status).inc()
+        self.http_duration.labels(endpoint).observe(seconds)
+
+    def render(self):
+        """Exposition text for a scrape, rendered at most once per cache_ttl"""
+        with self._lock:
+            self.stats['scrapes'] += 1
+            now = time.monotonic()
+            if self._body is not None and now - self._rendered_at < self.cache_ttl:
+                return self._body
+            if self._devices is None or now - self._labels_at >= self.labels_ttl:
+                self._load_labels()
+            started = time.perf_counter()
+            self._body = self._render_devices() + generate_latest(self.registry)
+            self._rendered_at = now
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stats['renders'] += 1
+            self.stats['last_render_ms'] = round(elapsed, 1)
+            self.stats['max_render_ms'] = max(self.stats['max_render_ms'], round(elapsed, 1))
+            self.stats['last_size'] = len(self._body)
+            return self._body
+
+    def _load_labels(self):
+        devices = []
+        info = ['# HELP netmon_device_info Monitored device labels\n# TYPE netmon_device_info gauge\n']
+        for device_id, name, ip_address, device_type in self.load_devices():
+            labels = f'{{device_id="{device_id}"}}'
+            devices.append((device_id, labels))
+            info.append(f'netmon_device_info{{device_id="{device_id}",name="{escape_label(name)}",'
+                        f'ip_address="{escape_label(ip_address)}",device_type="{escape_label(device_type)}"}} 1\n')
+        self._devices = devices
+        self._info = ''.join(info)
+        self._labels_at = time.monotonic()
+        self.stats['label_loads'] += 1
+
+    def _render_devices(self):
+        now = time.time()
+        latest = self.recent.latest_rows()
+        probes = self.reachability.get
+        columns = [(name, kind, text, self.recent.metrics.index(metric)) for name, kind, text, metric in DEVICE_SERIES]
+        rtt_index = self.recent.metrics.index('response_time')
+
+        status = ['# HELP netmon_device_status Device status: 0 healthy, 1 warning, 2 critical, -1 unknown\n'
+                  '# TYPE netmon_device_status gauge\n']
+        rtt = ['# HELP netmon_device_rtt_milliseconds Round-trip time from the latest probe or sample\n'
+               '# TYPE netmon_device_rtt_milliseconds gauge\n']
+        loss = ['# HELP netmon_device_packet_loss_ratio Share of probes lost in the latest cycle\n'
+                '# TYPE netmon_device_packet_loss_ratio gauge\n']
+        age = ['# HELP netmon_device_last_seen_age_seconds Seconds since the latest sample\n'
+               '# TYPE netmon_device_last_seen_age_seconds gauge\n']
+        series = [[f'# HELP {name} {text}\n# TYPE {name} {kind}\n'] for name, kind, text, _ in columns]
+
+        for device_id, labels in self._devices:
+            sample = latest.get(device_id)
+            probe = probes(device_id)
+            code = -1
+            response_time = math.nan
+            if sample is not None:
+                reported, ts, values = sample
+                code = STATUS_CODES.get(reported, -1)
+                response_time = values[rtt_index]
+                age.append(f'netmon_device_last_seen_age_seconds{labels} {max(0.0, now - ts):.7g}\n')
+                for lines, (name, kind, _, index) in zip(series, columns):
+                    value = values[index]
+                    if math.isnan(value):
+                        continue
+                    if kind == 'counter':
+                        lines.append(f'{name}{labels} {int(value)}\n')
+                    else:
+                        lines.append(f'{name}{labels} {value:.7g}\n')
+            if probe is not None:
+                # Worst status wins, as on the dashboard
+                code = max(code, STATUS_CODES[probe['status']])
+                if probe['rtt_ms'] is not None:
+                    response_time = probe['rtt_ms']
+                loss.append(f'netmon_device_packet_loss_ratio{labels} {probe["loss"]:.7g}\n')
+            status.append(f'netmon_device_status{labels} {code}\n')
+            if not math.isnan(response_time):
+                rtt.append(f'netmon_device_rtt_milliseconds{labels} {response_time:.7g}\n')
+
+        parts = [self._info] + status + rtt + loss + age
+        for lines in series:
+            parts.extend(lines)
+        return ''.join(parts).encode()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['devices'] = len(self._devices) if self._devices is not None else None
+        return stats
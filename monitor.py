@@ -1,6 +1,6 @@
-from ping3 import ping
-from datetime import datetime
-from influxdb_client import InfluxDBClient, Point, WritePrecision
+import time
+from influx_writer import LineProtocolWriter, encode_line
+from reachability import ReachabilityProber
 
 # InfluxDB config
 INFLUX_URL = "http://localhost:8086"
@@ -8,33 +8,59 @@ INFLUX_TOKEN = ""
 INFLUX_ORG = "mojosec"
 INFLUX_BUCKET = "NetMon"
 
-client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-write_api = client.write_api()
+# Pipeline config
+POLL_INTERVAL = 15          # seconds between probe cycles
+WRITE_BATCH_SIZE = 5000     # lines per /api/v2/write request
+WRITE_FLUSH_INTERVAL = 1.0  # seconds before a partial batch is sent anyway
+MAX_BUFFERED_LINES = 100000 # lines held in memory before spilling to disk
+SPOOL_DIR = "influx_spool"  # on-disk overflow while InfluxDB is unavailable
 
-# Devices to monitor
+# Points are encoded as line protocol and sent by a background writer; see influx_writer.py
+writer = LineProtocolWriter(
+    INFLUX_URL, INFLUX_ORG, INFLUX_BUCKET, token=INFLUX_TOKEN, precision="s",
+    batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL,
+    max_buffered=MAX_BUFFERED_LINES, spool_dir=SPOOL_DIR,
+)
+
+# Devices to monitor; port is used for TCP probes when ICMP is not permitted
 DEVICES = [
-    {"name": "Google DNS", "ip": "8.8.8.8"},
-    {"name": "Cloudflare DNS", "ip": "1.1.1.1"},
-    {"name": "Local Router", "ip": "192.168.1.1"},
+    {"id": "Google DNS", "name": "Google DNS", "ip_address": "8.8.8.8", "port": 53},
+    {"id": "Cloudflare DNS", "name": "Cloudflare DNS", "ip_address": "1.1.1.1", "port": 53},
+    {"id": "Local Router", "name": "Local Router", "ip_address": "192.168.1.1", "port": 80},
 ]
 
-def check_device(device):
-    try:
-        response_time = ping(device["ip"], timeout=2)
-        status = 1 if response_time else 0
-        return status, round(response_time * 1000, 2) if response_time else None
-    except Exception:
-        return 0, None
+# Probes every device concurrently, so one dead host no longer stalls the cycle
+prober = ReachabilityProber(lambda: DEVICES)
+
+def encode_device_status(device, result, timestamp):
+    return encode_line(
+        "device_status",
+        {"device": device["name"], "ip": device["ip_address"]},
+        {
+            "status": 0 if result["status"] == "critical" else 1,
+            "response_time": float(result["rtt_ms"]) if result["rtt_ms"] is not None else 0.0,
+            "jitter": float(result["jitter_ms"]) if result["jitter_ms"] is not None else 0.0,
+            "packet_loss": float(result["loss"]),
+        },
+        timestamp,
+    )
 
 def update_devices():
-    for device in DEVICES:
-        status, response_time = check_device(device)
-        point = (
-            Point("device_status")
-            .tag("device", device["name"])
-            .tag("ip", device["ip"])
-            .field("status", status)
-            .field("response_time", float(response_time) if response_time is not None else 0.0)
-            .time(datetime.utcnow(), WritePrecision.NS)
-        )
-        write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=point)
+    results = prober.run_cycle(DEVICES)
+    timestamp = int(time.time())
+    writer.write([encode_device_status(device, results[device["id"]], timestamp) for device in DEVICES])
+
+def main():
+    try:
+        while True:
+            started = time.monotonic()
+            update_devices()
+            time.sleep(max(0.0, POLL_INTERVAL - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        prober.stop()
+
+if __name__ == "__main__":
+    main()
@@ -4,135 +4,84 @@ Windows Monitoring Agent for Network Monitoring Dashboard
 Collects system metrics and sends them to the dashboard
 """
 
-import psutil
-import requests
 import time
-import json
 import socket
-import platform
-import os
-from datetime import datetime
+import logging
+from datetime import datetime, timezone
 
-class WindowsMonitoringAgent:
-    def __init__(self, dashboard_url, device_id, api_key=None):
-        self.dashboard_url = dashboard_url.rstrip('/')
-        self.device_id = device_id
-        self.api_key = api_key
+import agent_collectors
+import agent_transport
+
+try:
+    import agent_sampler
+except ImportError:
+    agent_sampler = None  # installed without agent_sampler.py: CPU usage is averaged over the interval only
+
+try:
+    import wmi
+except ImportError:
+    wmi = None  # no OS caption or CPU temperature without the wmi package
+
+
+class WindowsMonitoringAgent(agent_transport.DashboardClient):
+    def __init__(self, dashboard_url, device_id, api_key=None, batch_size=1, spool_dir=None, report_mode='delta', sample_interval=1.0,
+                 collector_intervals=None):
+        super().__init__(dashboard_url, device_id, api_key, batch_size, spool_dir, report_mode)
         self.hostname = socket.gethostname()
-        self.interval = 30  # seconds
+        self.sampler = None  # samples every sample_interval seconds in the background; see agent_sampler.py
+        if agent_sampler is not None:
+            self.sampler = agent_sampler.MetricSampler(sample_interval)
+        self._wmi = {}  # WMI connections by namespace, kept for the life of the agent
+        collectors = agent_collectors.standard_collectors(self.sampler, 'C:')
+        # After 'system', so the WMI caption replaces platform.platform(); WMI queries are slow, so run rarely
+        collectors['os_info'] = (self.collect_os_info, 3600)
+        collectors['thermal'] = (self.collect_thermal, 60)
+        self.collectors = agent_collectors.CollectorSet(collectors, collector_intervals, self.sampler)
         
     def get_system_metrics(self):
-        """Collect comprehensive system metrics for Windows"""
+        """Sample built from the collectors that are due and the latest values of the rest; see agent_collectors.py"""
+        metrics = {
+            'device_id': self.device_id,
+            'hostname': self.hostname,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        metrics.update(self.collectors.collect())
+        return metrics
+    
+    def wmi_connection(self, namespace='root\\cimv2'):
+        """Cached WMI connection for a namespace, opened on first use; None without the wmi package"""
+        if wmi is None:
+            return None
+        connection = self._wmi.get(namespace)
+        if connection is None:
+            connection = self._wmi[namespace] = wmi.WMI(namespace=namespace)
+        return connection
+    
+    def collect_os_info(self):
+        """Windows edition and version"""
+        connection = self.wmi_connection()
+        if connection is None:
+            return {}
         try:
-            # CPU metrics
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            
-            # Memory metrics
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
-            
-            # Disk metrics (C: drive)
-            disk = psutil.disk_usage('C:')
-            disk_io = psutil.disk_io_counters()
-            
-            # Network metrics
-            network = psutil.net_io_counters()
-            
-            # System info
-            boot_time = psutil.boot_time()
-            uptime_seconds = time.time() - boot_time
-            uptime_days = int(uptime_seconds // 86400)
-            uptime_hours = int((uptime_seconds % 86400) // 3600)
-            uptime_minutes = int((uptime_seconds % 3600) // 60)
-            
-            # Windows-specific metrics
-            try:
-                import wmi
-                c = wmi.WMI()
-                
-                # Get Windows version
-                os_info = c.Win32_OperatingSystem()[0]
-                windows_version = f"{os_info.Caption} {os_info.Version}"
-                
-                # Get CPU temperature (if available)
-                cpu_temp = None
-                try:
-                    temp_info = c.MSAcpi_ThermalZoneTemperature()
-                    if temp_info:
-                        cpu_temp = round((temp_info[0].CurrentTemperature / 10.0) - 273.15, 1)
-                except:
-                    pass
-                    
-            except ImportError:
-                windows_version = platform.platform()
-                cpu_temp = None
-            
-            metrics = {
-                'device_id': self.device_id,
-                'hostname': self.hostname,
-                'timestamp': datetime.now().isoformat(),
-                'cpu_usage': round(cpu_percent, 1),
-                'cpu_count': cpu_count,
-                'cpu_temperature': cpu_temp,
-                'memory_usage': round(memory.percent, 1),
-                'memory_total': memory.total,
-                'memory_available': memory.available,
-                'swap_usage': round(swap.percent, 1) if swap.total > 0 else 0,
-                'disk_usage': round((disk.used / disk.total) * 100, 1),
-                'disk_total': disk.total,
-                'disk_free': disk.free,
-                'disk_read_bytes': disk_io.read_bytes if disk_io else 0,
-                'disk_write_bytes': disk_io.write_bytes if disk_io else 0,
-                'network_bytes_sent': network.bytes_sent,
-                'network_bytes_recv': network.bytes_recv,
-                'network_packets_sent': network.packets_sent,
-                'network_packets_recv': network.packets_recv,
-                'uptime': f"{uptime_days}d {uptime_hours}h {uptime_minutes}m",
-                'uptime_seconds': int(uptime_seconds),
-                'platform': windows_version,
-                'status': 'healthy'
-            }
-            
-            return metrics
-            
-        except Exception as e:
-            print(f"Error collecting metrics: {e}")
-            return {
-                'device_id': self.device_id,
-                'hostname': self.hostname,
-                'timestamp': datetime.now().isoformat(),
-                'status': 'error',
-                'error': str(e)
-            }
+            os_info = connection.Win32_OperatingSystem()[0]
+        except Exception:
+            self._wmi.pop('root\\cimv2', None)  # the connection may have gone stale; reopen it next run
+            raise
+        return {'platform': f"{os_info.Caption} {os_info.Version}"}
     
-    def send_metrics(self, metrics):
-        """Send metrics to dashboard"""
+    def collect_thermal(self):
+        """CPU temperature from ACPI thermal zones, where the machine exposes any"""
+        connection = self.wmi_connection('root\\wmi')
+        if connection is None:
+            return {'cpu_temperature': None}
         try:
-            headers = {'Content-Type': 'application/json'}
-            if self.api_key:
-                headers['Authorization'] = f'Bearer {self.api_key}'
-            
-            response = requests.post(
-                f"{self.dashboard_url}/api/metrics/submit",
-                json=metrics,
-                headers=headers,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                print(f"✓ Metrics sent successfully at {metrics['timestamp']}")
-                return True
-            else:
-                print(f"✗ Failed to send metrics: {response.status_code} - {response.text}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            print(f"✗ Network error sending metrics: {e}")
-            return False
-        except Exception as e:
-            print(f"✗ Error sending metrics: {e}")
-            return False
+            zones = connection.MSAcpi_ThermalZoneTemperature()
+        except Exception:
+            # Most VMs and many desktops have no thermal zones, or show them only to administrators
+            return {'cpu_temperature': None}
+        if not zones:
+            return {'cpu_temperature': None}
+        return {'cpu_temperature': round((zones[0].CurrentTemperature / 10.0) - 273.15, 1)}
     
     def run(self):
         """Main monitoring loop"""
@@ -140,16 +89,39 @@ class WindowsMonitoringAgent:
         print(f"Dashboard URL: {self.dashboard_url}")
         print(f"Hostname: {self.hostname}")
         print(f"Update interval: {self.interval} seconds")
+        print(f"Batch size: {self.batch_size} samples")
+        print(f"Reporting: {'deltas and heartbeats' if self.delta is not None else 'full samples'}")
+        if self.sampler is not None:
+            print(f"Sampling every {self.sampler.interval} seconds")
+            self.sampler.start()
+        if self.spool is not None:
+            print(f"Spool: {self.spool.directory} ({self.spool.pending()} samples waiting)")
         print("-" * 50)
         
+        next_sample = time.monotonic()
         while True:
             try:
-                metrics = self.get_system_metrics()
-                self.send_metrics(metrics)
-                time.sleep(self.interval)
+                if time.monotonic() >= next_sample:
+                    next_sample = max(next_sample + self.interval, time.monotonic())
+                    metrics = self.get_system_metrics()
+                    self.send_metrics(metrics)
+                elif self.spool is not None:
+                    self.drain_spool()
+                
+                # Wake early to carry on replaying a backlog
+                wake = next_sample
+                if self.spool is not None and self.spool.pending() >= self.batch_size:
+                    wake = min(wake, self.send_at)
+                time.sleep(max(0.0, wake - time.monotonic()))
                 
             except KeyboardInterrupt:
                 print("\n⚠ Monitoring agent stopped by user")
+                self.flush_metrics()
+                if self.spool is not None:
+                    self.spool.close()
+                if self.sampler is not None:
+                    self.sampler.stop()
+                self.collectors.log_stats()
                 break
             except Exception as e:
                 print(f"✗ Unexpected error: {e}")
@@ -159,13 +131,19 @@ if __name__ == "__main__":
     import sys
     
     if len(sys.argv) < 3:
-        print("Usage: python monitoring_agent_windows.py <dashboard_url> <device_id> [api_key]")
+        print("Usage: python monitoring_agent_windows.py <dashboard_url> <device_id> [api_key] [batch_size] [spool_dir] [full|delta] [sample_interval]")
         print("Example: python monitoring_agent_windows.py http://192.168.1.100:5000 1")
         sys.exit(1)
     
     dashboard_url = sys.argv[1]
     device_id = sys.argv[2]
     api_key = sys.argv[3] if len(sys.argv) > 3 else None
+    batch_size = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    spool_dir = sys.argv[5] if len(sys.argv) > 5 else None
+    report_mode = sys.argv[6] if len(sys.argv) > 6 else 'delta'
+    sample_interval = float(sys.argv[7]) if len(sys.argv) > 7 else 1.0
     
-    agent = WindowsMonitoringAgent(dashboard_url, device_id, api_key)
+    # Collector errors and runtime go through the 'netmon.agent' logger; see agent_collectors.py
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    agent = WindowsMonitoringAgent(dashboard_url, device_id, api_key, batch_size, spool_dir, report_mode, sample_interval)
     agent.run()
@@ -0,0 +1,265 @@
+"""
+Background polling scheduler for agentless devices.
+
+Every device has its own next-due time in a heap. A dispatcher thread hands
+due devices to a bounded worker pool; results land in a cache that HTTP
+handlers read in O(1) instead of polling inside the request.
+
+Intervals adapt per device: an unhealthy result drops the device to
+min_interval, while polls that keep returning similar values back off
+towards max_interval. Hosts that cannot be reached at all are retried
+quickly a few times and then backed off exponentially. Every scheduled
+time gets random jitter so devices added together do not stay in lockstep.
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+STABLE_DELTA = 5.0   # percentage points of cpu/memory movement still considered "stable"
+
+
+class _DeviceState:
+    __slots__ = ('device', 'interval', 'due', 'running', 'last_metrics', 'last_duration', 'failures')
+
+    def __init__(self, device, interval, due):
+        self.device = device
+        self.interval = interval
+        self.due = due
+        self.running = False
+        self.last_metrics = None
+        self.last_duration = None
+        self.failures = 0
+
+
+class FleetPoller:
+    def __init__(self, load_devices, collect, on_result=None, workers=16, interval=30,
+                 min_interval=10, max_interval=120, jitter=0.1, reload_interval=60):
+        self.load_devices = load_devices    # () -> [{'id': ..., ...}, ...]
+        self.collect = collect              # (device) -> metrics dict; raises on failure
+        self.on_result = on_result          # (device_id, metrics, error) called after every poll
+        self.workers = workers
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.reload_interval = reload_interval
+
+        self._states = {}
+        self._results = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(workers)
+        self._executor = None
+        self._thread = None
+        self._running = False
+        self._next_reload = 0.0
+        self._reload_requested = False
+
+        self._durations = deque(maxlen=1000)
+        self._lags = deque(maxlen=1000)
+        self.stats = {'polls': 0, 'failures': 0, 'in_flight': 0, 'max_lag_ms': 0.0}
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='poller')
+        self._thread = threading.Thread(target=self._dispatch, name='poller-dispatch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(5)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def reload(self):
+        """Ask the dispatcher to re-read the device list on its next wakeup"""
+        with self._cond:
+            self._reload_requested = True
+            self._cond.notify()
+
+    def request_poll(self, device_id):
+        """Move a device to the front of the schedule"""
+        with self._cond:
+            state = self._states.get(device_id)
+            if state and not state.running:
+                self._schedule(state, time.monotonic())
+                self._cond.notify()
+
+    def get(self, device_id):
+        """Latest cached result for a device, or None if it has not been polled yet"""
+        return self._results.get(device_id)
+
+    def _jittered(self, seconds):
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, state, due):
+        state.due = due
+        heapq.heappush(self._heap, (due, next(self._seq), state))
+
+    def _apply_devices(self, devices):
+        now = time.monotonic()
+        with self._cond:
+            seen = set()
+            for device in devices:
+                seen.add(device['id'])
+                state = self._states.get(device['id'])
+                if state is None:
+                    # Spread new devices over one interval instead of polling them all at once
+                    state = _DeviceState(device, self.interval, now)
+                    self._states[device['id']] = state
+                    self._schedule(state, now + random.uniform(0, min(self.interval, 5)))
+                else:
+                    state.device = device
+            for device_id in list(self._states):
+                if device_id not in seen:
+                    del self._states[device_id]
+                    self._results.pop(device_id, None)
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                reload_due = self._reload_requested or now >= self._next_reload
+                if not reload_due:
+                    wait = self._next_reload - now
+                    if self._heap:
+                        wait = min(wait, self._heap[0][0] - now)
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+
+            if reload_due:
+                with self._cond:
+                    self._reload_requested = False
+                    self._next_reload = time.monotonic() + self.reload_interval
+                try:
+                    self._apply_devices(self.load_devices())
+                except Exception as e:
+                    print(f"Poller failed to load devices: {e}")
+                continue
+
+            # Block here when every worker is busy; due devices queue up in the heap
+            self._slots.acquire()
+            with self._cond:
+                state = None
+                while self._heap and self._heap[0][0] <= time.monotonic():
+                    due, _, candidate = heapq.heappop(self._heap)
+                    # Skip entries for removed devices and superseded schedule entries
+                    if self._states.get(candidate.device['id']) is candidate and candidate.due == due \
+                            and not candidate.running:
+                        state = candidate
+                        break
+                if state is None:
+                    self._slots.release()
+                    continue
+                state.running = True
+                lag_ms = max(0.0, (time.monotonic() - due) * 1000)
+                self._lags.append(lag_ms)
+                self.stats['max_lag_ms'] = max(self.stats['max_lag_ms'], round(lag_ms, 3))
+                self.stats['in_flight'] += 1
+            self._executor.submit(self._poll, state)
+
+    def _poll(self, state):
+        device_id = state.device['id']
+        started = time.perf_counter()
+        error = None
+        try:
+            metrics = self.collect(state.device)
+        except Exception as e:
+            metrics = None
+            error = str(e)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        healthy = metrics is not None and metrics.get('status') == 'healthy'
+        if error:
+            # Unreachable rather than unhealthy: retry quickly a few times, then back off
+            interval = min(self.min_interval * 2 ** max(0, state.failures - 2), self.max_interval)
+        elif not healthy:
+            interval = self.min_interval
+        elif self._is_stable(state.last_metrics, metrics):
+            interval = min(state.interval * 1.5, self.max_interval)
+        else:
+            interval = self.interval
+
+        result = {
+            'metrics': metrics,
+            'error': error,
+            'polled_at': time.time(),
+            'duration_ms': round(duration_ms, 3),
+            'interval': round(interval, 1),
+        }
+        self._results[device_id] = result
+
+        if self.on_result:
+            try:
+                self.on_result(device_id, metrics, error)
+            except Exception as e:
+                print(f"Poller result handler failed for device {device_id}: {e}")
+
+        with self._cond:
+            state.running = False
+            state.interval = interval
+            state.last_duration = duration_ms
+            state.failures = 0 if healthy else state.failures + 1
+            if metrics is not None:
+                state.last_metrics = metrics
+            self._durations.append(duration_ms)
+            self.stats['polls'] += 1
+            if error:
+                self.stats['failures'] += 1
+            self.stats['in_flight'] -= 1
+            if self._states.get(device_id) is state:
+                self._schedule(state, time.monotonic() + self._jittered(interval))
+            self._cond.notify()
+        self._slots.release()
+
+    @staticmethod
+    def _is_stable(previous, current):
+        if not previous:
+            return False
+        for key in ('cpu_usage', 'memory_usage'):
+            a, b = previous.get(key), current.get(key)
+            if a is None or b is None or abs(a - b) > STABLE_DELTA:
+                return False
+        return True
+
+    def get_stats(self):
+        """Scheduler lag, queue depth and poll duration summary"""
+        now = time.monotonic()
+        with self._cond:
+            stats = dict(self.stats)
+            stats['devices'] = len(self._states)
+            stats['queue_depth'] = sum(1 for s in self._states.values() if not s.running and s.due <= now)
+            durations = sorted(self._durations)
+            lags = sorted(self._lags)
+            per_device = {
+                device_id: {
+                    'interval': round(state.interval, 1),
+                    'last_duration_ms': round(state.last_duration, 3) if state.last_duration is not None else None,
+                    'consecutive_failures': state.failures,
+                    'due_in': round(state.due - now, 1),
+                }
+                for device_id, state in self._states.items()
+            }
+
+        def pct(values, p):
+            return round(values[min(len(values) - 1, int(len(values) * p))], 3) if values else 0.0
+
+        stats['duration_ms'] = {'p50': pct(durations, 0.5), 'p95': pct(durations, 0.95), 'max': pct(durations, 1)}
+        stats['lag_ms'] = {'p50': pct(lags, 0.5), 'p95': pct(lags, 0.95), 'max': pct(lags, 1)}
+        stats['per_device'] = per_device
+        return stats
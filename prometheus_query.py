@@ -0,0 +1,145 @@
+"""
+Cached, coalescing client for Prometheus instant queries.
+
+A set of named PromQL expressions is sent as one /api/v1/query request:
+each expression is tagged with a `netmon_metric` label through
+label_replace and the tagged vectors are joined with `or`, so the answer
+holds one sample per name. Requests go over one pooled requests.Session,
+so connections to Prometheus are reused instead of opened per call.
+
+Answers are cached per expression set for `ttl` seconds. When the cache
+has expired, the first caller starts a refresh on a small thread pool and
+every concurrent caller for the same set waits on that one refresh rather
+than sending its own. Callers holding a cached answer no older than
+`max_stale` wait at most `stale_wait` seconds for the refresh and otherwise
+get the stale answer while the refresh finishes in the background. After a
+failed refresh, the next attempt waits `ttl` seconds, so an outage costs
+one upstream request per `ttl` however many dashboards are open.
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import requests
+from requests.adapters import HTTPAdapter
+
+NAME_LABEL = 'netmon_metric'
+
+
+def combine_queries(queries):
+    """One PromQL expression answering every {name: expression} as a series labelled with its name"""
+    return ' or '.join(f'label_replace({expression}, "{NAME_LABEL}", "{name}", "", "")'
+                       for name, expression in queries.items())
+
+
+class PrometheusError(Exception):
+    pass
+
+
+class PrometheusClient:
+    def __init__(self, url, ttl=5, timeout=3, stale_wait=0.25, max_stale=300, workers=2):
+        self.url = url.rstrip('/')
+        self.ttl = ttl                  # seconds an answer is served without asking Prometheus
+        self.timeout = timeout          # seconds for one upstream request
+        self.stale_wait = stale_wait    # seconds a caller holding a stale answer waits for a refresh
+        self.max_stale = max_stale      # seconds after which a stale answer is no longer served
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='prometheus')
+
+        self._lock = threading.Lock()
+        self._cache = {}                # key -> (monotonic fetched_at, wall fetched_at, values)
+        self._failed = {}               # key -> (monotonic failed_at, exception)
+        self._inflight = {}             # key -> Future of the refresh in progress
+        self.stats = {'requests': 0, 'upstream': 0, 'hits': 0, 'coalesced': 0, 'stale': 0, 'errors': 0,
+                      'last_upstream_ms': 0.0}
+
+    def query(self, queries):
+        """{name: value or None} for {name: expression}, and the wall time the values were fetched"""
+        key = tuple(queries.items())
+        now = time.monotonic()
+        with self._lock:
+            self.stats['requests'] += 1
+            cached = self._cache.get(key)
+            if cached and now - cached[0] < self.ttl:
+                self.stats['hits'] += 1
+                return cached[2], cached[1]
+            usable = cached if cached and now - cached[0] < self.max_stale else None
+
+            failed = self._failed.get(key)
+            if failed and now - failed[0] < self.ttl:
+                if usable:
+                    self.stats['stale'] += 1
+                    return usable[2], usable[1]
+                raise failed[1]
+
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._refresh, key, queries)
+                self._inflight[key] = future
+            else:
+                self.stats['coalesced'] += 1
+
+        try:
+            return future.result(self.stale_wait if usable else self.timeout + 1)
+        except Exception as e:
+            if usable:
+                with self._lock:
+                    self.stats['stale'] += 1
+                return usable[2], usable[1]
+            if isinstance(e, FutureTimeout):
+                raise PrometheusError('Prometheus query timed out') from e
+            raise
+
+    def _refresh(self, key, queries):
+        started = time.monotonic()
+        try:
+            values = self._fetch(queries)
+        except Exception as e:
+            with self._lock:
+                self.stats['errors'] += 1
+                self._failed[key] = (time.monotonic(), e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.stats['last_upstream_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+        fetched_at = time.time()
+        with self._lock:
+            self._cache[key] = (time.monotonic(), fetched_at, values)
+            self._failed.pop(key, None)
+        return values, fetched_at
+
+    def _fetch(self, queries):
+        with self._lock:
+            self.stats['upstream'] += 1
+        try:
+            response = self.session.post(f'{self.url}/api/v1/query', data={'query': combine_queries(queries)},
+                                         timeout=self.timeout)
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise PrometheusError(f'Prometheus query failed: {e}') from e
+        if body.get('status') != 'success':
+            raise PrometheusError(f"Prometheus query failed: {body.get('error', response.status_code)}")
+
+        values = dict.fromkeys(queries)
+        for series in body['data']['result']:
+            name = series['metric'].get(NAME_LABEL)
+            if name in values:
+                value = float(series['value'][1])
+                values[name] = None if math.isnan(value) or math.isinf(value) else value
+        return values
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['cached'] = len(self._cache)
+        stats['inflight'] = len(self._inflight)
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,260 @@
+"""
+Concurrent reachability probing for every enabled device.
+
+One asyncio loop in a background thread probes the whole fleet each cycle.
+Every device gets `probes` probes spaced `probe_gap` apart, all devices in
+parallel, so a dead host costs its own timeouts and never stalls the rest.
+
+Probes are ICMP echoes over an unprivileged ping socket where the kernel
+permits it (see discovery.IcmpPinger), otherwise TCP connects to the
+device's port; a refused connection still proves the host is up. Devices
+that ignore ICMP but answer on TCP are remembered and probed over TCP until
+the remembered set is cleared every `icmp_retry_cycles` cycles.
+
+Probe starts are paced at `launch_rate` per second so that RTTs are not
+inflated by the event loop working through a burst of connects, while
+`max_concurrency` bounds open sockets when many hosts are timing out.
+
+Each cycle stores, per device, the mean RTT, jitter (mean absolute
+difference between consecutive RTTs) and loss ratio, and derives a status:
+critical if every probe was lost, warning on partial loss or slow RTT.
+"""
+
+import asyncio
+import errno
+import ipaddress
+import socket
+import struct
+import threading
+import time
+
+from discovery import IcmpPinger
+
+
+class ReachabilityProber:
+    def __init__(self, load_devices, interval=30, probes=3, probe_gap=0.2, timeout=1.0,
+                 max_concurrency=4096, launch_rate=5000, warning_rtt_ms=200, use_icmp=True,
+                 icmp_retry_cycles=20):
+        self.load_devices = load_devices    # () -> [{'id': ..., 'ip_address': ..., 'port': ...}, ...]
+        self.interval = interval
+        self.probes = probes
+        self.probe_gap = probe_gap
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.launch_rate = launch_rate      # probes started per second across the fleet
+        self.warning_rtt_ms = warning_rtt_ms
+        self.use_icmp = use_icmp
+        self.icmp_retry_cycles = icmp_retry_cycles
+
+        self._results = {}
+        self._icmp_silent = set()
+        self._loop = None
+        self._thread = None
+        self._task = None
+        self._semaphore = None
+        self._next_launch = 0.0
+        self._pinger = None
+        self._lock = threading.Lock()
+        self.stats = {'cycles': 0, 'devices': 0, 'reachable': 0, 'unreachable': 0, 'last_cycle_ms': 0.0,
+                      'max_cycle_ms': 0.0, 'overruns': 0, 'icmp': None}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                if self.use_icmp:
+                    try:
+                        self._pinger = IcmpPinger(self._loop)
+                    except OSError as e:
+                        print(f"ICMP probes disabled, using TCP connect only: {e}")
+                self.stats['icmp'] = self._pinger is not None
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='reachability-loop', daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def start(self):
+        """Probe the fleet every `interval` seconds in the background"""
+        self._ensure_loop()
+        if self._task is None:
+            self._task = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._loop is not None:
+            if self._pinger is not None:
+                self._loop.call_soon_threadsafe(self._pinger.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def run_cycle(self, devices=None):
+        """Probe once, blocking the caller; returns {device_id: result}"""
+        self._ensure_loop()
+        if devices is None:
+            devices = self.load_devices()
+        future = asyncio.run_coroutine_threadsafe(self._cycle(devices), self._loop)
+        future.result()
+        return {device['id']: self._results.get(device['id']) for device in devices}
+
+    def get(self, device_id):
+        """Result of the device's latest cycle, or None if it has not been probed yet"""
+        return self._results.get(device_id)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['icmp_silent'] = len(self._icmp_silent)
+        return stats
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                devices = await loop.run_in_executor(None, self.load_devices)
+                await self._cycle(devices)
+            except Exception as e:
+                print(f"Reachability cycle failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+    async def _cycle(self, devices):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.stats['cycles'] += 1
+        if self.icmp_retry_cycles and self.stats['cycles'] % self.icmp_retry_cycles == 0:
+            self._icmp_silent.clear()
+
+        results = await asyncio.gather(*(self._probe_device(d) for d in devices))
+
+        current = {}
+        for device, result in zip(devices, results):
+            current[device['id']] = result
+        self._results = current
+
+        elapsed_ms = (loop.time() - started) * 1000
+        reachable = sum(1 for r in results if r['status'] != 'critical')
+        self.stats.update({
+            'devices': len(devices),
+            'reachable': reachable,
+            'unreachable': len(devices) - reachable,
+            'last_cycle_ms': round(elapsed_ms, 1),
+            'max_cycle_ms': round(max(self.stats['max_cycle_ms'], elapsed_ms), 1),
+        })
+        if elapsed_ms > self.interval * 1000:
+            self.stats['overruns'] += 1
+
+    async def _probe_device(self, device):
+        device_id = device['id']
+        ip_address = device['ip_address']
+        port = device.get('port') or 22
+
+        if not _is_ipv4(ip_address):
+            # Resolve hostnames once per cycle, off the loop, so probes only ever see addresses
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(ip_address, port, family=socket.AF_INET,
+                                                                      type=socket.SOCK_STREAM)
+                ip_address = infos[0][4][0]
+            except (OSError, IndexError):
+                return self._result([None] * self.probes, 'dns')
+
+        use_icmp = self._pinger is not None and device_id not in self._icmp_silent
+        method = 'icmp' if use_icmp else 'tcp'
+        rtts = []
+        for attempt in range(self.probes):
+            if attempt:
+                await asyncio.sleep(self.probe_gap)
+            rtt = await self._icmp(ip_address) if use_icmp else None
+            if use_icmp and rtt is None and not any(r is not None for r in rtts):
+                # No echo so far: try TCP, and stick with it for this device if that answers
+                rtt = await self._tcp(ip_address, port)
+                if rtt is not None:
+                    use_icmp = False
+                    method = 'tcp'
+                    self._icmp_silent.add(device_id)
+            elif not use_icmp:
+                rtt = await self._tcp(ip_address, port)
+            rtts.append(rtt)
+
+        return self._result(rtts, method)
+
+    def _result(self, rtts, method):
+        answered = [r * 1000 for r in rtts if r is not None]
+        loss = 1 - len(answered) / len(rtts)
+        if answered:
+            rtt_ms = sum(answered) / len(answered)
+            jitter_ms = (sum(abs(b - a) for a, b in zip(answered, answered[1:])) / (len(answered) - 1)
+                         if len(answered) > 1 else 0.0)
+            status = 'warning' if loss > 0 or rtt_ms > self.warning_rtt_ms else 'healthy'
+        else:
+            rtt_ms = jitter_ms = None
+            status = 'critical'
+
+        return {
+            'status': status,
+            'rtt_ms': round(rtt_ms, 2) if rtt_ms is not None else None,
+            'jitter_ms': round(jitter_ms, 2) if jitter_ms is not None else None,
+            'loss': round(loss, 3),
+            'method': method,
+            'checked_at': time.time(),
+        }
+
+    async def _paced(self):
+        # Spread probe starts evenly; a burst of thousands of connects at once backs up the loop
+        # and every RTT measured during the burst would include that queueing delay
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_launch)
+        self._next_launch = slot + 1 / self.launch_rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _icmp(self, ip_address):
+        async with self._semaphore:
+            await self._paced()
+            return await self._pinger.ping(ip_address, self.timeout)
+
+    async def _tcp(self, ip_address, port):
+        """Connect round-trip in seconds; refused counts as an answer, timeouts and unreachable don't"""
+        async with self._semaphore:
+            await self._paced()
+            loop = asyncio.get_running_loop()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            try:
+                started = loop.time()
+                error = sock.connect_ex((ip_address, port))
+                if error == errno.EINPROGRESS:
+                    # A bare writer callback instead of sock_connect + wait_for: no task per probe,
+                    # and the completion time is taken as soon as the loop sees the socket
+                    done = loop.create_future()
+                    loop.add_writer(sock.fileno(), lambda: done.done() or done.set_result(loop.time()))
+                    timer = loop.call_later(self.timeout, lambda: done.done() or done.set_result(None))
+                    try:
+                        finished = await done
+                    finally:
+                        timer.cancel()
+                        loop.remove_writer(sock.fileno())
+                    if finished is None:
+                        return None
+                    error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                else:
+                    finished = loop.time()
+            finally:
+                sock.close()
+            return finished - started if error in (0, errno.ECONNREFUSED) else None
+
+
+def _is_ipv4(value):
+    try:
+        return ipaddress.ip_address(value).version == 4
+    except ValueError:
+        return False
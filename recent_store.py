@@ -0,0 +1,153 @@
+"""
+In-process store for the most recent metric samples of every device.
+
+Each device owns a fixed-size ring: one array('d') of timestamps and one
+array('f') holding `capacity` rows of float32 metric values. Nothing is
+allocated per sample, so memory per device is fixed at
+capacity * (8 + 4 * len(metrics)) bytes plus a small constant overhead.
+
+The store is filled on ingest and answers "latest value" and short-range
+chart queries without touching SQLite.
+"""
+
+import math
+import threading
+import time
+from array import array
+
+NAN = float('nan')
+
+
+class _Ring:
+    __slots__ = ('ts', 'values', 'head', 'count', 'latest', 'latest_ts')
+
+    def __init__(self, capacity, width):
+        self.ts = array('d', bytes(8 * capacity))
+        self.values = array('f', bytes(4 * capacity * width))
+        self.head = 0       # next slot to write
+        self.count = 0
+        self.latest = None  # non-numeric fields of the newest sample
+        self.latest_ts = 0.0
+
+
+class RecentStore:
+    def __init__(self, metrics, capacity=120):
+        self.metrics = tuple(metrics)
+        self.capacity = capacity
+        self.width = len(self.metrics)
+        self.started_at = time.time()
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def record(self, device_id, ts, values, status=None, uptime=None):
+        """Append one sample; values are in self.metrics order, None for missing"""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                ring = self._rings[device_id] = _Ring(self.capacity, self.width)
+
+            slot = ring.head
+            ring.ts[slot] = ts
+            base = slot * self.width
+            for i, value in enumerate(values):
+                ring.values[base + i] = NAN if value is None else value
+            ring.head = (slot + 1) % self.capacity
+            if ring.count < self.capacity:
+                ring.count += 1
+
+            # Also take over if the slot holding the newest sample was just recycled
+            if ts >= ring.latest_ts or (ring.latest and ring.latest[2] == slot):
+                ring.latest_ts = ts
+                ring.latest = (status, uptime, slot)
+
+    def forget(self, device_id):
+        with self._lock:
+            self._rings.pop(device_id, None)
+
+    def device_count(self):
+        return len(self._rings)
+
+    def latest(self, device_id):
+        """Newest sample for a device as a dict, or None"""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None or ring.latest is None:
+                return None
+            status, uptime, slot = ring.latest
+            base = slot * self.width
+            sample = {m: self._clean(ring.values[base + i]) for i, m in enumerate(self.metrics)}
+            sample.update({'status': status, 'uptime': uptime, 'timestamp': ring.latest_ts})
+            return sample
+
+    def latest_all(self):
+        """{device_id: (status, timestamp, response_time)} for every device in the store"""
+        rt_index = self.metrics.index('response_time') if 'response_time' in self.metrics else None
+        with self._lock:
+            result = {}
+            for device_id, ring in self._rings.items():
+                if ring.latest is None:
+                    continue
+                status, _, slot = ring.latest
+                rt = self._clean(ring.values[slot * self.width + rt_index]) if rt_index is not None else None
+                result[device_id] = (status, ring.latest_ts, rt)
+            return result
+
+    def latest_rows(self):
+        """{device_id: (status, timestamp, values)} with values in self.metrics order, NaN where missing"""
+        with self._lock:
+            result = {}
+            for device_id, ring in self._rings.items():
+                if ring.latest is None:
+                    continue
+                status, _, slot = ring.latest
+                base = slot * self.width
+                result[device_id] = (status, ring.latest_ts, ring.values[base:base + self.width])
+            return result
+
+    def covers(self, device_id, start):
+        """True if every sample since `start` is still held in the buffer"""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                return start >= self.started_at
+            if ring.count < self.capacity:
+                return start >= self.started_at
+            return ring.ts[ring.head] <= start
+
+    def query_range(self, device_id, metrics, start, end):
+        """Same shape as RollupEngine.query_range at raw resolution, or None if not covered"""
+        if not self.covers(device_id, start):
+            return None
+
+        columns = [(m, self.metrics.index(m)) for m in metrics if m in self.metrics]
+        series = {m: [] for m in metrics}
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                return series
+            oldest = (ring.head - ring.count) % self.capacity
+            samples = []
+            for n in range(ring.count):
+                slot = (oldest + n) % self.capacity
+                ts = ring.ts[slot]
+                if start <= ts < end:
+                    base = slot * self.width
+                    samples.append((ts, [ring.values[base + i] for _, i in columns]))
+
+        samples.sort(key=lambda s: s[0])
+        for ts, values in samples:
+            for (metric, _), value in zip(columns, values):
+                if not math.isnan(value):
+                    value = round(value, 3)
+                    series[metric].append({'ts': int(ts), 'min': value, 'max': value,
+                                           'avg': value, 'count': 1, 'last': value})
+        return series
+
+    def memory_bytes(self):
+        """Bytes held by the sample arrays"""
+        per_device = self.capacity * (8 + 4 * self.width)
+        return per_device * len(self._rings)
+
+    @staticmethod
+    def _clean(value):
+        return None if math.isnan(value) else round(value, 3)
@@ -0,0 +1,146 @@
+"""
+Single-round-trip metric collection for agentless Linux hosts.
+
+One awk program reads /proc/stat, /proc/meminfo, /proc/loadavg, /proc/uptime
+and /proc/net/dev in a single pass and `stat -f` reports statvfs for the root
+filesystem, so a poll is one channel and two short-lived processes on the
+target. CPU and network rates are derived from counter deltas between
+consecutive polls of the same host; a value that cannot be derived yet is
+reported as None rather than guessed.
+
+Network traffic is reported the way agents report it, as cumulative byte
+counters (network_bytes_recv/sent) and bytes-per-second rates
+(network_recv_rate/sent_rate). network_in and network_out repeat the rates
+in MB/s for the device detail view.
+"""
+
+import threading
+import time
+
+REMOTE_SCRIPT = r'''awk '
+FILENAME == "/proc/stat" && $1 == "cpu" { print "cpu", $2, $3, $4, $5, $6, $7, $8, $9; next }
+FILENAME == "/proc/meminfo" && ($1 == "MemTotal:" || $1 == "MemAvailable:") { print "mem", $1, $2; next }
+FILENAME == "/proc/loadavg" { print "load", $1, $2, $3; next }
+FILENAME == "/proc/uptime" { print "uptime", $1; next }
+FILENAME == "/proc/net/dev" && FNR > 2 { sub(":", " "); if ($1 != "lo") { rx += $2; tx += $10 } }
+END { print "net", rx + 0, tx + 0 }
+' /proc/stat /proc/meminfo /proc/loadavg /proc/uptime /proc/net/dev; stat -f -c 'disk %S %b %f %a' /'''
+
+
+def parse_payload(text):
+    """Turn the remote script's output into raw counters"""
+    raw = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        kind, values = fields[0], fields[1:]
+        try:
+            if kind == 'cpu':
+                raw['cpu'] = tuple(int(v) for v in values)
+            elif kind == 'mem':
+                raw['mem_total' if values[0] == 'MemTotal:' else 'mem_available'] = int(values[1]) * 1024
+            elif kind == 'load':
+                raw['load'] = tuple(float(v) for v in values[:3])
+            elif kind == 'uptime':
+                raw['uptime'] = float(values[0])
+            elif kind == 'net':
+                raw['net'] = (int(float(values[0])), int(float(values[1])))
+            elif kind == 'disk':
+                raw['disk'] = tuple(int(v) for v in values[:4])
+        except (ValueError, IndexError):
+            continue
+    return raw
+
+
+def format_uptime(seconds):
+    days = int(seconds // 86400)
+    hours = int((seconds % 86400) // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{days}d {hours}h {minutes}m"
+
+
+class RemoteCollector:
+    def __init__(self, ssh_pool, timeout=10):
+        self.ssh_pool = ssh_pool
+        self.timeout = timeout
+        self._previous = {}     # (ip, port) -> (monotonic time, cpu counters, net counters)
+        self._lock = threading.Lock()
+
+    def collect(self, ip_address, username, password, ssh_key_path=None, port=22):
+        """Poll one host; raises on connection or command failure"""
+        started = time.perf_counter()
+        status, output, error = self.ssh_pool.exec(ip_address, username, password, REMOTE_SCRIPT,
+                                                   ssh_key_path=ssh_key_path, port=port, timeout=self.timeout)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        raw = parse_payload(output)
+        if 'cpu' not in raw:
+            raise RuntimeError(f"Unexpected collector output (exit {status}): {error.strip()[:200]}")
+        return self.compute(ip_address, port, raw, elapsed_ms)
+
+    def compute(self, ip_address, port, raw, response_time_ms=0, now=None):
+        """Derive dashboard metrics from raw counters and the host's previous poll"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            previous = self._previous.get((ip_address, port))
+            self._previous[(ip_address, port)] = (now, raw.get('cpu'), raw.get('net'))
+
+        metrics = {
+            'cpu_usage': None,
+            'memory_usage': None,
+            'disk_usage': None,
+            'network_in': None,
+            'network_out': None,
+            'network_bytes_recv': None,
+            'network_bytes_sent': None,
+            'network_recv_rate': None,
+            'network_sent_rate': None,
+            'load_average': None,
+            'uptime': None,
+            'response_time': round(response_time_ms),
+            'status': 'healthy',
+        }
+
+        cpu = raw.get('cpu')
+        if cpu and previous and previous[1] and len(previous[1]) == len(cpu):
+            deltas = [max(c - p, 0) for c, p in zip(cpu, previous[1])]
+            total = sum(deltas)
+            idle = deltas[3] + (deltas[4] if len(deltas) > 4 else 0)   # idle + iowait
+            if total > 0:
+                metrics['cpu_usage'] = round((total - idle) / total * 100, 1)
+
+        net = raw.get('net')
+        if net:
+            metrics['network_bytes_recv'], metrics['network_bytes_sent'] = net
+        if net and previous and previous[2]:
+            interval = now - previous[0]
+            if interval > 0:
+                # Counters reset on interface restart; skip that poll instead of reporting a spike
+                rx, tx = net[0] - previous[2][0], net[1] - previous[2][1]
+                if rx >= 0 and tx >= 0:
+                    metrics['network_recv_rate'] = round(rx / interval, 1)
+                    metrics['network_sent_rate'] = round(tx / interval, 1)
+                    metrics['network_in'] = round(rx / interval / 1048576, 3)
+                    metrics['network_out'] = round(tx / interval / 1048576, 3)
+
+        if raw.get('mem_total'):
+            available = raw.get('mem_available', 0)
+            metrics['memory_usage'] = round((raw['mem_total'] - available) / raw['mem_total'] * 100, 1)
+
+        disk = raw.get('disk')
+        if disk:
+            _, blocks, free, avail = disk
+            used = blocks - free
+            if used + avail > 0:
+                metrics['disk_usage'] = round(used / (used + avail) * 100, 1)
+
+        if 'load' in raw:
+            metrics['load_average'] = round(raw['load'][0], 2)
+        if 'uptime' in raw:
+            metrics['uptime'] = format_uptime(raw['uptime'])
+
+        return metrics
+
+    def forget(self, ip_address, port=22):
+        with self._lock:
+            self._previous.pop((ip_address, port), None)
@@ -0,0 +1,502 @@
+"""
+Fleet-wide node_exporter rollout.
+
+A rollout is a job row plus one row per target host in SQLite, so progress
+survives restarts and can be read back through the API at any time. Hosts
+are installed by a bounded worker pool fed from a due-time heap, the same
+way the poller schedules devices; failed attempts go back on the heap with
+exponential backoff, while authentication failures and a failing install
+script are final.
+
+Each host costs one SSH connection: a version check, an SFTP upload of the
+node_exporter archive, and one shell script that unpacks it, installs the
+binary and the systemd unit and verifies the result. The archive is
+downloaded once into a local cache rather than fetched by every host, and
+a host that already runs the wanted version is left alone.
+"""
+
+import hashlib
+import heapq
+import itertools
+import os
+import random
+import shlex
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+import requests
+
+NODE_EXPORTER_VERSION = '1.6.1'
+NODE_EXPORTER_URL = ('https://github.com/prometheus/node_exporter/releases/download/'
+                     'v{version}/node_exporter-{version}.linux-amd64.tar.gz')
+
+ACTIVE = ('queued', 'running', 'retrying')
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS rollout_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        component TEXT NOT NULL,
+        version TEXT NOT NULL,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollout_hosts (
+        job_id INTEGER NOT NULL,
+        device_id INTEGER NOT NULL,
+        ip_address TEXT,
+        status TEXT NOT NULL,
+        stage TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        result TEXT,
+        updated_at REAL,
+        PRIMARY KEY (job_id, device_id),
+        FOREIGN KEY (job_id) REFERENCES rollout_jobs (id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_rollout_hosts_status ON rollout_hosts (status)',
+]
+
+# Prints the installed version, if any
+CHECK_SCRIPT = '''
+BIN="$ROOT/usr/local/bin/node_exporter"
+[ -x "$BIN" ] && "$BIN" --version 2>&1 | head -n 1
+true
+'''
+
+# Everything after the upload, in one round trip
+INSTALL_SCRIPT = '''
+set -e
+BIN="$ROOT/usr/local/bin/node_exporter"
+UNIT="$ROOT/etc/systemd/system/node_exporter.service"
+WORK=$(mktemp -d)
+trap 'rm -rf "$WORK"' EXIT
+tar xzf "$ARCHIVE" -C "$WORK"
+$SUDO mkdir -p "$(dirname "$BIN")" "$(dirname "$UNIT")"
+$SUDO install -m 0755 "$WORK/node_exporter-$VERSION.linux-amd64/node_exporter" "$BIN"
+rm -f "$ARCHIVE"
+$SUDO tee "$UNIT" > /dev/null <<'EOF'
+[Unit]
+Description=Node Exporter
+Wants=network-online.target
+After=network-online.target
+
+[Service]
+User=node_exporter
+Group=node_exporter
+Type=simple
+ExecStart=/usr/local/bin/node_exporter
+
+[Install]
+WantedBy=multi-user.target
+EOF
+if [ -z "$ROOT" ]; then
+    $SUDO useradd --no-create-home --shell /bin/false node_exporter 2>/dev/null || true
+    $SUDO chown node_exporter:node_exporter "$BIN"
+    if [ -d /run/systemd/system ]; then
+        $SUDO systemctl daemon-reload
+        $SUDO systemctl enable node_exporter
+        $SUDO systemctl restart node_exporter
+    fi
+fi
+"$BIN" --version 2>&1 | head -n 1
+'''
+
+
+class PermanentError(Exception):
+    """A host failure that retrying will not fix"""
+
+
+class ArtifactCache:
+    """Downloads release archives once and serves them from a local directory"""
+
+    def __init__(self, directory='artifacts', version=NODE_EXPORTER_VERSION, url=NODE_EXPORTER_URL,
+                 sha256=None, timeout=60):
+        self.directory = directory
+        self.version = version
+        self.url = url.format(version=version)
+        self.sha256 = sha256
+        self.timeout = timeout
+        self.filename = f'node_exporter-{version}.linux-amd64.tar.gz'
+        self._lock = threading.Lock()
+        self.stats = {'downloads': 0, 'download_bytes': 0}
+
+    def path(self):
+        """Local path of the archive, downloading it on first use"""
+        path = os.path.join(self.directory, self.filename)
+        with self._lock:
+            if os.path.exists(path):
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            partial = path + '.part'
+            digest = hashlib.sha256()
+            with requests.get(self.url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                with open(partial, 'wb') as f:
+                    for chunk in response.iter_content(1 << 20):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        self.stats['download_bytes'] += len(chunk)
+            if self.sha256 and digest.hexdigest() != self.sha256:
+                os.remove(partial)
+                raise PermanentError(f"Checksum mismatch for {self.url}")
+            os.replace(partial, path)
+            self.stats['downloads'] += 1
+            return path
+
+
+class _HostTask:
+    __slots__ = ('job_id', 'device_id', 'attempts')
+
+    def __init__(self, job_id, device_id, attempts=0):
+        self.job_id = job_id
+        self.device_id = device_id
+        self.attempts = attempts
+
+
+class RolloutManager:
+    def __init__(self, database, load_devices, on_installed=None, artifacts=None, workers=16, max_attempts=3,
+                 retry_delay=5, max_retry_delay=120, connect_timeout=15, command_timeout=300, root=''):
+        self.database = database
+        self.load_devices = load_devices    # ([device_id]) -> [{'id', 'ip_address', 'port', 'username', ...}]
+        self.on_installed = on_installed    # (device_id) called after a host succeeds
+        self.artifacts = artifacts or ArtifactCache()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        # Install prefix on the target, '' for a real install. Device fields are
+        # substituted ('{id}'), which lets a test harness give every host its own tree.
+        self.root = root
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(workers)
+        self._executor = None
+        self._thread = None
+        self._running = False
+        self._active = {}                   # device_id -> job_id of its queued or running install
+        self._pending = {}                  # job_id -> hosts not finished yet
+        self._cancelled = set()
+        self.stats = {'jobs': 0, 'installed': 0, 'already_installed': 0, 'failed': 0, 'retries': 0,
+                      'uploads': 0, 'uploads_skipped': 0, 'in_flight': 0}
+
+    def init_schema(self, conn):
+        """Create rollout tables on the given connection"""
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+    def start(self):
+        """Start the dispatcher and resume hosts left unfinished by a previous run"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='rollout')
+        self._resume()
+        self._thread = threading.Thread(target=self._dispatch, name='rollout-dispatch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(5)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _resume(self):
+        now = time.time()
+        with self.database.writer() as conn:
+            conn.execute(f'''
+                UPDATE rollout_hosts SET status = 'queued', updated_at = ?
+                WHERE status IN ({','.join('?' * len(ACTIVE))})
+            ''', (now,) + ACTIVE)
+            rows = conn.execute(
+                "SELECT job_id, device_id, attempts FROM rollout_hosts WHERE status = 'queued'").fetchall()
+        with self._cond:
+            for job_id, device_id, attempts in rows:
+                self._active[device_id] = job_id
+                self._pending[job_id] = self._pending.get(job_id, 0) + 1
+                self._schedule(_HostTask(job_id, device_id, attempts), time.monotonic())
+        if rows:
+            print(f"Resuming {len(rows)} unfinished agent installs")
+
+    def create(self, device_ids):
+        """Queue an install on every device; returns the job id"""
+        self.start()
+        device_ids = list(dict.fromkeys(device_ids))
+        devices = {device['id']: device for device in self.load_devices(device_ids)}
+        now = time.time()
+        with self._cond:
+            hosts = []
+            for device_id in device_ids:
+                device = devices.get(device_id)
+                ip_address = device['ip_address'] if device else None
+                if device is None:
+                    hosts.append((device_id, ip_address, 'failed', 'Device not found'))
+                elif device_id in self._active:
+                    hosts.append((device_id, ip_address, 'skipped',
+                                  f"Already being installed by rollout {self._active[device_id]}"))
+                else:
+                    hosts.append((device_id, ip_address, 'queued', None))
+
+            queued = [host[0] for host in hosts if host[2] == 'queued']
+            if queued:
+                status = 'running'
+            else:
+                status = 'failed' if any(host[2] == 'failed' for host in hosts) else 'skipped'
+            with self.database.writer() as conn:
+                job_id = conn.execute('''
+                    INSERT INTO rollout_jobs (component, version, status, total, created_at, finished_at)
+                    VALUES ('node_exporter', ?, ?, ?, ?, ?)
+                ''', (self.artifacts.version, status, len(hosts), now,
+                      None if queued else now)).lastrowid
+                conn.executemany('''
+                    INSERT INTO rollout_hosts (job_id, device_id, ip_address, status, error, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(job_id, device_id, ip_address, status, error, now)
+                      for device_id, ip_address, status, error in hosts])
+
+            self.stats['jobs'] += 1
+            if queued:
+                self._pending[job_id] = len(queued)
+                start = time.monotonic()
+                for device_id in queued:
+                    self._active[device_id] = job_id
+                    self._schedule(_HostTask(job_id, device_id), start)
+                self._cond.notify()
+        return job_id
+
+    def cancel(self, job_id):
+        """Stop queued hosts of a job; installs already running finish their current attempt"""
+        with self.database.writer() as conn:
+            found = conn.execute('SELECT 1 FROM rollout_jobs WHERE id = ?', (job_id,)).fetchone()
+            if not found:
+                return False
+            conn.execute("""
+                UPDATE rollout_hosts SET status = 'cancelled', updated_at = ?
+                WHERE job_id = ? AND status IN ('queued', 'retrying')
+            """, (time.time(), job_id))
+        with self._cond:
+            if job_id in self._pending:
+                self._cancelled.add(job_id)
+        return True
+
+    def get(self, job_id):
+        """Job summary plus per-host progress, or None if the job does not exist"""
+        with self.database.reader() as conn:
+            job = conn.execute('''
+                SELECT id, component, version, status, total, created_at, finished_at
+                FROM rollout_jobs WHERE id = ?
+            ''', (job_id,)).fetchone()
+            if job is None:
+                return None
+            hosts = conn.execute('''
+                SELECT device_id, ip_address, status, stage, attempts, error, result, updated_at
+                FROM rollout_hosts WHERE job_id = ? ORDER BY device_id
+            ''', (job_id,)).fetchall()
+        result = self._job_dict(job)
+        result['hosts'] = [
+            {'device_id': row[0], 'ip_address': row[1], 'status': row[2], 'stage': row[3], 'attempts': row[4],
+             'error': row[5], 'result': row[6], 'updated_at': row[7]}
+            for row in hosts
+        ]
+        counts = {}
+        for host in result['hosts']:
+            counts[host['status']] = counts.get(host['status'], 0) + 1
+        result['counts'] = counts
+        return result
+
+    def list_jobs(self, limit=20):
+        rows = self.database.query('''
+            SELECT id, component, version, status, total, created_at, finished_at
+            FROM rollout_jobs ORDER BY id DESC LIMIT ?
+        ''', (limit,))
+        return [self._job_dict(row) for row in rows]
+
+    @staticmethod
+    def _job_dict(row):
+        return {'job_id': row[0], 'component': row[1], 'version': row[2], 'status': row[3], 'total': row[4],
+                'created_at': row[5], 'finished_at': row[6]}
+
+    def _schedule(self, task, due):
+        heapq.heappush(self._heap, (due, next(self._seq), task))
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if not self._running:
+                    return
+
+            # Block here when every worker is busy; due hosts queue up in the heap
+            self._slots.acquire()
+            with self._cond:
+                if not self._heap or self._heap[0][0] > time.monotonic():
+                    self._slots.release()
+                    continue
+                _, _, task = heapq.heappop(self._heap)
+                self.stats['in_flight'] += 1
+            self._executor.submit(self._run, task)
+
+    def _update(self, task, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        self.database.execute(f'UPDATE rollout_hosts SET {columns} WHERE job_id = ? AND device_id = ?',
+                              tuple(fields.values()) + (task.job_id, task.device_id))
+
+    def _run(self, task):
+        retry_at = None
+        try:
+            if task.job_id in self._cancelled:
+                self._finish(task, 'cancelled')
+                return
+            task.attempts += 1
+            self._update(task, status='running', stage='connect', attempts=task.attempts, error=None)
+            try:
+                devices = self.load_devices([task.device_id])
+                if not devices:
+                    raise PermanentError('Device not found')
+                result, installed = self._install(task, devices[0])
+            except (PermanentError, paramiko.AuthenticationException) as e:
+                self._finish(task, 'failed', error=str(e) or type(e).__name__)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if task.attempts >= self.max_attempts or task.job_id in self._cancelled:
+                    self._finish(task, 'failed', error=error)
+                else:
+                    delay = min(self.retry_delay * 2 ** (task.attempts - 1), self.max_retry_delay)
+                    delay *= random.uniform(0.8, 1.2)
+                    self._update(task, status='retrying', error=error)
+                    self.stats['retries'] += 1
+                    retry_at = time.monotonic() + delay
+            else:
+                self._finish(task, 'succeeded', result=result)
+                self.stats['installed' if installed else 'already_installed'] += 1
+                if self.on_installed:
+                    try:
+                        self.on_installed(task.device_id)
+                    except Exception as e:
+                        print(f"Rollout callback failed for device {task.device_id}: {e}")
+        except Exception as e:
+            print(f"Rollout bookkeeping failed for device {task.device_id}: {e}")
+        finally:
+            with self._cond:
+                self.stats['in_flight'] -= 1
+                if retry_at is not None:
+                    self._schedule(task, retry_at)
+                    self._cond.notify()
+            self._slots.release()
+
+    def _finish(self, task, status, error=None, result=None):
+        if status == 'failed':
+            self.stats['failed'] += 1
+            print(f"Agent install on device {task.device_id} failed: {error}")
+        self._update(task, status=status, error=error, result=result)
+        with self._cond:
+            if self._active.get(task.device_id) == task.job_id:
+                del self._active[task.device_id]
+            remaining = self._pending[task.job_id] = self._pending.get(task.job_id, 1) - 1
+            if remaining > 0:
+                return
+            del self._pending[task.job_id]
+            cancelled = task.job_id in self._cancelled
+            self._cancelled.discard(task.job_id)
+        with self.database.writer() as conn:
+            failed = conn.execute("SELECT COUNT(*) FROM rollout_hosts WHERE job_id = ? AND status = 'failed'",
+                                  (task.job_id,)).fetchone()[0]
+            status = 'cancelled' if cancelled else 'failed' if failed else 'succeeded'
+            conn.execute('UPDATE rollout_jobs SET status = ?, finished_at = ? WHERE id = ?',
+                         (status, time.time(), task.job_id))
+
+    def _connect(self, device):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        options = dict(port=device.get('port') or 22, username=device['username'], timeout=self.connect_timeout,
+                       banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout)
+        if device.get('ssh_key_path') and os.path.exists(device['ssh_key_path']):
+            options['key_filename'] = device['ssh_key_path']
+        else:
+            options['password'] = device.get('password')
+        try:
+            client.connect(device['ip_address'], **options)
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    def _exec(self, client, script, env):
+        command = ' '.join(f'{name}={shlex.quote(value)}' for name, value in env.items())
+        command += ' sh -c ' + shlex.quote(script)
+        stdin, stdout, stderr = client.exec_command(command, timeout=self.command_timeout)
+        out = stdout.read().decode(errors='replace')
+        err = stderr.read().decode(errors='replace')
+        return stdout.channel.recv_exit_status(), out, err
+
+    def _install(self, task, device):
+        """Install on one host; returns (version line, whether anything was installed)"""
+        if not device.get('username'):
+            raise PermanentError('No SSH username configured')
+        archive = self.artifacts.path()
+        root = self.root.format(**device)
+        env = {
+            'ROOT': root,
+            'VERSION': self.artifacts.version,
+            'ARCHIVE': f'{root}/tmp/{self.artifacts.filename}',
+            'SUDO': '' if device['username'] == 'root' else 'sudo -n',
+        }
+
+        client = self._connect(device)
+        try:
+            self._update(task, stage='check')
+            status, out, err = self._exec(client, CHECK_SCRIPT, env)
+            if f'version {self.artifacts.version} ' in out:
+                return out.strip(), False
+
+            self._update(task, stage='upload')
+            sftp = client.open_sftp()
+            try:
+                size = os.path.getsize(archive)
+                try:
+                    uploaded = sftp.stat(env['ARCHIVE']).st_size == size
+                except IOError:
+                    uploaded = False
+                if uploaded:
+                    self.stats['uploads_skipped'] += 1
+                else:
+                    sftp.put(archive, env['ARCHIVE'])
+                    self.stats['uploads'] += 1
+            finally:
+                sftp.close()
+
+            self._update(task, stage='install')
+            status, out, err = self._exec(client, INSTALL_SCRIPT, env)
+            if status != 0:
+                raise PermanentError(f"Install script exited with {status}: {err.strip()[-300:]}")
+            return out.strip(), True
+        except socket.timeout:
+            raise RuntimeError(f"Timed out after {self.command_timeout}s")
+        finally:
+            client.close()
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats['queued'] = len(self._heap)
+            stats['active_jobs'] = len(self._pending)
+        stats['artifact'] = dict(self.artifacts.stats, filename=self.artifacts.filename)
+        return stats
@@ -0,0 +1,286 @@
+"""
+Background rollups and retention for device metrics history.
+
+Raw samples in device_metrics are folded into 1-minute, 5-minute and 1-hour
+aggregates (min, max, sum/avg, count and last value) per device and metric.
+The engine works incrementally from a watermark on the history rowid, so each
+pass only reads samples that arrived since the previous one. Late samples are
+merged into whatever buckets they belong to.
+
+Retention is applied per resolution in small chunks so expiry never holds
+the writer lock long enough to stall ingest.
+"""
+
+import threading
+import time
+
+RAW = 0
+RESOLUTIONS = (60, 300, 3600)
+# network_in/out are cumulative byte counters, where min/avg/max mean nothing; their rates are
+# rolled up instead
+ROLLUP_METRICS = ('cpu_usage', 'memory_usage', 'disk_usage', 'response_time', 'load_average',
+                  'network_in_rate', 'network_out_rate')
+
+DAY = 86400
+DEFAULT_RETENTION = {
+    RAW: 2 * DAY,
+    60: 7 * DAY,
+    300: 30 * DAY,
+    3600: 365 * DAY,
+}
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS metric_rollups (
+        resolution INTEGER NOT NULL,
+        device_id INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        min_value REAL,
+        max_value REAL,
+        sum_value REAL,
+        count INTEGER NOT NULL,
+        last_value REAL,
+        last_ts INTEGER,
+        UNIQUE (resolution, device_id, metric, bucket)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_metric_rollups_expiry ON metric_rollups (resolution, bucket)',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''',
+]
+
+MERGE_ROLLUP_SQL = '''
+    INSERT INTO metric_rollups
+    (resolution, device_id, metric, bucket, min_value, max_value, sum_value, count, last_value, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (resolution, device_id, metric, bucket) DO UPDATE SET
+        min_value = MIN(min_value, excluded.min_value),
+        max_value = MAX(max_value, excluded.max_value),
+        sum_value = sum_value + excluded.sum_value,
+        count = count + excluded.count,
+        last_value = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_value ELSE last_value END,
+        last_ts = MAX(last_ts, excluded.last_ts)
+'''
+
+
+class RollupEngine:
+    def __init__(self, database, interval=60, chunk_size=20000, delete_chunk=5000, retention=None):
+        self.database = database
+        self.interval = interval            # seconds between passes
+        self.chunk_size = chunk_size        # raw rows folded per transaction
+        self.delete_chunk = delete_chunk    # rows expired per transaction
+        self.retention = dict(DEFAULT_RETENTION)
+        if retention:
+            self.retention.update(retention)
+
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'passes': 0, 'rows_rolled': 0, 'rows_expired': 0,
+                      'last_pass_ms': 0.0, 'watermark': 0}
+
+    def init_schema(self, conn):
+        """Create rollup tables on the given connection"""
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+    def start(self):
+        """Run passes every interval seconds on a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='rollup-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Rollup pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def run_once(self, now=None):
+        """Fold new raw samples into every resolution, then apply retention"""
+        started = time.perf_counter()
+        now = int(now if now is not None else time.time())
+
+        rolled = 0
+        while not self._stop.is_set():
+            count = self._rollup_chunk()
+            rolled += count
+            if count < self.chunk_size:
+                break
+
+        expired = self._expire(now)
+
+        self.stats['passes'] += 1
+        self.stats['rows_rolled'] += rolled
+        self.stats['rows_expired'] += expired
+        self.stats['last_pass_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return rolled, expired
+
+    def _get_watermark(self, conn):
+        row = conn.execute("SELECT value FROM rollup_state WHERE name = 'raw_watermark'").fetchone()
+        return row[0] if row else 0
+
+    def _rollup_chunk(self):
+        with self.database.reader() as conn:
+            watermark = self._get_watermark(conn)
+            rows = conn.execute(f'''
+                SELECT id, device_id, CAST(strftime('%s', last_seen) AS INTEGER), {', '.join(ROLLUP_METRICS)}
+                FROM device_metrics
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (watermark, self.chunk_size)).fetchall()
+
+        if not rows:
+            return 0
+
+        # Aggregate in memory first so each bucket costs one upsert per chunk
+        buckets = {}
+        for row in rows:
+            device_id, ts = row[1], row[2]
+            if ts is None:
+                continue
+            for metric, value in zip(ROLLUP_METRICS, row[3:]):
+                if value is None:
+                    continue
+                for resolution in RESOLUTIONS:
+                    key = (resolution, device_id, metric, ts - ts % resolution)
+                    agg = buckets.get(key)
+                    if agg is None:
+                        buckets[key] = [value, value, value, 1, value, ts]
+                    else:
+                        if value < agg[0]:
+                            agg[0] = value
+                        if value > agg[1]:
+                            agg[1] = value
+                        agg[2] += value
+                        agg[3] += 1
+                        if ts >= agg[5]:
+                            agg[4] = value
+                            agg[5] = ts
+
+        with self.database.writer() as conn:
+            conn.executemany(MERGE_ROLLUP_SQL, [key + tuple(agg) for key, agg in buckets.items()])
+            self._set_watermark(conn, rows[-1][0])
+        return len(rows)
+
+    def _set_watermark(self, conn, watermark):
+        conn.execute('''
+            INSERT INTO rollup_state (name, value) VALUES ('raw_watermark', ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        ''', (watermark,))
+        self.stats['watermark'] = watermark
+
+    def _expire(self, now):
+        expired = 0
+
+        # Raw rows are only dropped once they have been rolled up. Walk them by rowid in ranges of
+        # delete_chunk ids instead of scanning for last_seen, up to the watermark: rows that are not
+        # due yet (a sample stamped in the future, say) are stepped over rather than ending the walk
+        cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - self.retention[RAW]))
+        with self.database.reader() as conn:
+            position = (conn.execute('SELECT MIN(id) FROM device_metrics').fetchone()[0] or 1) - 1
+        while not self._stop.is_set():
+            with self.database.writer() as conn:
+                watermark = self._get_watermark(conn)
+                if position >= watermark:
+                    break
+                end = min(position + self.delete_chunk, watermark)
+                cursor = conn.execute('''
+                    DELETE FROM device_metrics WHERE id > ? AND id <= ? AND last_seen < ?
+                ''', (position, end, cutoff))
+                # device_metrics has no AUTOINCREMENT, so SQLite hands out MAX(id) + 1 again once
+                # the highest rows are gone; pull the watermark down in the same transaction so
+                # rows that reuse those ids are still rolled up
+                top = conn.execute('SELECT MAX(id) FROM device_metrics').fetchone()[0] or 0
+                if top < watermark:
+                    self._set_watermark(conn, top)
+            expired += cursor.rowcount
+            position = end
+
+        for resolution in RESOLUTIONS:
+            cutoff_bucket = now - self.retention[resolution]
+            while not self._stop.is_set():
+                with self.database.writer() as conn:
+                    cursor = conn.execute('''
+                        DELETE FROM metric_rollups WHERE rowid IN (
+                            SELECT rowid FROM metric_rollups
+                            WHERE resolution = ? AND bucket < ?
+                            LIMIT ?
+                        )
+                    ''', (resolution, cutoff_bucket, self.delete_chunk))
+                expired += cursor.rowcount
+                if cursor.rowcount < self.delete_chunk:
+                    break
+
+        return expired
+
+    def choose_resolution(self, start, end, max_points=None, now=None):
+        """Pick the coarsest resolution that still covers the window at the requested detail"""
+        now = int(now if now is not None else time.time())
+        step = (end - start) / max_points if max_points else 0
+
+        # Finest to coarsest: raw samples, then each rollup level
+        candidates = [RAW] + list(RESOLUTIONS)
+        covering = [r for r in candidates if start >= now - self.retention[r]]
+        if not covering:
+            return RESOLUTIONS[-1]
+
+        best = covering[0]
+        for resolution in covering:
+            if resolution <= step:
+                best = resolution
+        return best
+
+    def query_range(self, device_id, metrics, start, end, max_points=None, resolution=None):
+        """Return {metric: [{ts, min, max, avg, count, last}, ...]} for [start, end) in epoch seconds"""
+        if resolution is None:
+            resolution = self.choose_resolution(start, end, max_points)
+
+        series = {metric: [] for metric in metrics}
+        with self.database.reader() as conn:
+            if resolution == RAW:
+                columns = ', '.join(m for m in metrics if m in ROLLUP_METRICS)
+                if not columns:
+                    return resolution, series
+                names = columns.split(', ')
+                rows = conn.execute(f'''
+                    SELECT CAST(strftime('%s', last_seen) AS INTEGER), {columns}
+                    FROM device_metrics
+                    WHERE device_id = ?
+                      AND last_seen >= datetime(?, 'unixepoch') AND last_seen < datetime(?, 'unixepoch')
+                    ORDER BY last_seen
+                ''', (device_id, start, end))
+                for row in rows:
+                    for metric, value in zip(names, row[1:]):
+                        if value is not None:
+                            series[metric].append({'ts': row[0], 'min': value, 'max': value,
+                                                   'avg': value, 'count': 1, 'last': value})
+            else:
+                for metric in metrics:
+                    rows = conn.execute('''
+                        SELECT bucket, min_value, max_value, sum_value, count, last_value
+                        FROM metric_rollups
+                        WHERE resolution = ? AND device_id = ? AND metric = ?
+                          AND bucket >= ? AND bucket < ?
+                        ORDER BY bucket
+                    ''', (resolution, device_id, metric, start - start % resolution, end))
+                    series[metric] = [
+                        {'ts': bucket, 'min': lo, 'max': hi, 'avg': total / count if count else None,
+                         'count': count, 'last': last}
+                        for bucket, lo, hi, total, count, last in rows
+                    ]
+        return resolution, series
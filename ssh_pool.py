@@ -0,0 +1,169 @@
+"""
+Pool of long-lived SSH connections for agentless VM polling.
+
+One authenticated paramiko transport is kept per (host, port, username) and
+reused across polls, so a poll costs one channel open instead of a full TCP
+connect, key exchange and authentication. Transports send keepalives, are
+closed after sitting idle, and are transparently re-established when a
+command fails because the connection died underneath it. A per-host
+semaphore caps how many channels run against one host at once.
+"""
+
+import os
+import socket
+import threading
+import time
+
+import paramiko
+
+
+class _PooledHost:
+    __slots__ = ('client', 'lock', 'channels', 'last_used', 'in_use')
+
+    def __init__(self, max_channels):
+        self.client = None
+        self.lock = threading.Lock()                       # serializes (re)connects
+        self.channels = threading.BoundedSemaphore(max_channels)
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+class SSHPool:
+    def __init__(self, max_channels_per_host=2, idle_timeout=300, keepalive=30, connect_timeout=10):
+        self.max_channels_per_host = max_channels_per_host
+        self.idle_timeout = idle_timeout          # seconds before an unused transport is closed
+        self.keepalive = keepalive                # seconds between transport keepalives
+        self.connect_timeout = connect_timeout
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._janitor = None
+        self.stats = {'connects': 0, 'reconnects': 0, 'evictions': 0, 'commands': 0, 'failures': 0}
+
+    def _checkout(self, key):
+        # in_use is raised under the pool lock so eviction never drops a host mid-checkout
+        with self._lock:
+            entry = self._hosts.get(key)
+            if entry is None:
+                entry = self._hosts[key] = _PooledHost(self.max_channels_per_host)
+            entry.in_use += 1
+            if self._janitor is None:
+                self._janitor = threading.Thread(target=self._evict_loop, name='ssh-pool-janitor', daemon=True)
+                self._janitor.start()
+            return entry
+
+    def _checkin(self, entry):
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    def _connect(self, entry, ip_address, port, username, password, ssh_key_path):
+        with entry.lock:
+            transport = entry.client.get_transport() if entry.client else None
+            if transport is not None and transport.is_active():
+                return entry.client
+
+            if entry.client is not None:
+                entry.client.close()
+                self.stats['reconnects'] += 1
+
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                if ssh_key_path and os.path.exists(ssh_key_path):
+                    client.connect(ip_address, port=port, username=username, key_filename=ssh_key_path,
+                                   timeout=self.connect_timeout, banner_timeout=self.connect_timeout,
+                                   auth_timeout=self.connect_timeout)
+                else:
+                    client.connect(ip_address, port=port, username=username, password=password,
+                                   timeout=self.connect_timeout, banner_timeout=self.connect_timeout,
+                                   auth_timeout=self.connect_timeout)
+            except Exception:
+                client.close()
+                entry.client = None
+                raise
+
+            transport = client.get_transport()
+            transport.set_keepalive(self.keepalive)
+            # Polls are tiny request/response exchanges; don't let Nagle hold them back
+            transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            entry.client = client
+            self.stats['connects'] += 1
+            return client
+
+    def _drop(self, entry):
+        with entry.lock:
+            if entry.client is not None:
+                entry.client.close()
+                entry.client = None
+
+    def exec(self, ip_address, username, password, command, ssh_key_path=None, port=22, timeout=10):
+        """Run a command over a pooled connection and return (exit_status, stdout, stderr)"""
+        entry = self._checkout((ip_address, port, username))
+        if not entry.channels.acquire(timeout=timeout):
+            self._checkin(entry)
+            raise TimeoutError(f"Too many concurrent SSH channels to {ip_address}")
+        try:
+            for attempt in range(2):
+                client = self._connect(entry, ip_address, port, username, password, ssh_key_path)
+                try:
+                    stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+                    out = stdout.read()
+                    err = stderr.read()
+                    status = stdout.channel.recv_exit_status()
+                except socket.timeout:
+                    # The command was slow, the transport is still fine
+                    self.stats['failures'] += 1
+                    raise
+                except (paramiko.SSHException, EOFError, OSError):
+                    # Dead transport: reconnect once and retry on a fresh channel
+                    self._drop(entry)
+                    if attempt:
+                        self.stats['failures'] += 1
+                        raise
+                    self.stats['reconnects'] += 1
+                    continue
+
+                self.stats['commands'] += 1
+                return status, out.decode(errors='replace'), err.decode(errors='replace')
+        finally:
+            entry.channels.release()
+            self._checkin(entry)
+
+    def evict_idle(self):
+        """Close transports that have not been used for idle_timeout seconds"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [(key, entry) for key, entry in self._hosts.items()
+                    if entry.in_use == 0 and entry.last_used < cutoff]
+            for key, _ in idle:
+                del self._hosts[key]
+        for _, entry in idle:
+            if entry.client is not None:
+                self.stats['evictions'] += 1
+            self._drop(entry)
+        return len(idle)
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 1))
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"SSH pool eviction failed: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            hosts = list(self._hosts.values())
+        stats = dict(self.stats)
+        stats['hosts'] = len(hosts)
+        stats['connected'] = sum(1 for entry in hosts if entry.client is not None)
+        stats['channels_in_use'] = sum(entry.in_use for entry in hosts)
+        return stats
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._hosts.values())
+            self._hosts.clear()
+        for entry in entries:
+            self._drop(entry)
@@ -0,0 +1,180 @@
+"""
+Cached VirtualBox VM inventory.
+
+A refresh costs two cheap listings (`list vms`, `list runningvms`) plus
+per-VM `showvminfo` / `guestproperty get` calls for only those VMs that are
+new, changed between running and stopped, are running without a known IP
+yet, or have not been re-read for `detail_ttl` seconds. The per-VM calls
+run in parallel on a bounded thread pool.
+
+Readers always get the cached inventory immediately; a refresh is started
+in the background when the cache is older than `ttl` seconds or when a
+caller forces one. Only one refresh runs at a time.
+"""
+
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LIST_LINE = re.compile(r'^"(?P<name>.*)" \{(?P<uuid>[0-9a-fA-F-]+)\}$')
+IP_PROPERTY = '/VirtualBox/GuestInfo/Net/0/V4/IP'
+
+
+def parse_vm_list(output):
+    """[(name, uuid)] from `VBoxManage list vms` / `list runningvms`"""
+    vms = []
+    for line in output.splitlines():
+        match = LIST_LINE.match(line.strip())
+        if match:
+            vms.append((match.group('name'), match.group('uuid')))
+    return vms
+
+
+def parse_machinereadable(output):
+    info = {}
+    for line in output.splitlines():
+        if '=' in line:
+            key, value = line.split('=', 1)
+            info[key.strip('"')] = value.strip('"')
+    return info
+
+
+class VBoxInventory:
+    def __init__(self, vboxmanage='VBoxManage', workers=8, ttl=30, detail_ttl=600, list_timeout=30,
+                 info_timeout=30, property_timeout=10):
+        self.vboxmanage = vboxmanage
+        self.ttl = ttl                      # seconds before a read triggers a background refresh
+        self.detail_ttl = detail_ttl        # seconds before an unchanged VM is re-read anyway
+        self.list_timeout = list_timeout
+        self.info_timeout = info_timeout
+        self.property_timeout = property_timeout
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='vbox')
+
+        self._vms = {}                      # uuid -> (running, fetched_at, vm dict)
+        self._updated_at = None
+        self._error = None
+        self._lock = threading.Lock()
+        self._refreshing = None             # threading.Event of the refresh in progress
+        self.stats = {'refreshes': 0, 'queried': 0, 'reused': 0, 'errors': 0, 'last_refresh_ms': 0.0}
+
+    def _run(self, args, timeout):
+        result = subprocess.run([self.vboxmanage] + args, capture_output=True, text=True, timeout=timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"VBoxManage {' '.join(args[:2])} failed: {result.stderr.strip()[:200]}")
+        return result.stdout
+
+    def get(self, force=False):
+        """Cached inventory, starting a background refresh if it is stale or forced"""
+        with self._lock:
+            stale = self._updated_at is None or time.time() - self._updated_at > self.ttl
+            vms = [entry[2] for entry in self._vms.values()]
+            updated_at = self._updated_at
+            error = self._error
+        if force or stale:
+            self.refresh_async()
+        vms.sort(key=lambda vm: vm['vm_name'].lower())
+        return {
+            'vms': vms,
+            'updated_at': updated_at,
+            'refreshing': self.refreshing(),
+            'error': error,
+        }
+
+    def refreshing(self):
+        return self._refreshing is not None
+
+    def refresh_async(self):
+        """Start a refresh unless one is already running; returns its completion event"""
+        with self._lock:
+            if self._refreshing is not None:
+                return self._refreshing
+            done = self._refreshing = threading.Event()
+        threading.Thread(target=self._refresh, args=(done,), name='vbox-refresh', daemon=True).start()
+        return done
+
+    def refresh(self, timeout=None):
+        """Refresh and wait for it to finish"""
+        return self.refresh_async().wait(timeout)
+
+    def _refresh(self, done):
+        started = time.perf_counter()
+        try:
+            listed = parse_vm_list(self._run(['list', 'vms'], self.list_timeout))
+            running = {uuid for _, uuid in parse_vm_list(self._run(['list', 'runningvms'], self.list_timeout))}
+
+            now = time.time()
+            with self._lock:
+                cached = dict(self._vms)
+            stale = []
+            fresh = {}
+            for name, uuid in listed:
+                is_running = uuid in running
+                entry = cached.get(uuid)
+                if (entry is None or entry[0] != is_running or now - entry[1] > self.detail_ttl
+                        or (is_running and not entry[2]['ip_address'])):
+                    stale.append((name, uuid, is_running))
+                else:
+                    fresh[uuid] = entry
+
+            for (name, uuid, is_running), vm in zip(stale, self._executor.map(lambda args: self._query(*args), stale)):
+                if vm is not None:
+                    fresh[uuid] = (is_running, now, vm)
+                elif uuid in cached:
+                    fresh[uuid] = cached[uuid]
+
+            with self._lock:
+                self._vms = fresh
+                self._updated_at = time.time()
+                self._error = None
+            self.stats['queried'] += len(stale)
+            self.stats['reused'] += len(listed) - len(stale)
+        except (subprocess.TimeoutExpired, RuntimeError, OSError) as e:
+            print(f"Error discovering VirtualBox VMs: {e}")
+            with self._lock:
+                self._error = str(e)
+                self._updated_at = time.time()
+            self.stats['errors'] += 1
+        finally:
+            self.stats['refreshes'] += 1
+            self.stats['last_refresh_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            with self._lock:
+                self._refreshing = None
+            done.set()
+
+    def _query(self, name, uuid, is_running):
+        """Full details for one VM; None if VBoxManage failed for it"""
+        try:
+            vm_info = parse_machinereadable(
+                self._run(['showvminfo', uuid, '--machinereadable'], self.info_timeout))
+            ip_address = None
+            if is_running:
+                output = self._run(['guestproperty', 'get', uuid, IP_PROPERTY], self.property_timeout)
+                if 'Value:' in output:
+                    ip_address = output.split('Value: ')[1].strip()
+        except (subprocess.TimeoutExpired, RuntimeError, OSError) as e:
+            print(f"Error reading VirtualBox VM {name}: {e}")
+            self.stats['errors'] += 1
+            return None
+
+        return {
+            'vm_id': uuid,
+            'vm_name': name,
+            'status': vm_info.get('VMState', 'unknown'),
+            'os_type': vm_info.get('ostype', 'unknown'),
+            'memory': vm_info.get('memory', '0'),
+            'cpus': vm_info.get('cpus', '1'),
+            'ip_address': ip_address,
+            'description': f"{vm_info.get('ostype', 'Unknown OS')} VM with {vm_info.get('memory', '0')}MB RAM"
+        }
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['vms'] = len(self._vms)
+        stats['refreshing'] = self.refreshing()
+        stats['updated_at'] = self._updated_at
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)